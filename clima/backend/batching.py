@@ -0,0 +1,125 @@
+import asyncio
+import logging
+import time
+import numpy as np
+import pandas as pd
+from typing import List, Dict, Any
+from .models import ModelCache, MODOS
+
+class ModelsNotReady(RuntimeError):
+    pass
+
+class PredictBatcher:
+    def __init__(self, models: ModelCache, max_batch_size: int = 256, max_wait: float = 0.005):
+        self.models = models
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.logger = logging.getLogger(__name__)
+        self.queue = None
+        self.task = None
+
+        self.batches = 0
+        self.requests = 0
+        self.rows = 0
+        self.predict_time_total = 0.0
+        self.predict_time_max = 0.0
+
+    async def start(self):
+        if self.task is None:
+            self.queue = asyncio.Queue()
+            self.task = asyncio.create_task(self.run())
+        return self
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+        while self.queue is not None and not self.queue.empty():
+            _, future = self.queue.get_nowait()
+            if not future.done():
+                future.cancel()
+
+    async def predict(self, items: List[Dict[str, Any]]) -> Dict[str, Any]:
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((items, future))
+        return await future
+
+    async def collect(self):
+        batch = [await self.queue.get()]
+        tamanho = len(batch[0][0])
+        prazo = time.monotonic() + self.max_wait
+        while tamanho < self.max_batch_size:
+            restante = prazo - time.monotonic()
+            if restante <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(self.queue.get(), restante)
+            except asyncio.TimeoutError:
+                break
+            batch.append(item)
+            tamanho += len(item[0])
+        return batch
+
+    def infer(self, batch) -> List[Dict[str, Any]]:
+        modelos = self.models.modelos
+        if not modelos.ready():
+            raise ModelsNotReady('Models not loaded yet')
+        colunas = modelos.boosters[MODOS[0]].feature_names
+        linhas = [linha for items, _ in batch for linha in items]
+        X = pd.DataFrame.from_records(linhas, columns = colunas).astype(np.float32)
+        preds = modelos.predict(X if colunas else X.to_numpy())
+
+        resultados = []
+        inicio = 0
+        for items, _ in batch:
+            fim = inicio + len(items)
+            resultados.append({
+                **{modo: preds[modo][inicio:fim].tolist() for modo in MODOS},
+                'run_ids': modelos.run_ids,
+            })
+            inicio = fim
+        return resultados
+
+    async def run(self):
+        while True:
+            batch = await self.collect()
+            batch = [(items, future) for items, future in batch if not future.done()]
+            if not batch:
+                continue
+            start = time.monotonic()
+            try:
+                resultados = await asyncio.to_thread(self.infer, batch)
+            except Exception as e:
+                if not isinstance(e, ModelsNotReady):
+                    self.logger.error(f'Error predicting a batch of {len(batch)} requests: {e}')
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            elapsed = time.monotonic() - start
+            self.batches += 1
+            self.requests += len(batch)
+            self.rows += sum(len(items) for items, _ in batch)
+            self.predict_time_total += elapsed
+            self.predict_time_max = max(self.predict_time_max, elapsed)
+            for (_, future), resultado in zip(batch, resultados):
+                if not future.done():
+                    future.set_result(resultado)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': 1000 * self.max_wait,
+            'batches': self.batches,
+            'requests': self.requests,
+            'rows': self.rows,
+            'requests_per_batch': self.requests / self.batches if self.batches else 0.0,
+            'rows_per_batch': self.rows / self.batches if self.batches else 0.0,
+            'predict_ms_avg': 1000 * self.predict_time_total / self.batches if self.batches else 0.0,
+            'predict_ms_max': 1000 * self.predict_time_max,
+            'queued': self.queue.qsize() if self.queue is not None else 0,
+        }
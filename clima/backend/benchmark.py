@@ -0,0 +1,51 @@
+import argparse
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List
+from .client.async_db_handler import AsyncDBHandler
+from .client.db_handler import DBHandler
+from .client.config import DB, POOL
+
+CLIENTES = [1, 10, 100]
+THREADS = 40
+
+async def run_clients(clientes: int, requisicoes: int, chamada) -> float:
+    async def cliente():
+        for _ in range(requisicoes):
+            await chamada()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(cliente() for _ in range(clientes)))
+    return clientes * requisicoes / (time.perf_counter() - start)
+
+async def benchmark(requisicoes: int, consulta: Dict[str, Any], clientes: List[int] = CLIENTES):
+    sync_handler = DBHandler(DB, pool_config = POOL)
+    async_handler = await AsyncDBHandler(DB, pool_config = POOL).open(bootstrap = False)
+    executor = ThreadPoolExecutor(max_workers = THREADS)
+    loop = asyncio.get_running_loop()
+
+    async def sync_call():
+        await loop.run_in_executor(executor, lambda: sync_handler.get_data(**consulta))
+
+    async def async_call():
+        await async_handler.get_data(**consulta)
+
+    print(f"{'clientes':>8} {'sync req/s':>12} {'async req/s':>12}")
+    try:
+        for total in clientes:
+            sync_rps = await run_clients(total, requisicoes, sync_call)
+            async_rps = await run_clients(total, requisicoes, async_call)
+            print(f'{total:>8} {sync_rps:>12.1f} {async_rps:>12.1f}')
+    finally:
+        executor.shutdown()
+        sync_handler.pool.close()
+        await async_handler.close()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Compare the sync and async DB handlers under concurrent clients')
+    parser.add_argument('--requisicoes', type = int, default = 50, help = 'requests per client')
+    parser.add_argument('--estacao', default = 'SBRF')
+    parser.add_argument('--limit', type = int, default = 100)
+    args = parser.parse_args()
+    asyncio.run(benchmark(args.requisicoes, {'table': 'metar', 'restriction': {'estacao': args.estacao}, 'limit': args.limit}))
@@ -0,0 +1,122 @@
+import hashlib
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
+
+PREFIX = 'clima:get'
+
+class MemoryBackend:
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.versions = {}
+
+    async def get(self, key: str) -> Optional[bytes]:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        expira, value = entry
+        if expira < time.monotonic():
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: bytes, ttl: float):
+        self.entries[key] = (time.monotonic() + ttl, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last = False)
+
+    async def version(self, table: str) -> int:
+        return self.versions.get(table, 0)
+
+    async def bump(self, table: str) -> int:
+        self.versions[table] = self.versions.get(table, 0) + 1
+        prefixo = f'{PREFIX}:{table}:'
+        for key in [key for key in self.entries if key.startswith(prefixo)]:
+            del self.entries[key]
+        return self.versions[table]
+
+class RedisBackend:
+    def __init__(self, client = None, url: Optional[str] = None):
+        if client is None:
+            import redis.asyncio as redis
+            client = redis.from_url(url)
+        self.client = client
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await self.client.get(key)
+
+    async def set(self, key: str, value: bytes, ttl: float):
+        await self.client.set(key, value, ex = max(int(ttl), 1))
+
+    async def version(self, table: str) -> int:
+        return int(await self.client.get(f'{PREFIX}:versao:{table}') or 0)
+
+    async def bump(self, table: str) -> int:
+        return int(await self.client.incr(f'{PREFIX}:versao:{table}'))
+
+def pack(media: str, etag: str, body: bytes) -> bytes:
+    return f'{media}\n{etag}\n'.encode('utf-8') + body
+
+def unpack(value: bytes) -> Tuple[str, str, bytes]:
+    media, etag, body = value.split(b'\n', 2)
+    return media.decode('utf-8'), etag.decode('utf-8'), body
+
+def normalize(query: Dict[str, Any]) -> str:
+    return json.dumps(query, sort_keys = True, default = str, separators = (',', ':'))
+
+class ResponseCache:
+    def __init__(self, backend = None, ttl: float = 300.0):
+        self.backend = backend or MemoryBackend()
+        self.ttl = ttl
+        self.logger = logging.getLogger(__name__)
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    async def key(self, table: str, query: Dict[str, Any], media: str) -> str:
+        digest = hashlib.sha256(f'{media}|{normalize(query)}'.encode('utf-8')).hexdigest()
+        return f'{PREFIX}:{table}:{await self.backend.version(table)}:{digest}'
+
+    async def get(self, key: str) -> Optional[Tuple[str, str, bytes]]:
+        try:
+            value = await self.backend.get(key)
+        except Exception as e:
+            self.errors += 1
+            self.logger.warning(f'Cache backend read failed: {e}')
+            return None
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return unpack(value)
+
+    async def set(self, key: str, media: str, body: bytes) -> Tuple[str, str, bytes]:
+        etag = f'"{hashlib.blake2b(body, digest_size = 16).hexdigest()}"'
+        try:
+            await self.backend.set(key, pack(media, etag, body), self.ttl)
+        except Exception as e:
+            self.errors += 1
+            self.logger.warning(f'Cache backend write failed: {e}')
+        return media, etag, body
+
+    async def invalidate(self, *tables: str):
+        for table in tables:
+            try:
+                await self.backend.bump(table)
+            except Exception as e:
+                self.errors += 1
+                self.logger.warning(f'Cache invalidation of {table} failed: {e}')
+
+    def stats(self) -> Dict[str, Any]:
+        return {'hits': self.hits, 'misses': self.misses, 'errors': self.errors, 'ttl': self.ttl}
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidatos = [candidato.strip() for candidato in if_none_match.split(',')]
+    return '*' in candidatos or etag in candidatos or f'W/{etag}' in candidatos
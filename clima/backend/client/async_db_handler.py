@@ -0,0 +1,253 @@
+import asyncio
+import asyncpg
+import io
+import logging
+import time
+import pandas as pd
+from contextlib import asynccontextmanager
+from typing import List, Dict, Any, Optional
+from .bulk import copy_lines, frame_csv
+from .daily import DailyFeatureSQL
+from .db_handler import DBHandler
+from .partitions import PartitionBuilder
+from .query import QueryBuilder, CONFLICT_KEYS, CONDICOES, quote_columns
+from .rollup import RollupBuilder
+
+def connect_kwargs(config: Dict[str, str]) -> Dict[str, Any]:
+    kwargs = {'database' if chave == 'dbname' else chave: valor for chave, valor in config.items()}
+    if 'port' in kwargs:
+        kwargs['port'] = int(kwargs['port'])
+    return kwargs
+
+class UpsertSkipped(RuntimeError):
+    pass
+
+class AsyncDBHandler:
+    def __init__(self, config: Dict[str, str], dbname: str = 'clima', schema: str = 'clima_schema',
+                 pool_config: Optional[Dict[str, Any]] = None, compute_daily: bool = True, copy_chunk_size: int = 1 << 16):
+        self.config = config
+        self.dbname = dbname
+        self.schema = schema
+        self.pool_config = pool_config or {}
+        self.compute_daily = compute_daily
+        self.copy_chunk_size = copy_chunk_size
+        self.logger = logging.getLogger(__name__)
+        self.conflict_keys = dict(CONFLICT_KEYS)
+        self.query_builder = QueryBuilder(schema, paramstyle = 'numeric')
+        self.rollups = RollupBuilder(schema, paramstyle = 'numeric')
+        self.daily = DailyFeatureSQL(schema, paramstyle = 'numeric')
+        self.partition_builder = PartitionBuilder(schema)
+        self.partitions = set()
+        self.dtypes = {}
+        self.pool = None
+
+        self.checkouts = 0
+        self.timeouts = 0
+        self.checkout_time_total = 0.0
+        self.checkout_time_max = 0.0
+
+    async def open(self, bootstrap: bool = True):
+        if bootstrap:
+            handler = await asyncio.to_thread(
+                DBHandler, self.config, self.dbname, self.schema, {'minconn': 1, 'maxconn': 2}, compute_daily = self.compute_daily
+            )
+            self.partitions = set(handler.partitions)
+            self.dtypes = handler.dtypes
+            handler.pool.close()
+        self.pool = await asyncpg.create_pool(
+            min_size = self.pool_config.get('minconn', 2),
+            max_size = self.pool_config.get('maxconn', 20),
+            max_inactive_connection_lifetime = self.pool_config.get('health_check_interval', 30.0) * 10,
+            **connect_kwargs(self.config)
+        )
+        self.logger.info(f'Async pool opened for {self.dbname}')
+        return self
+
+    async def close(self):
+        if self.pool is not None:
+            await self.pool.close()
+            self.pool = None
+
+    @asynccontextmanager
+    async def connection(self):
+        start = time.monotonic()
+        try:
+            connection = await self.pool.acquire(timeout = self.pool_config.get('timeout', 30.0))
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise
+        elapsed = time.monotonic() - start
+        self.checkouts += 1
+        self.checkout_time_total += elapsed
+        self.checkout_time_max = max(self.checkout_time_max, elapsed)
+        try:
+            yield connection
+        finally:
+            await self.pool.release(connection)
+
+    def pool_stats(self) -> Dict[str, Any]:
+        return {
+            'minconn': self.pool.get_min_size(),
+            'maxconn': self.pool.get_max_size(),
+            'size': self.pool.get_size(),
+            'idle': self.pool.get_idle_size(),
+            'in_use': self.pool.get_size() - self.pool.get_idle_size(),
+            'checkouts': self.checkouts,
+            'timeouts': self.timeouts,
+            'checkout_ms_avg': 1000 * self.checkout_time_total / self.checkouts if self.checkouts else 0.0,
+            'checkout_ms_max': 1000 * self.checkout_time_max,
+        }
+
+    def to_frame(self, rows: List[Any], columns: List[str], table: str, dtypes: Optional[Dict[str, str]] = None) -> pd.DataFrame:
+        data = pd.DataFrame.from_records([tuple(row) for row in rows], columns = columns)
+        hints = {column: dtype for column, dtype in {**self.dtypes.get(table, {}), **(dtypes or {})}.items() if column in data.columns}
+        return data.astype(hints) if hints else data
+
+    async def fetch(self, query: str, params: List[Any]):
+        async with self.connection() as connection:
+            rows = await connection.fetch(query, *params)
+            if rows:
+                return rows, list(rows[0].keys())
+            statement = await connection.prepare(query)
+            return rows, [attribute.name for attribute in statement.get_attributes()]
+
+    async def get_data(self, table: str = 'metar', columns: List[str] = None, restriction: Dict[str, Any] = None,
+                       dtypes: Optional[Dict[str, str]] = None, order_by: Optional[List[str]] = None, limit: Optional[int] = None,
+                       granularity: Optional[str] = None):
+        if granularity is not None and table == 'metar':
+            return await self.get_aggregate(granularity, restriction, order_by, limit)
+        try:
+            self.logger.info(f'Getting data from {columns} from {table}')
+            query, params = self.query_builder.select(table, columns, restriction, order_by, limit)
+            rows, columns = await self.fetch(query, params)
+            self.logger.info(f'Got {len(rows)} rows from {table}')
+            return self.to_frame(rows, columns, table, dtypes)
+        except Exception as e:
+            self.logger.error(f'Error getting data from {table}: {e}')
+            return None
+
+    async def get_aggregate(self, granularity: str = 'dia', restriction: Dict[str, Any] = None,
+                            order_by: Optional[List[str]] = None, limit: Optional[int] = None):
+        try:
+            query, params, source = self.rollups.aggregate(granularity, restriction, order_by, limit)
+            self.logger.info(f'Aggregating metar by {granularity} from {source}')
+            rows, columns = await self.fetch(query, params)
+            self.logger.info(f'Got {len(rows)} aggregated rows from {source}')
+            dtypes = {column: 'Int64' if column.endswith('_count') else 'float64' for column in columns[2:]}
+            return self.to_frame(rows, columns, 'metar_agregado', dtypes)
+        except Exception as e:
+            self.logger.error(f'Error aggregating metar by {granularity}: {e}')
+            return None
+
+    async def ensure_partitions(self, connection, meses) -> None:
+        for ano, mes in sorted(set(meses) - self.partitions):
+            if await connection.fetchval(self.partition_builder.exists(ano, mes)) is None:
+                for statement in self.partition_builder.create(ano, mes):
+                    await connection.execute(statement)
+                self.logger.info(f'Partition {self.partition_builder.name(ano, mes)} created')
+            self.partitions.add((ano, mes))
+
+    async def refresh_rollups(self, connection, table: str, columns: List[str], values: List[List[Any]]):
+        if table != 'metar' or not values or not {'estacao', 'observed_at'}.issubset(columns):
+            return
+        await self.refresh_affected(connection, self.rollups.affected(columns, values))
+
+    async def refresh_affected(self, connection, affected):
+        estacoes_dia, dias, estacoes_mes, meses = affected
+        await connection.execute(self.rollups.refresh_daily(), estacoes_dia, dias)
+        await connection.execute(self.rollups.refresh_monthly(), estacoes_mes, meses)
+        if self.compute_daily:
+            for desde, grupo in self.daily.starts(estacoes_dia, dias):
+                await connection.execute(self.daily.refresh(), *self.daily.params(grupo, desde))
+
+    async def merge_stage(self, connection, table: str, stage: str, columns: List[str]):
+        keys = self.conflict_keys.get(table)
+        status = await connection.execute(self.query_builder.merge(table, stage, columns, keys))
+        if table not in CONDICOES or not keys or not set(keys).issubset(columns):
+            return
+        enviadas = await connection.fetchval(f'SELECT count(*) FROM (SELECT DISTINCT {quote_columns(keys)} FROM {stage}) AS chaves')
+        gravadas = int(status.split()[-1])
+        if gravadas < enviadas:
+            raise UpsertSkipped(f'{enviadas - gravadas} of {enviadas} rows @ {table} conflict with the stored rows and were not merged')
+
+    async def copy_upsert(self, connection, table: str, columns: List[str], values: List[List[Any]]):
+        stage = f'stage_{table}'
+        await connection.execute(f'DROP TABLE IF EXISTS {stage}')
+        await connection.execute(
+            f"CREATE TEMP TABLE {stage} ON COMMIT DROP AS SELECT {quote_columns(columns)} FROM {self.schema}.{table} WITH NO DATA"
+        )
+
+        async def source():
+            chunk = []
+            size = 0
+            for line in copy_lines(values):
+                chunk.append(line)
+                size += len(line)
+                if size >= self.copy_chunk_size:
+                    yield ''.join(chunk).encode('utf-8')
+                    chunk, size = [], 0
+            if chunk:
+                yield ''.join(chunk).encode('utf-8')
+
+        await connection.copy_to_table(stage, source = source(), columns = columns, format = 'text')
+        await self.merge_stage(connection, table, stage, columns)
+
+    async def upsert_multiple_data(self, table: str = None, columns: List[str] = [], values: List[List[Any]] = []):
+        if table is None or columns is None or values is None:
+            self.logger.error('Invalid arguments')
+            return False
+
+        columns = list(columns)
+        values = [[value.get(column) for column in columns] if isinstance(value, dict) else value for value in values]
+        self.logger.info(f'Trying to upsert @ {table} with {columns} of {len(values)} rows using copy')
+        try:
+            async with self.connection() as connection:
+                async with connection.transaction():
+                    if table == 'metar' and 'observed_at' in columns and values:
+                        await self.ensure_partitions(connection, self.partition_builder.months(columns, values))
+                    await self.copy_upsert(connection, table, columns, values)
+                    await self.refresh_rollups(connection, table, columns, values)
+            self.logger.info(f'Upsert done @ {table} of {len(values)} rows')
+            return True
+        except UpsertSkipped as e:
+            self.partitions.clear()
+            self.logger.error(f'Upsert rolled back @ {table}: {e}')
+            raise
+        except Exception as e:
+            self.partitions.clear()
+            self.logger.error(f'Error trying to upsert @ {table} with {columns} of {len(values)} rows: {e}')
+            return False
+
+    async def upsert_data(self, table = None, columns: List[str] = [], value = None):
+        if value is None:
+            return False
+        return await self.upsert_multiple_data(table, columns, [value])
+
+    async def upsert_frame(self, table: str, df: pd.DataFrame):
+        columns = [str(column) for column in df.columns]
+        chaves = table == 'metar' and {'estacao', 'observed_at'}.issubset(columns) and not df.empty
+        self.logger.info(f'Trying to upsert @ {table} with {columns} of {len(df)} rows from columns')
+        try:
+            stage = f'stage_{table}'
+            async with self.connection() as connection:
+                async with connection.transaction():
+                    if chaves:
+                        await self.ensure_partitions(connection, self.partition_builder.months_of(df['observed_at']))
+                    await connection.execute(f'DROP TABLE IF EXISTS {stage}')
+                    await connection.execute(
+                        f"CREATE TEMP TABLE {stage} ON COMMIT DROP AS SELECT {quote_columns(columns)} FROM {self.schema}.{table} WITH NO DATA"
+                    )
+                    await connection.copy_to_table(stage, source = io.BytesIO(frame_csv(df)), columns = columns, format = 'csv')
+                    await self.merge_stage(connection, table, stage, columns)
+                    if chaves:
+                        await self.refresh_affected(connection, self.rollups.affected_keys(df['estacao'], df['observed_at']))
+            self.logger.info(f'Upsert done @ {table} of {len(df)} rows')
+            return True
+        except UpsertSkipped as e:
+            self.partitions.clear()
+            self.logger.error(f'Upsert rolled back @ {table}: {e}')
+            raise
+        except Exception as e:
+            self.partitions.clear()
+            self.logger.error(f'Error trying to upsert @ {table} with {columns} of {len(df)} rows: {e}')
+            return False
@@ -0,0 +1,56 @@
+import io
+import math
+import pandas as pd
+from typing import Iterable, Iterator, List, Any, Optional
+
+COPY_NULL = '\\N'
+ESCAPES = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'})
+
+def copy_escape(value: Any) -> str:
+    if value is None:
+        return COPY_NULL
+    if isinstance(value, float) and math.isnan(value):
+        return COPY_NULL
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, (list, tuple)):
+        return '{' + ','.join('NULL' if item is None else str(item) for item in value) + '}'
+    return str(value).translate(ESCAPES)
+
+def copy_lines(rows: Iterable[List[Any]]) -> Iterator[str]:
+    for row in rows:
+        yield '\t'.join(copy_escape(value) for value in row) + '\n'
+
+class RowStream(io.RawIOBase):
+    def __init__(self, rows: Iterable[List[Any]]):
+        self.lines = copy_lines(rows)
+        self.buffer = b''
+        self.rows = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def read(self, size: Optional[int] = -1) -> bytes:
+        while size is None or size < 0 or len(self.buffer) < size:
+            line = next(self.lines, None)
+            if line is None:
+                break
+            self.buffer += line.encode('utf-8')
+            self.rows += 1
+        if size is None or size < 0:
+            size = len(self.buffer)
+        chunk, self.buffer = self.buffer[:size], self.buffer[size:]
+        return chunk
+
+def dedupe_last(rows: List[List[Any]], positions: List[int]) -> List[List[Any]]:
+    if not positions:
+        return rows
+    unicos = {}
+    for row in rows:
+        unicos[tuple(row[position] for position in positions)] = row
+    return list(unicos.values())
+
+def frame_csv(df: pd.DataFrame) -> bytes:
+    buffer = io.StringIO()
+    df.to_csv(buffer, header = False, index = False, na_rep = '')
+    return buffer.getvalue().encode('utf-8')
@@ -4,4 +4,29 @@ DB = {
     'host': 'localhost',
     'port': '5432',
     'password': '123'
-}
\ No newline at end of file
+}
+
+POOL = {
+    'minconn': 2,
+    'maxconn': 20,
+    'health_check_interval': 30.0,
+    'timeout': 30.0
+}
+
+CACHE = {
+    'ttl': 300.0,
+    'maxsize': 1024,
+    'url': None
+}
+
+MODELS = {
+    'experiment': 'clima',
+    'tracking_uri': None,
+    'poll_interval': 30.0,
+    'pinned': {'max': None, 'min': None}
+}
+
+PREDICT = {
+    'max_batch_size': 256,
+    'max_wait': 0.005
+}
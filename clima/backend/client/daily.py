@@ -0,0 +1,127 @@
+from datetime import date, datetime, time, timedelta, timezone
+from typing import List, Dict, Any, Tuple, Union
+
+COLUNAS = ['temperatura', 'umidade', 'vento_int', 'visibilidade', 'vento_dir_seno', 'vento_dir_cosseno', 'pressao']
+WINDOW = 24
+PARAMETROS = ['estacoes', 'desde']
+
+class DailyFeatureSQL:
+    def __init__(self, schema: str, colunas: List[str] = COLUNAS, window: int = WINDOW, paramstyle: str = 'pyformat'):
+        self.schema = schema
+        self.colunas = colunas
+        self.window = window
+        self.paramstyle = paramstyle
+
+    def placeholder(self, nome: str) -> str:
+        if self.paramstyle == 'numeric':
+            return f'${PARAMETROS.index(nome) + 1}'
+        return f'%({nome})s'
+
+    def params(self, estacoes: List[str], desde: datetime) -> Union[Dict[str, Any], List[Any]]:
+        if self.paramstyle == 'numeric':
+            return [estacoes, desde]
+        return {'estacoes': estacoes, 'desde': desde}
+
+    def feature_names(self) -> List[str]:
+        nomes = []
+        for coluna in self.colunas:
+            nomes.extend([f'{coluna}_media_dia', f'{coluna}_std_dia', f'{coluna}_min_dia', f'{coluna}_max_dia', f'{coluna}_lag_dia'])
+        return nomes
+
+    def output_columns(self) -> List[str]:
+        return ['estacao', 'dia'] + self.feature_names() + ['target_max', 'target_min']
+
+    def starts(self, estacoes: List[str], dias: List[date]) -> List[Tuple[datetime, List[str]]]:
+        desde = {}
+        for estacao, dia in zip(estacoes, dias):
+            desde[estacao] = min(desde.get(estacao, dia), dia)
+        grupos = []
+        for inicio in sorted(set(desde.values())):
+            anterior = datetime.combine(inicio - timedelta(days = 1), time(), tzinfo = timezone.utc)
+            grupos.append((anterior, [estacao for estacao, dia in desde.items() if dia == inicio]))
+        return grupos
+
+    def create_table(self) -> str:
+        campos = ',\n'.join(f'{nome} FLOAT' for nome in self.feature_names() + ['target_max', 'target_min'])
+        return f'''
+        CREATE TABLE IF NOT EXISTS {self.schema}.daily_etl (
+            estacao VARCHAR(4) NOT NULL,
+            dia DATE NOT NULL,
+            {campos},
+            PRIMARY KEY (estacao, dia)
+        )
+        '''
+
+    def window_expressions(self) -> List[str]:
+        expressoes = []
+        for coluna in self.colunas:
+            completo = f'count({coluna}) OVER janela = {self.window}'
+            expressoes.extend([
+                f'CASE WHEN {completo} THEN avg({coluna}) OVER janela END AS {coluna}_media_dia',
+                f'CASE WHEN {completo} THEN stddev_samp({coluna}) OVER janela END AS {coluna}_std_dia',
+                f'CASE WHEN {completo} THEN min({coluna}) OVER janela END AS {coluna}_min_dia',
+                f'CASE WHEN {completo} THEN max({coluna}) OVER janela END AS {coluna}_max_dia',
+                f'lag({coluna}, {self.window}) OVER ordem AS {coluna}_lag_dia',
+            ])
+        return expressoes
+
+    def select(self, incremental: bool = False, estacoes: bool = False) -> str:
+        colunas = ', '.join(self.colunas)
+        if incremental:
+            base = f'''
+            limites AS (
+                SELECT alvo.estacao, coalesce((
+                    SELECT anterior.observed_at FROM {self.schema}.metar anterior
+                    WHERE anterior.estacao = alvo.estacao AND anterior.observed_at < {self.placeholder('desde')}
+                    ORDER BY anterior.observed_at DESC
+                    OFFSET {self.window - 1} LIMIT 1
+                ), '-infinity') AS inicio
+                FROM unnest({self.placeholder('estacoes')}::varchar[]) AS alvo(estacao)
+            ),
+            base AS (
+                SELECT m.estacao, m.observed_at, {', '.join(f'm.{coluna}' for coluna in self.colunas)}
+                FROM {self.schema}.metar m
+                JOIN limites ON m.estacao = limites.estacao AND m.observed_at >= limites.inicio
+            ),'''
+            filtro = f"AND j.observed_at >= {self.placeholder('desde')}"
+        else:
+            where = f"WHERE estacao = ANY({self.placeholder('estacoes')})" if estacoes else ''
+            base = f'''
+            base AS (
+                SELECT estacao, observed_at, {colunas} FROM {self.schema}.metar {where}
+            ),'''
+            filtro = ''
+
+        return f'''
+        WITH {base}
+        janelas AS (
+            SELECT estacao, observed_at, {', '.join(self.window_expressions())}
+            FROM base
+            WINDOW
+                janela AS (PARTITION BY estacao ORDER BY observed_at ROWS BETWEEN {self.window - 1} PRECEDING AND CURRENT ROW),
+                ordem AS (PARTITION BY estacao ORDER BY observed_at)
+        ),
+        alvos AS (
+            SELECT
+                estacao, periodo AS dia,
+                lead(temperatura_max) OVER proximo AS target_max,
+                lead(temperatura_min) OVER proximo AS target_min
+            FROM {self.schema}.metar_daily
+            WINDOW proximo AS (PARTITION BY estacao ORDER BY periodo)
+        )
+        SELECT j.estacao, (j.observed_at AT TIME ZONE 'UTC')::date AS dia, {', '.join(f'j.{nome}' for nome in self.feature_names())},
+            alvos.target_max, alvos.target_min
+        FROM janelas j
+        LEFT JOIN alvos ON alvos.estacao = j.estacao AND alvos.dia = (j.observed_at AT TIME ZONE 'UTC')::date
+        WHERE (j.observed_at AT TIME ZONE 'UTC')::time = '23:00' {filtro}
+        ORDER BY j.estacao, j.observed_at
+        '''
+
+    def refresh(self, incremental: bool = True) -> str:
+        colunas = self.output_columns()
+        sets = ', '.join(f'{coluna} = EXCLUDED.{coluna}' for coluna in colunas[2:])
+        return f'''
+        INSERT INTO {self.schema}.daily_etl ({', '.join(colunas)})
+        {self.select(incremental)}
+        ON CONFLICT (estacao, dia) DO UPDATE SET {sets}
+        '''
@@ -1,19 +1,63 @@
+import io
 import psycopg2
 import logging
+import uuid
+import zlib
 import pandas as pd
+from datetime import date
 from contextlib import contextmanager
-from typing import List, Dict, Any
+from psycopg2.extras import execute_values
+from typing import List, Dict, Any, Optional, Iterable
+from .pool import ConnectionPool
+from .bulk import RowStream, dedupe_last, frame_csv
+from .query import QueryBuilder, CONFLICT_KEYS, quote_columns
+from .partitions import PartitionBuilder
+from .rollup import RollupBuilder
+from .daily import DailyFeatureSQL
 
 class DBHandler:
-    def __init__(self, config: Dict[str, str], dbname:str = 'clima', schema:str = 'clima_schema'):
+    def __init__(self, config: Dict[str, str], dbname:str = 'clima', schema:str = 'clima_schema',
+                 pool_config: Optional[Dict[str, Any]] = None, copy_threshold: int = 1000,
+                 values_page_size: int = 500, copy_chunk_size: int = 1 << 16, compute_daily: bool = True):
         self.config = config
         self.logger = self.init_logger()
         self.dbname = dbname
         self.schema = schema
+        self.copy_threshold = copy_threshold
+        self.values_page_size = values_page_size
+        self.copy_chunk_size = copy_chunk_size
+        self.compute_daily = compute_daily
+        self.conflict_keys = dict(CONFLICT_KEYS)
+        self.pool = ConnectionPool(config, **(pool_config or {}))
+        self.query_builder = QueryBuilder(schema)
+        self.rollups = RollupBuilder(schema)
+        self.daily = DailyFeatureSQL(schema)
+        self.partition_builder = PartitionBuilder(schema)
         self.create_db()
+        self.partitions = set()
         self.create_schema()
+        legacy = self.rename_legacy_metar()
+        legacy_daily = self.drop_legacy_daily_etl()
         self.create_tables()
-        self.dfs = {}
+        self.create_indexes()
+        today = date.today()
+        self.ensure_partitions([(today.year, today.month), self.next_month(today.year, today.month)])
+        if legacy and self.migrate_legacy_metar():
+            self.rebuild_rollups()
+            legacy_daily = True
+        if legacy_daily and self.compute_daily:
+            self.rebuild_daily_etl()
+        self.dtypes = {
+            'metar': {
+                'estacao': 'category', 'dia': 'Int16', 'mes': 'Int16', 'ano': 'Int16',
+                'pressao': 'float64', 'temperatura': 'float64', 'umidade': 'float64', 'vento_dir_seno': 'float64',
+                'vento_dir_cosseno': 'float64', 'vento_int': 'float64', 'visibilidade': 'float64'
+            },
+            'daily_etl': {'estacao': 'category', **{nome: 'float64' for nome in self.daily.output_columns()[2:]}},
+            'pred_cidade': {'cidade': 'category', 'estado': 'category'},
+            'metar_dist': {'estacao': 'category', 'variavel': 'category'},
+            'metar_agregado': {'estacao': 'category'}
+        }
 
         self.columns_metar = ['estacao', 'data', 'pressao', 'temperatura', 'tempo', 'tempo_desc', 'umidade', 'vento_dir', 'vento_int', 'visibilidade']
         self.columns_pred = ['cidade', 'data', 'dia', 'tempo', 'maxima', 'minima', 'iuv']
@@ -31,71 +75,182 @@ class DBHandler:
         return logger
 
     @contextmanager
-    def get_cursor(self):
-        connection = None
-        cursor = None
+    def get_cursor(self, name: Optional[str] = None):
+        with self.pool.connection() as connection:
+            cursor = None
+            try:
+                cursor = connection.cursor(name = name)
+                yield cursor
+                cursor.close()
+                connection.commit()
+            except Exception as e:
+                if not connection.closed:
+                    connection.rollback()
+                    self.deallocate(connection)
+                self.logger.error(f'Error while using the cursor: {e}')
+                raise
+            finally:
+                if cursor and not cursor.closed:
+                    try:
+                        cursor.close()
+                    except psycopg2.Error:
+                        pass
+
+    def deallocate(self, connection):
         try:
-            connection = psycopg2.connect(**self.config)
-            cursor = connection.cursor()
-            yield cursor
+            with connection.cursor() as cursor:
+                cursor.execute('DEALLOCATE ALL')
             connection.commit()
-        except Exception as e:
-            if connection:
-                connection.rollback()
-            self.logger.error(f'Error while using the cursor: {e}')
-            raise  
-        finally:
-            if cursor:
-                cursor.close()
-            if connection:
-                connection.close()
+        except psycopg2.Error:
+            pass
+        self.pool.reset_prepared(connection)
+
+    def execute_prepared(self, cursor, name: str, query: str, values: List[Any], many: bool = False):
+        prepared = self.pool.prepared(cursor.connection)
+        if name not in prepared:
+            cursor.execute(f'PREPARE {name} AS {query}')
+            prepared.add(name)
+        size = len(values[0]) if many else len(values)
+        execute = f"EXECUTE {name} ({', '.join(['%s'] * size)})"
+        if many:
+            cursor.executemany(execute, values)
+        else:
+            cursor.execute(execute, values)
+
+    def pool_stats(self) -> Dict[str, Any]:
+        return self.pool.stats()
 
     def upsert_data(self, table = None, columns: List[str] = [], value = None):
         if value is None or table is None or columns is None:
             return False
 
+        if isinstance(value, dict):
+            value = [value.get(column) for column in columns]
+        if not self.partitions_for(table, list(columns), [value]):
+            return False
+
         try:
             self.logger.info(f'Starting the insertion @ {table} with {columns} of 1 row')
-            query = self.create_upsert_query(table, columns)
+            query = self.create_upsert_query(table, columns, prepared = True)
             with self.get_cursor() as cursor:
-                cursor.execute(query, value)
+                self.execute_prepared(cursor, self.statement_name(table, columns), query, value)
+                self.refresh_rollups(cursor, table, list(columns), [value])
             self.logger.info(f'Done the insertion of {value}')
             return True
         except Exception as e:
             self.logger.error(f'Error inserting @ {table} with {columns}: {e}')
             return False
 
-    def get_data(self, table: str = 'metar', columns: List[str] = [], restriction: Dict[str, str] = {}):
+    def create_select_query(self, table: str, columns: Optional[List[str]] = None, restriction: Optional[Dict[str, Any]] = None,
+                            order_by: Optional[List[str]] = None, limit: Optional[int] = None):
+        return self.query_builder.select(table, columns, restriction, order_by, limit)
+
+    def to_frame(self, rows: List[tuple], columns: List[str], table: str, dtypes: Optional[Dict[str, str]] = None) -> pd.DataFrame:
+        data = pd.DataFrame.from_records(rows, columns = columns)
+        hints = {column: dtype for column, dtype in {**self.dtypes.get(table, {}), **(dtypes or {})}.items() if column in data.columns}
+        return data.astype(hints) if hints else data
+
+    def get_data(self, table: str = 'metar', columns: List[str] = None, restriction: Dict[str, Any] = None,
+                 dtypes: Optional[Dict[str, str]] = None, order_by: Optional[List[str]] = None, limit: Optional[int] = None,
+                 granularity: Optional[str] = None):
+        if granularity is not None and table == 'metar':
+            return self.get_aggregate(granularity, restriction, order_by, limit)
         try:
             self.logger.info(f'Getting data from {columns} from {table}')
-            if columns is None:
-                query = f"SELECT * FROM {self.schema}.{table}"
-            else:
-                query = f"SELECT {' '.join(columns)} FROM {self.schema}.{table}"
-            
-            if value is not None:
-                query += f' WHERE'
-                for column, value in value.items():
-                    query += f' {column} = {value}'
-
+            query, params = self.create_select_query(table, columns, restriction, order_by, limit)
             with self.get_cursor() as cursor:
-                cursor.execute(query)
+                cursor.execute(query, params)
                 data = cursor.fetchall()
+                columns = [description[0] for description in cursor.description]
             self.logger.info(f'Got {len(data)} rows from {table}')
-            columns = list(data[0].keys())
-            data = pd.DataFrame(columns = columns, data = data)
-            self.dfs[table] = data
-            return data
+            return self.to_frame(data, columns, table, dtypes)
         except Exception as e:
             self.logger.error(f'Error getting data from {table}: {e}')
             return None
 
+    def get_aggregate(self, granularity: str = 'dia', restriction: Dict[str, Any] = None,
+                      order_by: Optional[List[str]] = None, limit: Optional[int] = None):
+        try:
+            query, params, source = self.rollups.aggregate(granularity, restriction, order_by, limit)
+            self.logger.info(f'Aggregating metar by {granularity} from {source}')
+            with self.get_cursor() as cursor:
+                cursor.execute(query, params)
+                data = cursor.fetchall()
+                columns = [description[0] for description in cursor.description]
+            self.logger.info(f'Got {len(data)} aggregated rows from {source}')
+            dtypes = {column: 'Int64' if column.endswith('_count') else 'float64' for column in columns[2:]}
+            return self.to_frame(data, columns, 'metar_agregado', dtypes)
+        except Exception as e:
+            self.logger.error(f'Error aggregating metar by {granularity}: {e}')
+            return None
+
+    def refresh_rollups(self, cursor, table: str, columns: List[str], values: List[List[Any]]):
+        if table != 'metar' or not values or not {'estacao', 'observed_at'}.issubset(columns):
+            return
+        self.refresh_affected(cursor, self.rollups.affected(columns, values))
+
+    def refresh_affected(self, cursor, affected):
+        estacoes_dia, dias, estacoes_mes, meses = affected
+        cursor.execute(self.rollups.refresh_daily(), [estacoes_dia, dias])
+        cursor.execute(self.rollups.refresh_monthly(), [estacoes_mes, meses])
+        self.logger.info(f'Rollups refreshed for {len(dias)} station days and {len(meses)} station months')
+        if self.compute_daily:
+            self.refresh_daily_etl(cursor, estacoes_dia, dias)
+
+    def refresh_daily_etl(self, cursor, estacoes: List[str], dias: List[date]):
+        for desde, grupo in self.daily.starts(estacoes, dias):
+            cursor.execute(self.daily.refresh(), self.daily.params(grupo, desde))
+        self.logger.info(f'daily_etl refreshed for {len(set(estacoes))} stations')
+
+    def rebuild_rollups(self) -> bool:
+        try:
+            with self.get_cursor() as cursor:
+                cursor.execute(f'TRUNCATE {self.schema}.metar_daily, {self.schema}.metar_monthly')
+                cursor.execute(self.rollups.refresh_daily(keyed = False))
+                cursor.execute(self.rollups.refresh_monthly(keyed = False))
+            self.logger.info('Rollups rebuilt')
+            return True
+        except Exception as e:
+            self.logger.error(f'Error rebuilding the rollups: {e}')
+            return False
+
+    def rebuild_daily_etl(self) -> bool:
+        try:
+            with self.get_cursor() as cursor:
+                cursor.execute(f'TRUNCATE {self.schema}.daily_etl')
+                cursor.execute(self.daily.refresh(incremental = False))
+                self.logger.info(f'daily_etl rebuilt with {cursor.rowcount} rows')
+            return True
+        except Exception as e:
+            self.logger.error(f'Error rebuilding daily_etl: {e}')
+            return False
+
+    def stream_data(self, table: str = 'metar', columns: List[str] = None, restriction: Dict[str, Any] = None,
+                    chunk_size: int = 10000, dtypes: Optional[Dict[str, str]] = None, as_frame: bool = True,
+                    order_by: Optional[List[str]] = None, limit: Optional[int] = None):
+        query, params = self.create_select_query(table, columns, restriction, order_by, limit)
+        self.logger.info(f'Streaming {table} in chunks of {chunk_size} rows')
+        total = 0
+        with self.get_cursor(name = f'stream_{table}_{uuid.uuid4().hex[:12]}') as cursor:
+            cursor.itersize = chunk_size
+            cursor.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                total += len(rows)
+                if as_frame:
+                    yield self.to_frame(rows, [description[0] for description in cursor.description], table, dtypes)
+                else:
+                    yield rows
+        self.logger.info(f'Streamed {total} rows from {table}')
+
     def create_db(self):
         try:
-            self.logging.info(f'Creating database {self.dbname}')
+            self.logger.info(f'Creating database {self.dbname}')
             with self.get_cursor() as cursor:
                 cursor.execute(f'CREATE DATABASE {self.dbname}')
-            self.logging.info(f'Database {self.dbname} created')
+            self.logger.info(f'Database {self.dbname} created')
             return True
         except Exception as e:
             self.logger.error(f'Error creating the db: {e}')
@@ -103,10 +258,10 @@ class DBHandler:
 
     def create_schema(self):
         try:
-            self.logging.info(f'Creating schema {self.schema}')
+            self.logger.info(f'Creating schema {self.schema}')
             with self.get_cursor() as cursor:
                 cursor.execute(f'CREATE SCHEMA {self.schema}')
-            self.logging.info(f'Schema {self.schema} created')
+            self.logger.info(f'Schema {self.schema} created')
             return True
         except Exception as e:
             self.logger.error(f'Error creating the schema: {e}')
@@ -114,108 +269,304 @@ class DBHandler:
 
     def create_tables(self):
         try:
-            self.logging.info(f'creating tables')
+            self.logger.info(f'creating tables')
             with self.get_cursor() as cursor:
-                cursor.execute(f'''
-                CREATE TABLE {self.schema}.metar(
-                    estacao VARCHAR(4) PRIMARY KEY,
-                    dia INT,
-                    mes INT,
-                    ano INT,
-                    pressao FLOAT,
-                    temperatura FLOAT,
-                    tempo VARCHAR(10),
-                    umidade Float,
-                    vento_dir_seno FLOAT,
-                    vento_dir_cosseno FLOAT,
-                    vento_int FLOAT,
-                    visibilidade FLOAT
-                )
-                ''')
+                self.create_metar_table(cursor)
 
-                cursor.execute(f'''
-                CREATE TABLE {self.schema}.daily_etl (
-                    estacao VARCHAR(4) PRIMARY KEY,
-                    temperatura_media_dia FLOAT,
-                    temperatura_std_dia FLOAT,
-                    temperatura_min_dia FLOAT,
-                    temperatura_max_dia FLOAT,
-                    temperatura_lag_dia FLOAT,
-                    umidade_media_dia FLOAT,
-                    umidade_std_dia FLOAT,
-                    umidade_min_dia FLOAT,
-                    umidade_max_dia FLOAT,
-                    umidade_lag_dia FLOAT,
-                    vento_int_media_dia FLOAT,
-                    vento_int_std_dia FLOAT,
-                    vento_int_min_dia FLOAT,
-                    vento_int_max_dia FLOAT,
-                    vento_int_lag_dia FLOAT,
-                    visibilidade_media_dia FLOAT,
-                    visibilidade_std_dia FLOAT,
-                    visibilidade_min_dia FLOAT,
-                    visibilidade_max_dia FLOAT,
-                    visibilidade_lag_dia FLOAT,
-                    pressao_media_dia FLOAT,
-                    pressao_std_dia FLOAT,
-                    pressao_min_dia FLOAT,
-                    pressao_max_dia FLOAT,
-                    pressao_lag_dia FLOAT,
-                    vento_dir_seno_media_dia FLOAT,
-                    vento_dir_seno_std_dia FLOAT,
-                    vento_dir_seno_min_dia FLOAT,
-                    vento_dir_seno_max_dia FLOAT,
-                    vento_dir_seno_lag_dia FLOAT,
-                    vento_dir_cosseno_media_dia FLOAT,
-                    vento_dir_cosseno_std_dia FLOAT,
-                    vento_dir_cosseno_min_dia FLOAT,
-                    vento_dir_cosseno_max_dia FLOAT,
-                    target_max FLOAT,
-                    target_min FLOAT
-                )
-                ''')
+                cursor.execute(self.daily.create_table())
 
                 cursor.execute(f'''
-                CREATE TABLE {self.schema}.pred_cidade (
-                    cidade VARCHAR(255) PRIMARY KEY,
+                CREATE TABLE IF NOT EXISTS {self.schema}.pred_cidade (
+                    cidade VARCHAR(255),
                     estado VARCHAR(255),
                     atualizacao DATE DEFAULT CURRENT_DATE,
                     data DATE NOT NULL,
                     temp_min FLOAT,
                     temp_max FLOAT,
-                    indice_uv FLOAT
+                    indice_uv FLOAT,
+                    PRIMARY KEY (cidade, data)
+                )
                 ''')
 
+                cursor.execute(f'''
+                CREATE TABLE IF NOT EXISTS {self.schema}.metar_dist (
+                    estacao VARCHAR(4) NOT NULL,
+                    variavel VARCHAR(32) NOT NULL,
+                    inicio FLOAT NOT NULL,
+                    fim FLOAT NOT NULL,
+                    contagem BIGINT NOT NULL DEFAULT 0,
+                    nulos BIGINT NOT NULL DEFAULT 0,
+                    soma FLOAT NOT NULL DEFAULT 0,
+                    somasq FLOAT NOT NULL DEFAULT 0,
+                    minimo FLOAT,
+                    maximo FLOAT,
+                    bins BIGINT[] NOT NULL,
+                    atualizado_em TIMESTAMPTZ DEFAULT now(),
+                    PRIMARY KEY (estacao, variavel)
+                )
+                ''')
+
+                cursor.execute(self.rollups.create_table('metar_daily'))
+                cursor.execute(self.rollups.create_table('metar_monthly'))
+
             self.logger.info(f'Tables created @ {self.dbname} {self.schema}')
             return True
         except Exception as e:
             self.logger.error(f'Error creating the tables: {e}')
             return False
 
-    def create_upsert_query(self, table: str, columns: List[str]):
+    def create_metar_table(self, cursor):
+        cursor.execute(f'''
+        CREATE TABLE IF NOT EXISTS {self.schema}.metar(
+            estacao VARCHAR(4) NOT NULL,
+            observed_at TIMESTAMPTZ NOT NULL,
+            dia INT,
+            mes INT,
+            ano INT,
+            pressao FLOAT,
+            temperatura FLOAT,
+            tempo INT,
+            umidade Float,
+            vento_dir_seno FLOAT,
+            vento_dir_cosseno FLOAT,
+            vento_int FLOAT,
+            visibilidade FLOAT,
+            PRIMARY KEY (estacao, observed_at)
+        ) PARTITION BY RANGE (observed_at)
+        ''')
+        cursor.execute(f'CREATE TABLE IF NOT EXISTS {self.schema}.metar_default PARTITION OF {self.schema}.metar DEFAULT')
+
+    def next_month(self, ano: int, mes: int):
+        return self.partition_builder.next_month(ano, mes)
+
+    def partition_name(self, ano: int, mes: int) -> str:
+        return self.partition_builder.name(ano, mes)
+
+    def create_partition(self, cursor, ano: int, mes: int):
+        cursor.execute(self.partition_builder.exists(ano, mes))
+        if cursor.fetchone()[0] is not None:
+            return
+        for statement in self.partition_builder.create(ano, mes):
+            cursor.execute(statement)
+        self.logger.info(f'Partition {self.partition_name(ano, mes)} created')
+
+    def ensure_partitions(self, meses: Iterable[tuple], cursor = None) -> bool:
+        faltando = sorted(set(meses) - self.partitions)
+        if not faltando:
+            return True
+        try:
+            if cursor is not None:
+                for ano, mes in faltando:
+                    self.create_partition(cursor, ano, mes)
+            else:
+                with self.get_cursor() as cursor:
+                    for ano, mes in faltando:
+                        self.create_partition(cursor, ano, mes)
+            self.partitions.update(faltando)
+            return True
+        except Exception as e:
+            self.logger.error(f'Error creating the partitions {faltando}: {e}')
+            return False
+
+    def partitions_for(self, table: str, columns: List[str], values: List[List[Any]]) -> bool:
+        if table != 'metar' or 'observed_at' not in columns or not values:
+            return True
+        return self.ensure_partitions(self.partition_builder.months(columns, values))
+
+    def detach_partition(self, ano: int, mes: int, archive_schema: Optional[str] = None, drop: bool = False) -> bool:
+        nome = self.partition_name(ano, mes)
+        try:
+            with self.get_cursor() as cursor:
+                cursor.execute(f'ALTER TABLE {self.schema}.metar DETACH PARTITION {self.schema}.{nome}')
+                if drop:
+                    cursor.execute(f'DROP TABLE {self.schema}.{nome}')
+                elif archive_schema is not None:
+                    cursor.execute(f'CREATE SCHEMA IF NOT EXISTS {archive_schema}')
+                    cursor.execute(f'ALTER TABLE {self.schema}.{nome} SET SCHEMA {archive_schema}')
+            self.partitions.discard((ano, mes))
+            self.logger.info(f'Partition {nome} detached')
+            return True
+        except Exception as e:
+            self.logger.error(f'Error detaching the partition {nome}: {e}')
+            return False
+
+    def rename_legacy_metar(self) -> bool:
+        try:
+            with self.get_cursor() as cursor:
+                cursor.execute('''
+                SELECT c.relkind FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+                WHERE n.nspname = %s AND c.relname = 'metar'
+                ''', [self.schema])
+                linha = cursor.fetchone()
+                if linha is None or linha[0] != 'r':
+                    return False
+                self.logger.info('Found an unpartitioned metar table, renaming it to metar_legacy')
+                cursor.execute(f'ALTER TABLE {self.schema}.metar RENAME TO metar_legacy')
+                cursor.execute(f'ALTER TABLE {self.schema}.metar_legacy RENAME CONSTRAINT metar_pkey TO metar_legacy_pkey')
+                cursor.execute(f'ALTER INDEX IF EXISTS {self.schema}.metar_estacao_data_idx RENAME TO metar_legacy_estacao_data_idx')
+            return True
+        except Exception as e:
+            self.logger.error(f'Error renaming the legacy metar table: {e}')
+            return False
+
+    def drop_legacy_daily_etl(self) -> bool:
+        try:
+            with self.get_cursor() as cursor:
+                cursor.execute('''
+                SELECT 1 FROM information_schema.columns
+                WHERE table_schema = %s AND table_name = 'daily_etl' AND column_name = 'estacao'
+                AND NOT EXISTS (
+                    SELECT 1 FROM information_schema.columns
+                    WHERE table_schema = %s AND table_name = 'daily_etl' AND column_name = 'dia'
+                )
+                ''', [self.schema, self.schema])
+                if cursor.fetchone() is None:
+                    return False
+                self.logger.info('Found a daily_etl table keyed only by estacao, recreating it keyed by (estacao, dia)')
+                cursor.execute(f'DROP TABLE {self.schema}.daily_etl')
+            return True
+        except Exception as e:
+            self.logger.error(f'Error dropping the legacy daily_etl table: {e}')
+            return False
+
+    def migrate_legacy_metar(self, drop: bool = False) -> bool:
+        try:
+            with self.get_cursor() as cursor:
+                cursor.execute(f'''
+                SELECT DISTINCT ano, mes FROM {self.schema}.metar_legacy
+                WHERE ano IS NOT NULL AND mes IS NOT NULL AND dia IS NOT NULL
+                ''')
+                self.ensure_partitions([tuple(linha) for linha in cursor.fetchall()], cursor)
+                cursor.execute(f'''
+                INSERT INTO {self.schema}.metar (
+                    estacao, observed_at, dia, mes, ano, pressao, temperatura, tempo, umidade,
+                    vento_dir_seno, vento_dir_cosseno, vento_int, visibilidade
+                )
+                SELECT
+                    estacao, make_timestamptz(ano, mes, dia, 0, 0, 0, 'UTC'), dia, mes, ano, pressao, temperatura,
+                    CASE WHEN tempo ~ '^-?[0-9]+$' THEN tempo::INT END, umidade,
+                    vento_dir_seno, vento_dir_cosseno, vento_int, visibilidade
+                FROM {self.schema}.metar_legacy
+                WHERE ano IS NOT NULL AND mes IS NOT NULL AND dia IS NOT NULL
+                ON CONFLICT (estacao, observed_at) DO NOTHING
+                ''')
+                self.logger.info(f'Migrated {cursor.rowcount} rows from metar_legacy')
+                if drop:
+                    cursor.execute(f'DROP TABLE {self.schema}.metar_legacy')
+            return True
+        except Exception as e:
+            self.logger.error(f'Error migrating the legacy metar table: {e}')
+            return False
+
+    def create_indexes(self):
+        try:
+            self.logger.info('Creating indexes')
+            with self.get_cursor() as cursor:
+                cursor.execute(f'CREATE INDEX IF NOT EXISTS metar_observed_at_brin ON {self.schema}.metar USING BRIN (observed_at)')
+                cursor.execute(f'CREATE INDEX IF NOT EXISTS pred_cidade_data_idx ON {self.schema}.pred_cidade (data, cidade)')
+            self.logger.info(f'Indexes created @ {self.dbname} {self.schema}')
+            return True
+        except Exception as e:
+            self.logger.error(f'Error creating the indexes: {e}')
+            return False
+
+    def statement_name(self, table: str, columns: List[str]) -> str:
+        return f"upsert_{table}_{zlib.crc32(','.join(columns).encode()):x}"
+
+    def conflict_clause(self, table: str, columns: List[str]) -> str:
+        return self.query_builder.conflict_clause(columns, self.conflict_keys.get(table), table)
+
+    def create_upsert_query(self, table: str, columns: List[str], prepared: bool = False):
         self.logger.info(f'Creating upsert query for @ {table} with {columns}')
-        query = f'INSERT INTO {self.schema}.{table} '
-        query += ', '.join(columns)
-        query += 'VALUES ('
-        for item in columns:
-            query += f'%{item}, '
+        query = f'INSERT INTO {self.schema}.{table} ('
+        query += quote_columns(columns)
+        query += ') VALUES ('
+        if prepared:
+            query += ', '.join(f'${position}' for position in range(1, len(columns) + 1))
+        else:
+            query += ', '.join(['%s'] * len(columns))
         query += ')'
+        query += self.conflict_clause(table, columns)
         self.logger.info(f'Query done: {query}')
         return query
 
-    def upsert_multiple_data(self, table: str = None, columns: List[str] = [], values: List[List[Any]] = []):
+    def key_positions(self, table: str, columns: List[str]) -> List[int]:
+        keys = self.conflict_keys.get(table) or []
+        if not set(keys).issubset(columns):
+            return []
+        return [columns.index(key) for key in keys]
+
+    def copy_upsert(self, cursor, table: str, columns: List[str], values: Iterable[List[Any]]) -> int:
+        stage = f'stage_{table}'
+        colunas = quote_columns(columns)
+        cursor.execute(f'DROP TABLE IF EXISTS {stage}')
+        cursor.execute(f'CREATE TEMP TABLE {stage} ON COMMIT DROP AS SELECT {colunas} FROM {self.schema}.{table} WITH NO DATA')
+        stream = RowStream(values)
+        cursor.copy_expert(f'COPY {stage} ({colunas}) FROM STDIN', stream, size = self.copy_chunk_size)
+
+        cursor.execute(self.query_builder.merge(table, stage, columns, self.conflict_keys.get(table)))
+        return stream.rows
+
+    def values_upsert(self, cursor, table: str, columns: List[str], values: List[List[Any]]) -> int:
+        positions = self.key_positions(table, columns)
+        query = f"INSERT INTO {self.schema}.{table} ({quote_columns(columns)}) VALUES %s{self.conflict_clause(table, columns)}"
+        for start in range(0, len(values), self.values_page_size):
+            page = dedupe_last(values[start:start + self.values_page_size], positions)
+            execute_values(cursor, query, page, page_size = self.values_page_size)
+        return len(values)
+
+    def upsert_multiple_data(self, table: str = None, columns: List[str] = [], values: List[List[Any]] = [], mode: str = 'auto'):
         if table is None or columns is None or values is None:
             self.logger.error('Invalid arguments')
             return False
-    
-        self.logger.info(f'Trying to upsert @ {table} with {columns} of {len(values)} rows')
+
+        columns = list(columns)
+        values = [[value.get(column) for column in columns] if isinstance(value, dict) else value for value in values]
+        if mode == 'auto':
+            mode = 'copy' if len(values) >= self.copy_threshold else 'values'
+        if not self.partitions_for(table, columns, values):
+            return False
+
+        self.logger.info(f'Trying to upsert @ {table} with {columns} of {len(values)} rows using {mode}')
         try:
-            query = self.create_upsert_query(table, columns)
-            self.logger.info('Starting multiple upserts')
-            with connection.cursor() as cursor:
-                cursor.executemany(query, values)
-            self.logger.info(f'Upsert done @ {table} of {len(values)} rows')
+            with self.get_cursor() as cursor:
+                if mode == 'copy':
+                    rows = self.copy_upsert(cursor, table, columns, values)
+                else:
+                    rows = self.values_upsert(cursor, table, columns, values)
+                self.refresh_rollups(cursor, table, columns, values)
+            self.logger.info(f'Upsert done @ {table} of {rows} rows')
+            return True
+        except Exception as e:
+            self.logger.error(f'Error trying to upsert @ {table} with {columns} of {len(values)} rows: {e}')
+            return False
+
+    def upsert_dataframe(self, table: str, df: pd.DataFrame, mode: str = 'copy'):
+        if mode == 'copy':
+            return self.upsert_frame(table, df)
+        columns = list(df.columns)
+        values = df.astype(object).where(df.notna(), None).itertuples(index = False, name = None)
+        return self.upsert_multiple_data(table, columns, list(values), mode = mode)
+
+    def upsert_frame(self, table: str, df: pd.DataFrame):
+        columns = [str(column) for column in df.columns]
+        chaves = table == 'metar' and {'estacao', 'observed_at'}.issubset(columns) and not df.empty
+        if chaves and not self.ensure_partitions(self.partition_builder.months_of(df['observed_at'])):
+            return False
+
+        self.logger.info(f'Trying to upsert @ {table} with {columns} of {len(df)} rows from columns')
+        try:
+            stage = f'stage_{table}'
+            colunas = quote_columns(columns)
+            with self.get_cursor() as cursor:
+                cursor.execute(f'DROP TABLE IF EXISTS {stage}')
+                cursor.execute(f'CREATE TEMP TABLE {stage} ON COMMIT DROP AS SELECT {colunas} FROM {self.schema}.{table} WITH NO DATA')
+                cursor.copy_expert(f'COPY {stage} ({colunas}) FROM STDIN WITH (FORMAT csv)', io.BytesIO(frame_csv(df)), size = self.copy_chunk_size)
+                cursor.execute(self.query_builder.merge(table, stage, columns, self.conflict_keys.get(table)))
+                if chaves:
+                    self.refresh_affected(cursor, self.rollups.affected_keys(df['estacao'], df['observed_at']))
+            self.logger.info(f'Upsert done @ {table} of {len(df)} rows')
             return True
         except Exception as e:
-            self.logger.error(f'Error trying to upsert @ {table} with {columns} of {len(values)} rows')
-            return False
\ No newline at end of file
+            self.logger.error(f'Error trying to upsert @ {table} with {columns} of {len(df)} rows: {e}')
+            return False
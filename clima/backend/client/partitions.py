@@ -0,0 +1,45 @@
+import pandas as pd
+from typing import List, Any, Set, Tuple
+
+class PartitionBuilder:
+    def __init__(self, schema: str, table: str = 'metar'):
+        self.schema = schema
+        self.table = table
+
+    def next_month(self, ano: int, mes: int) -> Tuple[int, int]:
+        return (ano + 1, 1) if mes == 12 else (ano, mes + 1)
+
+    def name(self, ano: int, mes: int) -> str:
+        return f'{self.table}_y{ano:04d}m{mes:02d}'
+
+    def bounds(self, ano: int, mes: int) -> Tuple[str, str]:
+        proximo = self.next_month(ano, mes)
+        return f'{ano:04d}-{mes:02d}-01 00:00:00+00', f'{proximo[0]:04d}-{proximo[1]:02d}-01 00:00:00+00'
+
+    def exists(self, ano: int, mes: int) -> str:
+        return f"SELECT to_regclass('{self.schema}.{self.name(ano, mes)}')"
+
+    def create(self, ano: int, mes: int) -> List[str]:
+        nome = f'{self.schema}.{self.name(ano, mes)}'
+        pai = f'{self.schema}.{self.table}'
+        inicio, fim = self.bounds(ano, mes)
+        return [
+            f'CREATE TABLE {nome} (LIKE {pai} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)',
+            f'''
+            WITH movidos AS (
+                DELETE FROM {pai}_default
+                WHERE observed_at >= '{inicio}' AND observed_at < '{fim}'
+                RETURNING *
+            )
+            INSERT INTO {nome} SELECT * FROM movidos
+            ''',
+            f"ALTER TABLE {pai} ATTACH PARTITION {nome} FOR VALUES FROM ('{inicio}') TO ('{fim}')",
+        ]
+
+    def months(self, columns: List[str], values: List[List[Any]]) -> Set[Tuple[int, int]]:
+        posicao = columns.index('observed_at')
+        return self.months_of([value[posicao] for value in values])
+
+    def months_of(self, observed_at: Any) -> Set[Tuple[int, int]]:
+        observed_at = pd.DatetimeIndex(pd.to_datetime(observed_at, utc = True))
+        return set(zip(observed_at.year, observed_at.month))
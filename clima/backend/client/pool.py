@@ -0,0 +1,170 @@
+import psycopg2
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from psycopg2 import extensions
+from psycopg2.pool import PoolError
+from typing import Dict, Any, Set
+
+class ConnectionPool:
+    def __init__(self, config: Dict[str, str], minconn: int = 1, maxconn: int = 10,
+                 health_check_interval: float = 30.0, timeout: float = 30.0):
+        self.config = config
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.health_check_interval = health_check_interval
+        self.timeout = timeout
+        self.logger = logging.getLogger(__name__)
+
+        self._condition = threading.Condition()
+        self._idle = deque()
+        self._meta = {}
+        self._size = 0
+
+        self.in_use = 0
+        self.checkouts = 0
+        self.waits = 0
+        self.timeouts = 0
+        self.discarded = 0
+        self.checkout_time_total = 0.0
+        self.checkout_time_max = 0.0
+
+        for _ in range(minconn):
+            self._size += 1
+            self._idle.append(self.connect())
+
+    def connect(self):
+        connection = psycopg2.connect(**self.config)
+        self._meta[connection] = {'last_used': time.monotonic(), 'prepared': set()}
+        return connection
+
+    def is_healthy(self, connection) -> bool:
+        if connection.closed:
+            return False
+        if time.monotonic() - self._meta[connection]['last_used'] < self.health_check_interval:
+            return True
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            connection.rollback()
+            return True
+        except psycopg2.Error as e:
+            self.logger.warning(f'Discarding unhealthy connection: {e}')
+            return False
+
+    def discard(self, connection):
+        try:
+            connection.close()
+        finally:
+            with self._condition:
+                self._meta.pop(connection, None)
+                self._size -= 1
+                self.discarded += 1
+                self._condition.notify()
+
+    def checkout(self, deadline: float):
+        with self._condition:
+            waited = False
+            while not self._idle and self._size >= self.maxconn:
+                if not waited:
+                    self.waits += 1
+                    waited = True
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.timeouts += 1
+                    raise PoolError(f'Timed out after {self.timeout}s waiting for a connection')
+                self._condition.wait(remaining)
+            if self._idle:
+                return self._idle.pop()
+            self._size += 1
+
+        try:
+            return self.connect()
+        except Exception:
+            with self._condition:
+                self._size -= 1
+                self._condition.notify()
+            raise
+
+    def getconn(self):
+        start = time.monotonic()
+        deadline = start + self.timeout
+        connection = self.checkout(deadline)
+        while not self.is_healthy(connection):
+            self.discard(connection)
+            connection = self.checkout(deadline)
+
+        elapsed = time.monotonic() - start
+        with self._condition:
+            self.in_use += 1
+            self.checkouts += 1
+            self.checkout_time_total += elapsed
+            self.checkout_time_max = max(self.checkout_time_max, elapsed)
+        return connection
+
+    def putconn(self, connection, broken: bool = False):
+        with self._condition:
+            self.in_use -= 1
+
+        if not broken and not connection.closed:
+            status = connection.info.transaction_status
+            if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+                broken = True
+            elif status != extensions.TRANSACTION_STATUS_IDLE:
+                try:
+                    connection.rollback()
+                except psycopg2.Error:
+                    broken = True
+
+        if broken or connection.closed:
+            self.discard(connection)
+            return
+
+        with self._condition:
+            self._meta[connection]['last_used'] = time.monotonic()
+            self._idle.append(connection)
+            self._condition.notify()
+
+    @contextmanager
+    def connection(self):
+        connection = self.getconn()
+        broken = False
+        try:
+            yield connection
+        except (psycopg2.InterfaceError, psycopg2.OperationalError):
+            broken = True
+            raise
+        finally:
+            self.putconn(connection, broken)
+
+    def prepared(self, connection) -> Set[str]:
+        return self._meta[connection]['prepared']
+
+    def reset_prepared(self, connection):
+        self._meta[connection]['prepared'] = set()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._condition:
+            return {
+                'minconn': self.minconn,
+                'maxconn': self.maxconn,
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': self.in_use,
+                'checkouts': self.checkouts,
+                'waits': self.waits,
+                'timeouts': self.timeouts,
+                'discarded': self.discarded,
+                'checkout_ms_avg': 1000 * self.checkout_time_total / self.checkouts if self.checkouts else 0.0,
+                'checkout_ms_max': 1000 * self.checkout_time_max,
+            }
+
+    def close(self):
+        with self._condition:
+            while self._idle:
+                connection = self._idle.pop()
+                connection.close()
+                self._meta.pop(connection, None)
+                self._size -= 1
@@ -0,0 +1,132 @@
+from typing import List, Dict, Any, Optional, Tuple
+
+CONFLICT_KEYS = {
+    'metar': ['estacao', 'observed_at'],
+    'daily_etl': ['estacao', 'dia'],
+    'pred_cidade': ['cidade', 'data'],
+    'metar_dist': ['estacao', 'variavel']
+}
+
+ACUMULADORES = {
+    'metar_dist': {
+        'contagem': '{tabela}.contagem + EXCLUDED.contagem',
+        'nulos': '{tabela}.nulos + EXCLUDED.nulos',
+        'soma': '{tabela}.soma + EXCLUDED.soma',
+        'somasq': '{tabela}.somasq + EXCLUDED.somasq',
+        'minimo': 'least({tabela}.minimo, EXCLUDED.minimo)',
+        'maximo': 'greatest({tabela}.maximo, EXCLUDED.maximo)',
+        'bins': 'ARRAY(SELECT a + b FROM unnest({tabela}.bins, EXCLUDED.bins) WITH ORDINALITY AS t(a, b, i) ORDER BY i)',
+        'atualizado_em': 'now()',
+    }
+}
+
+CONDICOES = {
+    'metar_dist': (
+        '{tabela}.inicio = EXCLUDED.inicio AND {tabela}.fim = EXCLUDED.fim '
+        'AND cardinality({tabela}.bins) = cardinality(EXCLUDED.bins)'
+    )
+}
+
+OPERADORES = {
+    'eq': '=',
+    'ne': '<>',
+    'gt': '>',
+    'gte': '>=',
+    'lt': '<',
+    'lte': '<=',
+    'in': '= ANY',
+}
+
+def quote_ident(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+def quote_columns(columns: List[str]) -> str:
+    return ', '.join(quote_ident(column) for column in columns)
+
+def parse_filter(chave: str) -> Tuple[str, str]:
+    coluna, _, operador = chave.partition('__')
+    operador = operador or 'eq'
+    if operador not in OPERADORES:
+        raise ValueError(f'Unknown operator {operador} in {chave}')
+    return coluna, operador
+
+class QueryBuilder:
+    def __init__(self, schema: str, paramstyle: str = 'pyformat'):
+        self.schema = schema
+        self.paramstyle = paramstyle
+
+    def placeholder(self, params: List[Any]) -> str:
+        if self.paramstyle == 'numeric':
+            return f'${len(params)}'
+        return '%s'
+
+    def table(self, table: str) -> str:
+        return f'{quote_ident(self.schema)}.{quote_ident(table)}'
+
+    def where(self, restriction: Optional[Dict[str, Any]], params: List[Any]) -> str:
+        predicados = []
+        for chave, valor in (restriction or {}).items():
+            if valor is None:
+                continue
+            coluna, operador = parse_filter(chave)
+            if operador == 'eq' and isinstance(valor, (list, tuple, set)):
+                operador = 'in'
+            if operador == 'in':
+                valor = list(valor)
+                if not valor:
+                    predicados.append('FALSE')
+                    continue
+                params.append(valor)
+                predicados.append(f'{quote_ident(coluna)} = ANY({self.placeholder(params)})')
+            else:
+                params.append(valor)
+                predicados.append(f'{quote_ident(coluna)} {OPERADORES[operador]} {self.placeholder(params)}')
+        return ' WHERE ' + ' AND '.join(predicados) if predicados else ''
+
+    def order(self, order_by: Optional[List[str]]) -> str:
+        if not order_by:
+            return ''
+        termos = []
+        for coluna in order_by:
+            if coluna.startswith('-'):
+                termos.append(f'{quote_ident(coluna[1:])} DESC')
+            else:
+                termos.append(f'{quote_ident(coluna)} ASC')
+        return ' ORDER BY ' + ', '.join(termos)
+
+    def select(self, table: str, columns: Optional[List[str]] = None, restriction: Optional[Dict[str, Any]] = None,
+               order_by: Optional[List[str]] = None, limit: Optional[int] = None) -> Tuple[str, List[Any]]:
+        params = []
+        colunas = '*' if not columns else ', '.join(quote_ident(column) for column in columns)
+        query = f'SELECT {colunas} FROM {self.table(table)}'
+        query += self.where(restriction, params)
+        query += self.order(order_by)
+        if limit is not None:
+            params.append(int(limit))
+            query += f' LIMIT {self.placeholder(params)}'
+        return query, params
+
+    def conflict_clause(self, columns: List[str], keys: Optional[List[str]], table: Optional[str] = None) -> str:
+        if not keys or not set(keys).issubset(columns):
+            return ''
+        updates = [column for column in columns if column not in keys]
+        if not updates:
+            return f" ON CONFLICT ({quote_columns(keys)}) DO NOTHING"
+        acumuladores = ACUMULADORES.get(table, {})
+        sets = ', '.join(
+            f"{quote_ident(column)} = {acumuladores[column].format(tabela = table)}" if column in acumuladores
+            else f'{quote_ident(column)} = EXCLUDED.{quote_ident(column)}'
+            for column in updates
+        )
+        clausula = f" ON CONFLICT ({quote_columns(keys)}) DO UPDATE SET {sets}"
+        if table in CONDICOES:
+            clausula += ' WHERE ' + CONDICOES[table].format(tabela = table)
+        return clausula
+
+    def merge(self, table: str, stage: str, columns: List[str], keys: Optional[List[str]]) -> str:
+        colunas = quote_columns(columns)
+        if keys and set(keys).issubset(columns):
+            select = f"SELECT DISTINCT ON ({quote_columns(keys)}) {colunas} FROM {stage} ORDER BY {quote_columns(keys)}, ctid DESC"
+        else:
+            select = f'SELECT {colunas} FROM {stage}'
+        return f'INSERT INTO {self.schema}.{table} ({colunas}) {select}{self.conflict_clause(columns, keys, table)}'
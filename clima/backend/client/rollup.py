@@ -0,0 +1,195 @@
+import numpy as np
+import pandas as pd
+from datetime import date
+from typing import List, Dict, Any, Optional, Tuple
+from .query import QueryBuilder, parse_filter
+
+ROLLUP_COLUMNS = ['pressao', 'temperatura', 'umidade', 'vento_dir_seno', 'vento_dir_cosseno', 'vento_int', 'visibilidade']
+ESTATISTICAS = ['count', 'sum', 'sumsq', 'min', 'max']
+AGREGADOS = ['count', 'media', 'std', 'min', 'max']
+GRANULARIDADES = {'hora': 'hour', 'dia': 'day', 'mes': 'month', 'ano': 'year'}
+NIVEIS = [
+    ('mes', 'metar_monthly'),
+    ('dia', 'metar_daily'),
+    ('hora', 'metar'),
+]
+ORDEM = ['hora', 'dia', 'mes', 'ano']
+
+def is_aligned(valor: Any, nivel: str) -> bool:
+    timestamp = pd.Timestamp(valor)
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.tz_convert('UTC')
+    if nivel == 'hora':
+        return timestamp == timestamp.floor('h')
+    if nivel == 'dia':
+        return timestamp == timestamp.normalize()
+    return timestamp == timestamp.normalize() and timestamp.day == 1
+
+class RollupBuilder:
+    def __init__(self, schema: str, columns: List[str] = ROLLUP_COLUMNS, paramstyle: str = 'pyformat'):
+        self.schema = schema
+        self.columns = columns
+        self.query_builder = QueryBuilder(schema, paramstyle)
+
+    def keys(self) -> str:
+        if self.query_builder.paramstyle == 'numeric':
+            return '$1::varchar[], $2::date[]'
+        return '%s::varchar[], %s::date[]'
+
+    def table(self, table: str) -> str:
+        return f'{self.schema}.{table}'
+
+    def create_table(self, table: str) -> str:
+        campos = ',\n'.join(
+            f'{column}_count INT, {column}_sum FLOAT, {column}_sumsq FLOAT, {column}_min FLOAT, {column}_max FLOAT'
+            for column in self.columns
+        )
+        return f'''
+        CREATE TABLE IF NOT EXISTS {self.table(table)} (
+            estacao VARCHAR(4) NOT NULL,
+            periodo DATE NOT NULL,
+            {campos},
+            PRIMARY KEY (estacao, periodo)
+        )
+        '''
+
+    def stat_columns(self) -> List[str]:
+        return [f'{column}_{estatistica}' for column in self.columns for estatistica in ESTATISTICAS]
+
+    def output_columns(self) -> List[str]:
+        return ['estacao', 'periodo'] + [f'{column}_{agregado}' for column in self.columns for agregado in AGREGADOS]
+
+    def raw_aggregates(self) -> List[str]:
+        agregados = []
+        for column in self.columns:
+            agregados.extend([
+                f'count({column})', f'sum({column})', f'sum({column} * {column})', f'min({column})', f'max({column})'
+            ])
+        return agregados
+
+    def rollup_aggregates(self) -> List[str]:
+        agregados = []
+        for column in self.columns:
+            agregados.extend([
+                f'sum({column}_count)', f'sum({column}_sum)', f'sum({column}_sumsq)', f'min({column}_min)', f'max({column}_max)'
+            ])
+        return agregados
+
+    def upsert_clause(self) -> str:
+        sets = ', '.join(f'{column} = EXCLUDED.{column}' for column in self.stat_columns())
+        return f'ON CONFLICT (estacao, periodo) DO UPDATE SET {sets}'
+
+    def refresh_daily(self, keyed: bool = True) -> str:
+        colunas = ', '.join(['estacao', 'periodo'] + self.stat_columns())
+        join = f'''
+            JOIN unnest({self.keys()}) AS alvo(estacao, periodo)
+            ON m.estacao = alvo.estacao
+            AND m.observed_at >= (alvo.periodo::timestamp AT TIME ZONE 'UTC')
+            AND m.observed_at < ((alvo.periodo + 1)::timestamp AT TIME ZONE 'UTC')
+        ''' if keyed else ''
+        return f'''
+        INSERT INTO {self.table('metar_daily')} ({colunas})
+        SELECT m.estacao, (m.observed_at AT TIME ZONE 'UTC')::date, {', '.join(self.raw_aggregates())}
+        FROM {self.table('metar')} m {join}
+        GROUP BY 1, 2
+        {self.upsert_clause()}
+        '''
+
+    def refresh_monthly(self, keyed: bool = True) -> str:
+        colunas = ', '.join(['estacao', 'periodo'] + self.stat_columns())
+        join = f'''
+            JOIN unnest({self.keys()}) AS alvo(estacao, periodo)
+            ON d.estacao = alvo.estacao
+            AND d.periodo >= alvo.periodo
+            AND d.periodo < (alvo.periodo + interval '1 month')
+        ''' if keyed else ''
+        return f'''
+        INSERT INTO {self.table('metar_monthly')} ({colunas})
+        SELECT d.estacao, date_trunc('month', d.periodo)::date, {', '.join(self.rollup_aggregates())}
+        FROM {self.table('metar_daily')} d {join}
+        GROUP BY 1, 2
+        {self.upsert_clause()}
+        '''
+
+    def affected(self, columns: List[str], values: List[List[Any]]) -> Tuple[List[str], List[date], List[str], List[date]]:
+        estacao = columns.index('estacao')
+        observed_at = columns.index('observed_at')
+        return self.affected_keys([value[estacao] for value in values], [value[observed_at] for value in values])
+
+    def affected_keys(self, estacoes: Any, observed_at: Any) -> Tuple[List[str], List[date], List[str], List[date]]:
+        observed_at = pd.DatetimeIndex(pd.to_datetime(observed_at, utc = True))
+        dias = pd.DataFrame({'estacao': np.asarray(estacoes, dtype = object), 'dia': observed_at.normalize().date}).drop_duplicates()
+        meses = pd.DataFrame({'estacao': dias['estacao'], 'mes': [dia.replace(day = 1) for dia in dias['dia']]}).drop_duplicates()
+        return (
+            dias['estacao'].tolist(), dias['dia'].tolist(),
+            meses['estacao'].tolist(), meses['mes'].tolist()
+        )
+
+    def route(self, granularidade: str, restriction: Dict[str, Any]) -> Tuple[str, str]:
+        limites = []
+        for chave, valor in restriction.items():
+            coluna, operador = parse_filter(chave)
+            if coluna == 'estacao':
+                continue
+            if coluna != 'observed_at' or operador not in ('gte', 'lt'):
+                return 'hora', 'metar'
+            limites.append(valor)
+
+        requisitado = ORDEM.index(granularidade)
+        for nivel, table in NIVEIS:
+            if ORDEM.index(nivel) > requisitado:
+                continue
+            if all(is_aligned(limite, nivel) for limite in limites):
+                return nivel, table
+        return 'hora', 'metar'
+
+    def aggregate(self, granularidade: str, restriction: Optional[Dict[str, Any]] = None,
+                  order_by: Optional[List[str]] = None, limit: Optional[int] = None) -> Tuple[str, List[Any], str]:
+        if granularidade not in GRANULARIDADES:
+            raise ValueError(f'Unknown granularity {granularidade}')
+        restriction = {chave: valor for chave, valor in (restriction or {}).items() if valor is not None}
+        nivel, table = self.route(granularidade, restriction)
+
+        if table == 'metar':
+            tempo = "observed_at AT TIME ZONE 'UTC'"
+            agregados = self.raw_aggregates()
+            filtros = restriction
+        else:
+            tempo = 'periodo::timestamp'
+            agregados = self.rollup_aggregates()
+            filtros = {}
+            for chave, valor in restriction.items():
+                coluna, operador = parse_filter(chave)
+                if coluna == 'observed_at':
+                    chave = f'periodo__{operador}'
+                    valor = pd.Timestamp(valor).tz_convert('UTC').date() if pd.Timestamp(valor).tzinfo else pd.Timestamp(valor).date()
+                filtros[chave] = valor
+
+        params = []
+        where = self.query_builder.where(filtros, params)
+        periodo = f"date_trunc('{GRANULARIDADES[granularidade]}', {tempo})"
+        estatisticas = ', '.join(
+            f'{agregado} AS {nome}' for agregado, nome in zip(agregados, self.stat_columns())
+        )
+        query = f'''
+        SELECT estacao, {periodo} AS periodo, {estatisticas}
+        FROM {self.table(table)}{where}
+        GROUP BY 1, 2
+        '''
+
+        finais = []
+        for column in self.columns:
+            contagem, soma, somasq = f'{column}_count', f'{column}_sum', f'{column}_sumsq'
+            finais.extend([
+                f'{contagem}',
+                f'{soma} / NULLIF({contagem}, 0) AS {column}_media',
+                f'CASE WHEN {contagem} > 1 THEN sqrt(greatest(({somasq} - {soma} * {soma} / {contagem}) / ({contagem} - 1), 0)) END AS {column}_std',
+                f'{column}_min',
+                f'{column}_max',
+            ])
+        query = f"SELECT estacao, periodo, {', '.join(finais)} FROM ({query}) AS agregado"
+        query += self.query_builder.order(order_by or ['estacao', 'periodo'])
+        if limit is not None:
+            params.append(int(limit))
+            query += f' LIMIT {self.query_builder.placeholder(params)}'
+        return query, params, table
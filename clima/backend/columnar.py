@@ -0,0 +1,105 @@
+import numpy as np
+import pandas as pd
+from typing import Dict, Any, List, Optional
+
+class Coluna:
+    def __init__(self, tipo: str, minimo: Optional[float] = None, maximo: Optional[float] = None,
+                 nullable: bool = True, tamanho: Optional[int] = None):
+        self.tipo = tipo
+        self.minimo = minimo
+        self.maximo = maximo
+        self.nullable = nullable
+        self.tamanho = tamanho
+
+METAR = {
+    'estacao': Coluna('str', nullable = False, tamanho = 4),
+    'observed_at': Coluna('datetime', nullable = False),
+    'dia': Coluna('int', 1, 31),
+    'mes': Coluna('int', 1, 12),
+    'ano': Coluna('int', 1900, 2100),
+    'pressao': Coluna('float', 800, 1100),
+    'temperatura': Coluna('float', -90, 60),
+    'tempo': Coluna('int', -1),
+    'umidade': Coluna('float', 0, 1),
+    'vento_dir_seno': Coluna('float', -1, 1),
+    'vento_dir_cosseno': Coluna('float', -1, 1),
+    'vento_int': Coluna('float', 0, 500),
+    'visibilidade': Coluna('float', 0, 100),
+}
+
+PREVISAO = {
+    'cidade': Coluna('str', nullable = False),
+    'estado': Coluna('str'),
+    'data': Coluna('date', nullable = False),
+    'atualizacao': Coluna('date'),
+    'temp_min': Coluna('float', -90, 60),
+    'temp_max': Coluna('float', -90, 60),
+    'indice_uv': Coluna('float', 0, 25),
+}
+
+class ColumnarError(ValueError):
+    pass
+
+def primeiro(mascara: np.ndarray) -> int:
+    return int(np.flatnonzero(mascara)[0])
+
+def convert(nome: str, valores: Any, coluna: Coluna) -> pd.Series:
+    try:
+        if coluna.tipo == 'float':
+            return pd.Series(pd.to_numeric(valores, errors = 'raise'), dtype = 'float64')
+        if coluna.tipo == 'int':
+            serie = pd.Series(pd.to_numeric(valores, errors = 'raise'))
+            inteiros = serie.dropna()
+            if not np.array_equal(inteiros.to_numpy(), np.round(inteiros.to_numpy())):
+                raise ColumnarError(f'{nome} has non integer values')
+            return serie.astype('Int64')
+        if coluna.tipo == 'datetime':
+            return pd.Series(pd.to_datetime(valores, utc = True, errors = 'raise'))
+        if coluna.tipo == 'date':
+            return pd.Series(pd.to_datetime(valores, errors = 'raise')).dt.date
+        return pd.Series(valores, dtype = 'object')
+    except (TypeError, ValueError) as e:
+        raise ColumnarError(f'{nome}: {e}') from e
+
+def validate(payload: Dict[str, Any], specs: Dict[str, Coluna]) -> pd.DataFrame:
+    faltando = [nome for nome, coluna in specs.items() if not coluna.nullable and nome not in payload]
+    if faltando:
+        raise ColumnarError(f'Missing required columns {faltando}')
+    presentes = [nome for nome in specs if nome in payload]
+    if not presentes:
+        raise ColumnarError('No known columns in payload')
+
+    escalares = [nome for nome in presentes if not pd.api.types.is_list_like(payload[nome]) or isinstance(payload[nome], (dict, set))]
+    if escalares:
+        raise ColumnarError(f'Columns {escalares} are not lists')
+    tamanhos = {nome: len(payload[nome]) for nome in presentes}
+    if len(set(tamanhos.values())) > 1:
+        raise ColumnarError(f'Columns have different lengths {tamanhos}')
+
+    colunas = {}
+    for nome in presentes:
+        coluna = specs[nome]
+        serie = convert(nome, payload[nome], coluna)
+        nulos = serie.isna().to_numpy()
+        if not coluna.nullable and nulos.any():
+            raise ColumnarError(f'{nome} has a null at row {primeiro(nulos)}')
+        if coluna.tipo in ('float', 'int') and (coluna.minimo is not None or coluna.maximo is not None):
+            valores = serie.to_numpy(dtype = np.float64, na_value = np.nan)
+            fora = np.zeros(len(valores), dtype = bool)
+            if coluna.minimo is not None:
+                fora |= valores < coluna.minimo
+            if coluna.maximo is not None:
+                fora |= valores > coluna.maximo
+            if fora.any():
+                linha = primeiro(fora)
+                raise ColumnarError(f'{nome}={valores[linha]} out of [{coluna.minimo}, {coluna.maximo}] at row {linha}')
+        if coluna.tipo == 'str':
+            tamanhos_texto = np.fromiter((len(valor) if isinstance(valor, str) else -1 for valor in serie),
+                                         dtype = np.int64, count = len(serie))
+            invalidos = ~nulos & (tamanhos_texto < 0)
+            if invalidos.any():
+                raise ColumnarError(f'{nome} has a non string value at row {primeiro(invalidos)}')
+            if coluna.tamanho is not None and (tamanhos_texto > coluna.tamanho).any():
+                raise ColumnarError(f'{nome} longer than {coluna.tamanho} at row {primeiro(tamanhos_texto > coluna.tamanho)}')
+        colunas[nome] = serie
+    return pd.DataFrame(colunas)
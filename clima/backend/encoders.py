@@ -0,0 +1,96 @@
+import io
+import orjson
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from typing import Optional, Any, List, Tuple
+
+ARROW = 'application/vnd.apache.arrow.stream'
+PARQUET = 'application/vnd.apache.parquet'
+JSON = 'application/json'
+FORMATOS = {
+    'arrow': ARROW,
+    'parquet': PARQUET,
+    'json': JSON,
+}
+ALIASES = {
+    'application/vnd.apache.arrow.file': ARROW,
+    'application/x-parquet': PARQUET,
+    'application/*': JSON,
+    '*/*': JSON,
+}
+
+def parse_accept(accept: Optional[str]) -> List[Tuple[str, float]]:
+    tipos = []
+    for position, parte in enumerate((accept or '').split(',')):
+        media, _, parametros = parte.strip().partition(';')
+        if not media:
+            continue
+        qualidade = 1.0
+        for parametro in parametros.split(';'):
+            chave, _, valor = parametro.strip().partition('=')
+            if chave == 'q':
+                try:
+                    qualidade = float(valor)
+                except ValueError:
+                    qualidade = 0.0
+        tipos.append((media.strip().lower(), qualidade, -position))
+    tipos.sort(key = lambda tipo: (tipo[1], tipo[2]), reverse = True)
+    return [(media, qualidade) for media, qualidade, _ in tipos]
+
+def negotiate(accept: Optional[str] = None, formato: Optional[str] = None) -> str:
+    if formato is not None:
+        return FORMATOS[formato]
+    for media, qualidade in parse_accept(accept):
+        if qualidade <= 0:
+            continue
+        media = ALIASES.get(media, media)
+        if media in (ARROW, PARQUET, JSON):
+            return media
+    return JSON
+
+def to_arrow(df: pd.DataFrame) -> pa.Table:
+    return pa.Table.from_pandas(df, preserve_index = False)
+
+def write_arrow(df: pd.DataFrame) -> bytes:
+    table = to_arrow(df)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+def read_arrow(content: bytes) -> pd.DataFrame:
+    table = pa.ipc.open_stream(pa.py_buffer(content)).read_all()
+    return table.to_pandas(split_blocks = True, self_destruct = True)
+
+def encode_parquet(df: pd.DataFrame) -> bytes:
+    buffer = io.BytesIO()
+    pq.write_table(to_arrow(df), buffer, compression = 'zstd')
+    return buffer.getvalue()
+
+def default(value: Any) -> Any:
+    if isinstance(value, pd.Timestamp):
+        return value.isoformat()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f'Type is not JSON serializable: {type(value).__name__}')
+
+def encode_json(df: pd.DataFrame) -> bytes:
+    colunas = {}
+    for coluna in df.columns:
+        serie = df[coluna]
+        if isinstance(serie.dtype, np.dtype) and serie.dtype.kind in 'biuf':
+            colunas[str(coluna)] = serie.to_numpy()
+        else:
+            colunas[str(coluna)] = serie.astype(object).where(serie.notna(), None).tolist()
+    return orjson.dumps(colunas, default = default, option = orjson.OPT_SERIALIZE_NUMPY)
+
+ENCODERS = {
+    ARROW: write_arrow,
+    PARQUET: encode_parquet,
+    JSON: encode_json,
+}
+
+def encode(df: pd.DataFrame, media: str) -> bytes:
+    return ENCODERS[media](df)
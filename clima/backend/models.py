@@ -0,0 +1,148 @@
+import asyncio
+import logging
+import time
+import numpy as np
+from typing import Dict, Any, Optional
+
+MODOS = ['max', 'min']
+
+class Modelos:
+    def __init__(self, boosters: Dict[str, Any], run_ids: Dict[str, str]):
+        self.boosters = boosters
+        self.run_ids = run_ids
+        self.carregado_em = time.time()
+
+    def ready(self) -> bool:
+        return all(self.boosters.get(modo) is not None for modo in MODOS)
+
+    def predict(self, X) -> Dict[str, np.ndarray]:
+        return {modo: self.boosters[modo].inplace_predict(X) for modo in MODOS}
+
+class ModelCache:
+    def __init__(self, experiment_name: str = 'clima', poll_interval: float = 30.0, tracking_uri: Optional[str] = None,
+                 pinned: Optional[Dict[str, str]] = None):
+        self.experiment_name = experiment_name
+        self.poll_interval = poll_interval
+        self.tracking_uri = tracking_uri
+        self.pinned = {modo: run_id for modo, run_id in (pinned or {}).items() if run_id}
+        self.logger = logging.getLogger(__name__)
+        self.modelos = Modelos({}, {})
+        self.lock = asyncio.Lock()
+        self.task = None
+        self.client = None
+        self.experiment_id = None
+
+        self.polls = 0
+        self.swaps = 0
+        self.errors = 0
+        self.last_poll = None
+
+    def get_client(self):
+        if self.client is None:
+            from mlflow.tracking import MlflowClient
+            self.client = MlflowClient(tracking_uri = self.tracking_uri)
+        return self.client
+
+    def latest_run_id(self, modo: str) -> Optional[str]:
+        if modo in self.pinned:
+            return self.pinned[modo]
+        client = self.get_client()
+        if self.experiment_id is None:
+            experiment = client.get_experiment_by_name(self.experiment_name)
+            if experiment is None:
+                return None
+            self.experiment_id = experiment.experiment_id
+        runs = client.search_runs(
+            experiment_ids = [self.experiment_id],
+            filter_string = f"tags.model_type = '{modo}' and attributes.status = 'FINISHED'",
+            order_by = ['attributes.start_time DESC'],
+            max_results = 1
+        )
+        return runs[0].info.run_id if runs else None
+
+    def load(self, modo: str, run_id: str):
+        import mlflow.xgboost
+        if self.tracking_uri:
+            mlflow.set_tracking_uri(self.tracking_uri)
+        model = mlflow.xgboost.load_model(f'runs:/{run_id}/model_{modo}')
+        return model.get_booster() if hasattr(model, 'get_booster') else model
+
+    def check(self) -> Optional[Modelos]:
+        atual = self.modelos
+        run_ids = {modo: self.latest_run_id(modo) for modo in MODOS}
+        if run_ids == atual.run_ids:
+            return None
+        boosters = {}
+        for modo, run_id in run_ids.items():
+            if run_id is None:
+                boosters[modo] = None
+            elif run_id == atual.run_ids.get(modo):
+                boosters[modo] = atual.boosters[modo]
+            else:
+                boosters[modo] = self.load(modo, run_id)
+                self.logger.info(f"Loaded '{modo}' model from run {run_id}")
+        return Modelos(boosters, run_ids)
+
+    async def refresh(self) -> bool:
+        async with self.lock:
+            self.polls += 1
+            self.last_poll = time.time()
+            try:
+                novos = await asyncio.to_thread(self.check)
+            except Exception as e:
+                self.errors += 1
+                self.logger.error(f'Error polling models from {self.experiment_name}: {e}')
+                return False
+            if novos is None:
+                return False
+            self.modelos = novos
+            self.swaps += 1
+            return True
+
+    async def pin(self, modo: str, run_id: Optional[str]) -> bool:
+        anterior = self.pinned.get(modo)
+        if run_id:
+            self.pinned[modo] = run_id
+        else:
+            self.pinned.pop(modo, None)
+        await self.refresh()
+        if run_id and self.modelos.run_ids.get(modo) != run_id:
+            if anterior:
+                self.pinned[modo] = anterior
+            else:
+                self.pinned.pop(modo, None)
+            return False
+        return True
+
+    async def poll(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            await self.refresh()
+
+    async def start(self):
+        await self.refresh()
+        if self.poll_interval and self.task is None:
+            self.task = asyncio.create_task(self.poll())
+        return self
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+    def stats(self) -> Dict[str, Any]:
+        modelos = self.modelos
+        return {
+            'ready': modelos.ready(),
+            'run_ids': modelos.run_ids,
+            'pinned': dict(self.pinned),
+            'loaded_at': modelos.carregado_em if modelos.run_ids else None,
+            'last_poll': self.last_poll,
+            'polls': self.polls,
+            'swaps': self.swaps,
+            'errors': self.errors,
+        }
@@ -1,68 +1,189 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Query, Header, HTTPException, Response, Request
 from .schemas import (
-    StatusMessage, RestrictionMetar, RestrictionPrevisao, ResponseGet, MetarPost, PrevisoesPost, 
-    DistribuicoesPost, DistribuicaoMetar, RestrictionDistribuicoes
+    StatusMessage, RestrictionMetar, RestrictionPrevisao, MetarPost, MetarsPost, Previsao, PrevisoesPost, 
+    DistribuicaoPost, DistribuicoesPost, RestrictionDistribuicoes, RestrictionDaily, DailyPost, ModelPin,
+    PredictPost, PredictResponse
 )
-from .client.db_handler import DBHandler
-from .client.config import DB
-from typing import List, Dict, Any
-import pandas as pd
-
-app = FastAPI()
-handler = DBHandler(DB)
-
-@app.get('/get/metar', response_model = ResponseGet)
-def get_metar(restricao: RestrictionMetar = RestrictionMetar()):
-    df = handler.get_data('metar', restriction = restricao.model_dump())
-    obj = ResponseGet(df = df)
-    return obj
-
-@app.get('/get/previsao', response_model = ResponseGet)
-def get_previsao(restricao: RestrictionPrevisao):
-    df = caller.get_data('pred_estacao', restriction = restricao.model_dump())
-    obj = ResponseGet(df = df)
-    return obj
-
-@app.get('/get/distribuicao', response_model = ResponseGet)
-def get_distribuicao(restricao: RestrictionDistribuicoes):
-    df = handler.get_data('metar_dist', restricao.model_dump())
-    obj = ResponseGet(df = df)
-    return obj
+from .client.async_db_handler import AsyncDBHandler
+from .client.config import DB, POOL, CACHE, MODELS, PREDICT
+from .encoders import negotiate, encode, read_arrow, ARROW
+from .columnar import validate, ColumnarError, METAR, PREVISAO
+from .cache import ResponseCache, MemoryBackend, RedisBackend, etag_matches
+from .models import ModelCache
+from .batching import PredictBatcher, ModelsNotReady
+from contextlib import asynccontextmanager
+import orjson
+from typing import List, Dict, Any, Annotated, Optional
+
+handler = AsyncDBHandler(DB, pool_config = POOL)
+backend = RedisBackend(url = CACHE['url']) if CACHE.get('url') else MemoryBackend(CACHE['maxsize'])
+cache = ResponseCache(backend, ttl = CACHE['ttl'])
+models = ModelCache(MODELS['experiment'], MODELS['poll_interval'], MODELS['tracking_uri'], MODELS['pinned'])
+batcher = PredictBatcher(models, PREDICT['max_batch_size'], PREDICT['max_wait'])
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await handler.open()
+    await models.start()
+    await batcher.start()
+    yield
+    await batcher.stop()
+    await models.stop()
+    await handler.close()
+
+app = FastAPI(lifespan = lifespan)
+
+Accept = Annotated[Optional[str], Header()]
+IfNoneMatch = Annotated[Optional[str], Header()]
+
+async def respond(table: str, restricao, accept: Optional[str], if_none_match: Optional[str]):
+    media = negotiate(accept, restricao.formato)
+    query = restricao.to_query()
+    key = await cache.key(table, query, media)
+    entry = await cache.get(key)
+    if entry is None:
+        df = await handler.get_data(table, **query)
+        if df is None:
+            raise HTTPException(status_code = 500, detail = f'Error reading {table}')
+        entry = await cache.set(key, media, encode(df, media))
+
+    media, etag, body = entry
+    headers = {'ETag': etag, 'Vary': 'Accept', 'Cache-Control': 'no-cache'}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code = 304, headers = headers)
+    return Response(content = body, media_type = media, headers = headers)
+
+@app.get('/get/metar')
+async def get_metar(restricao: Annotated[RestrictionMetar, Query()], accept: Accept = None, if_none_match: IfNoneMatch = None):
+    return await respond('metar', restricao, accept, if_none_match)
+
+@app.get('/get/previsao')
+async def get_previsao(restricao: Annotated[RestrictionPrevisao, Query()], accept: Accept = None, if_none_match: IfNoneMatch = None):
+    return await respond('pred_cidade', restricao, accept, if_none_match)
+
+@app.get('/get/distribuicao')
+async def get_distribuicao(restricao: Annotated[RestrictionDistribuicoes, Query()], accept: Accept = None, if_none_match: IfNoneMatch = None):
+    return await respond('metar_dist', restricao, accept, if_none_match)
 
 @app.get('/get/daily')
-def get_etl(restricao: RestrictionPrevisao):
-    df = handler.get_data('daily_etl', restricao.model_dump())
-    return {'items': df}
-    
+async def get_etl(restricao: Annotated[RestrictionDaily, Query()], accept: Accept = None, if_none_match: IfNoneMatch = None):
+    return await respond('daily_etl', restricao, accept, if_none_match)
+
 @app.post('/post/metar', response_model = StatusMessage)
-def post_metar(tempo: MetarsPost):
+async def post_metar(tempo: MetarsPost):
+    try:
+        colunas = list(MetarPost.model_fields.keys())
+        ans = await handler.upsert_multiple_data('metar', colunas, [item.model_dump() for item in tempo.items])
+        if ans:
+            await cache.invalidate('metar', 'daily_etl')
+        return StatusMessage(status = ans)
+    except Exception as e:
+        return StatusMessage(status = False, error = str(e))
+
+async def read_columns(request: Request, specs):
+    content = await request.body()
+    try:
+        if request.headers.get('content-type', '').startswith(ARROW):
+            payload = read_arrow(content)
+        else:
+            payload = orjson.loads(content)
+            payload = payload.get('columns', payload) if isinstance(payload, dict) else None
+            if not isinstance(payload, dict):
+                raise ColumnarError('Expected an object with one array per column')
+        return validate(payload, specs)
+    except (ColumnarError, orjson.JSONDecodeError) as e:
+        raise HTTPException(status_code = 422, detail = str(e))
+
+@app.post('/post/metar/columns', response_model = StatusMessage)
+async def post_metar_columns(request: Request):
+    df = await read_columns(request, METAR)
     try:
-        ans = handler.upsert_multiple_data('metar', list(Metar.items[0].keys()), tempo.model_dump())
+        ans = await handler.upsert_frame('metar', df)
+        if ans:
+            await cache.invalidate('metar', 'daily_etl')
         return StatusMessage(status = ans)
     except Exception as e:
-        return StatusMessage(status = False, error = e)
+        return StatusMessage(status = False, error = str(e))
 
 @app.post('/post/previsao', response_model = StatusMessage)
-def post_previsao(previsoes: PrevisoesPost):
+async def post_previsao(previsoes: PrevisoesPost):
     try:
-        colunas = previsao.items[0].model_fields.keys()
-        ans = handler.upsert_multiple_data('pred_estacao', colunas, previsoes.model_dump())
+        colunas = list(Previsao.model_fields.keys())
+        ans = await handler.upsert_multiple_data('pred_cidade', colunas, [item.model_dump() for item in previsoes.preds])
+        if ans:
+            await cache.invalidate('pred_cidade')
         return StatusMessage(status = ans)
     except Exception as e:
-        return StatusMessage(status = False, error = e)
+        return StatusMessage(status = False, error = str(e))
+
+@app.post('/post/previsao/columns', response_model = StatusMessage)
+async def post_previsao_columns(request: Request):
+    df = await read_columns(request, PREVISAO)
+    try:
+        ans = await handler.upsert_frame('pred_cidade', df)
+        if ans:
+            await cache.invalidate('pred_cidade')
+        return StatusMessage(status = ans)
+    except Exception as e:
+        return StatusMessage(status = False, error = str(e))
 
 @app.post('/post/distribuicao', response_model = StatusMessage)
-def post_distribuicao(distribuicao: DistribuicaoPost):
+async def post_distribuicao(distribuicoes: DistribuicoesPost):
     try:
-        colunas = distribuicoes.model_fields.keys()
-        ans = handler.upsert_data('metar_dist', colunas, distribuicoes.model_dump())
+        colunas = list(DistribuicaoPost.model_fields.keys())
+        ans = await handler.upsert_multiple_data('metar_dist', colunas, [item.model_dump() for item in distribuicoes.items])
+        if ans:
+            await cache.invalidate('metar_dist')
         return StatusMessage(status = ans)
     except Exception as e:
-        return StatusMessage(status = False, error = e)
+        return StatusMessage(status = False, error = str(e))
 
 @app.post('/post/daily', response_model = StatusMessage)
-def post_daily(daily: DailyPost):
-    try
+async def post_daily(daily: DailyPost):
+    validas = handler.daily.output_columns()
+    colunas = [coluna for coluna in validas if any(coluna in item for item in daily.items)]
+    desconhecidas = sorted({chave for item in daily.items for chave in item} - set(validas))
+    if desconhecidas:
+        raise HTTPException(status_code = 422, detail = f'Unknown daily_etl columns {desconhecidas}')
+    if not daily.items or not {'estacao', 'dia'}.issubset(colunas):
+        raise HTTPException(status_code = 422, detail = 'daily_etl rows need estacao and dia')
+    try:
+        ans = await handler.upsert_multiple_data('daily_etl', colunas, daily.items)
+        if ans:
+            await cache.invalidate('daily_etl')
+        return StatusMessage(status = ans)
+    except Exception as e:
+        return StatusMessage(status = False, error = str(e))
+
+@app.post('/predict', response_model = PredictResponse)
+async def predict(pedido: PredictPost):
+    try:
+        return await batcher.predict(pedido.items)
+    except ModelsNotReady as e:
+        raise HTTPException(status_code = 503, detail = str(e))
+    except Exception as e:
+        raise HTTPException(status_code = 500, detail = f'Error predicting: {e}')
+
+@app.get('/stats/pool')
+async def get_pool_stats():
+    return handler.pool_stats()
+
+@app.get('/stats/cache')
+async def get_cache_stats():
+    return cache.stats()
+
+@app.get('/stats/models')
+async def get_model_stats():
+    return models.stats()
+
+@app.get('/stats/predict')
+async def get_predict_stats():
+    return batcher.stats()
+
+@app.post('/models/pin', response_model = StatusMessage)
+async def pin_model(pin: ModelPin):
+    ans = await models.pin(pin.mode, pin.run_id)
+    return StatusMessage(status = ans, error = None if ans else f'Could not load run {pin.run_id}')
 
 if __name__ == '__main__':
     app.run()
\ No newline at end of file
@@ -1,9 +1,14 @@
-from pydantic import BaseModel, Field
-from typing import List, Optional, Tuple, Dict, Any
-from pandas import DataFrame
+from pydantic import BaseModel, Field, model_validator
+from typing import List, Optional, Tuple, Dict, Any, Literal, ClassVar
+from datetime import date, datetime
+from .client.daily import DailyFeatureSQL
+from .client.rollup import RollupBuilder
+
+SCHEMA = 'clima_schema'
 
 class MetarPost(BaseModel):
     estacao: str = Field(...)
+    observed_at: datetime = Field(...)
     dia: int = Field(...)
     mes: int = Field(...)
     ano: int = Field(...)
@@ -19,8 +24,8 @@ class MetarPost(BaseModel):
 class MetarsPost(BaseModel):
     items: List[MetarPost] = Field(...)
 
-class ResponseGet(BaseModel):
-    df: Dict[str, Any] = Field(...)
+class DailyPost(BaseModel):
+    items: List[Dict[str, Any]] = Field(...)
 
 class Previsao(BaseModel):
     cidade: str = Field(...)
@@ -34,52 +39,123 @@ class Previsao(BaseModel):
 class PrevisoesPost(BaseModel):
     preds: List[Previsao] = Field(...)
 
-class RestrictionMetar(BaseModel):
+class Restriction(BaseModel):
+    colunas: ClassVar[List[str]] = []
+
+    order_by: Optional[List[str]] = None
+    limit: Optional[int] = Field(default = None, gt = 0)
+    formato: Optional[Literal['arrow', 'parquet', 'json']] = None
+
+    def orderable(self) -> List[str]:
+        return self.colunas
+
+    @model_validator(mode = 'after')
+    def check_order_by(self):
+        if self.order_by:
+            validas = set(self.orderable())
+            invalidas = [coluna for coluna in self.order_by if (coluna[1:] if coluna.startswith('-') else coluna) not in validas]
+            if invalidas:
+                raise ValueError(f'Unknown order_by columns {invalidas}')
+        return self
+
+    def to_query(self) -> Dict[str, Any]:
+        restriction = self.model_dump(exclude = {'order_by', 'limit', 'formato'}, exclude_none = True)
+        return {'restriction': restriction, 'order_by': self.order_by, 'limit': self.limit}
+
+class RestrictionMetar(Restriction):
+    colunas: ClassVar[List[str]] = list(MetarPost.model_fields)
+    colunas_agregadas: ClassVar[List[str]] = RollupBuilder(SCHEMA).output_columns()
+
     estacao: Optional[str] = None
+    estacao__in: Optional[List[str]] = None
+    observed_at: Optional[datetime] = None
+    observed_at__gte: Optional[datetime] = None
+    observed_at__lt: Optional[datetime] = None
     dia: Optional[int] = None
     mes: Optional[int] = None
     ano: Optional[int] = None
+    ano__gte: Optional[int] = None
+    ano__lt: Optional[int] = None
+    mes__gte: Optional[int] = None
+    mes__lt: Optional[int] = None
+    dia__gte: Optional[int] = None
+    dia__lt: Optional[int] = None
     pressao: Optional[float]= None
     temperatura: Optional[float] = None
-    tempo: Optional[str] = None
+    tempo: Optional[int] = None
     umidade: Optional[float] = None
     vento_dir_seno: Optional[float] = None
     vento_dir_cosseno: Optional[float] = None
     vento_int: Optional[int] = None
     visibilidade: Optional[int] = None
+    granularidade: Optional[Literal['hora', 'dia', 'mes', 'ano']] = None
+
+    def orderable(self) -> List[str]:
+        return self.colunas_agregadas if self.granularidade is not None else self.colunas
+
+    def to_query(self) -> Dict[str, Any]:
+        query = super().to_query()
+        query['restriction'].pop('granularidade', None)
+        query['granularity'] = self.granularidade
+        return query
+
+class RestrictionPrevisao(Restriction):
+    colunas: ClassVar[List[str]] = list(Previsao.model_fields)
 
-class RestrictionPrevisao(BaseModel):
     cidade: Optional[str] = None
-    data: Optional[str] = None
-    dia: Optional[str] = None
-    tempo: Optional[str] = None
-    maxima: Optional[str] = None
-    minima: Optional[str] = None
-    iuv: Optional[str] = None
-    diferenca_dias: Optional[int] = None
+    cidade__in: Optional[List[str]] = None
+    estado: Optional[str] = None
+    estado__in: Optional[List[str]] = None
+    data: Optional[date] = None
+    data__gte: Optional[date] = None
+    data__lt: Optional[date] = None
+    atualizacao: Optional[date] = None
+    temp_min: Optional[float] = None
+    temp_max: Optional[float] = None
+    indice_uv: Optional[float] = None
+
+class RestrictionDaily(Restriction):
+    colunas: ClassVar[List[str]] = DailyFeatureSQL(SCHEMA).output_columns()
+
+    estacao: Optional[str] = None
+    estacao__in: Optional[List[str]] = None
 
 class StatusMessage(BaseModel):
     status: bool = Field(...)
     error: Optional[str] = Field(default = None)
 
+class ModelPin(BaseModel):
+    mode: Literal['max', 'min'] = Field(...)
+    run_id: Optional[str] = Field(default = None)
+
+class PredictPost(BaseModel):
+    items: List[Dict[str, Optional[float]]] = Field(..., min_length = 1)
+
+class PredictResponse(BaseModel):
+    max: List[float] = Field(...)
+    min: List[float] = Field(...)
+    run_ids: Dict[str, Optional[str]] = Field(...)
+
 class DistribuicaoPost(BaseModel):
     estacao: str = Field(...)
-    pressao: float = Field(...)
-    temperatura: float = Field(...)
-    tempo: int = Field(...)
-    umidade: float = Field(...)
-    vento_dir_seno: float = Field(...)
-    vento_dir_cosseno: float = Field(...)
-    vento_int: float = Field(...)
-    visibilidade: float = Field(...)
+    variavel: str = Field(...)
+    inicio: float = Field(...)
+    fim: float = Field(...)
+    contagem: int = Field(..., ge = 0)
+    nulos: int = Field(default = 0, ge = 0)
+    soma: float = Field(default = 0.0)
+    somasq: float = Field(default = 0.0)
+    minimo: Optional[float] = None
+    maximo: Optional[float] = None
+    bins: List[int] = Field(..., min_length = 3)
+
+class DistribuicoesPost(BaseModel):
+    items: List[DistribuicaoPost] = Field(...)
+
+class RestrictionDistribuicoes(Restriction):
+    colunas: ClassVar[List[str]] = [nome for nome in DistribuicaoPost.model_fields if nome != 'bins'] + ['atualizado_em']
 
-class RestrictionDistribuicoes(BaseModel):
     estacao: Optional[str] = None
-    pressao: Optional[float] = None
-    temperatura: Optional[float] = None
-    tempo: Optional[int] = None
-    umidade: Optional[float] = None
-    vento_dir_seno: Optional[float] = None
-    vento_dir_cosseno: Optional[float] = None
-    vento_int: Optional[float] = None
-    visibilidade: Optional[float] = None
+    estacao__in: Optional[List[str]] = None
+    variavel: Optional[str] = None
+    variavel__in: Optional[List[str]] = None
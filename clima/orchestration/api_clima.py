@@ -1,48 +1,132 @@
 import httpx
+import asyncio
 import json
+import random
+import time
+from datetime import datetime
 import pandas as pd
 import logging
 import psycopg2
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple, AsyncIterator, Iterable, Union
+from catalog import CidadeCatalog
+from serialization import save_json
+
+URL = 'https://brasilapi.com.br/api/cptec/v1/'
+
+CAPITAIS = {
+    "Acre": "Rio Branco",
+    "Alagoas": "Maceió",
+    "Amapá": "Macapá",
+    "Amazonas": "Manaus",
+    "Bahia": "Salvador",
+    "Ceará": "Fortaleza",
+    "Distrito Federal": "Brasília",
+    "Espírito Santo": "Vitória",
+    "Goiás": "Goiânia",
+    "Maranhão": "São Luís",
+    "Mato Grosso": "Cuiabá",
+    "Mato Grosso do Sul": "Campo Grande",
+    "Minas Gerais": "Belo Horizonte",
+    "Pará": "Belém",
+    "Paraíba": "João Pessoa",
+    "Paraná": "Curitiba",
+    "Pernambuco": "Recife",
+    "Piauí": "Teresina",
+    "Rio de Janeiro": "Rio de Janeiro",
+    "Rio Grande do Norte": "Natal",
+    "Rio Grande do Sul": "Porto Alegre",
+    "Rondônia": "Porto Velho",
+    "Roraima": "Boa Vista",
+    "Santa Catarina": "Florianópolis",
+    "São Paulo": "São Paulo",
+    "Sergipe": "Aracaju",
+    "Tocantins": "Palmas"
+}
+
+UFS = {
+    "Acre": "AC",
+    "Alagoas": "AL",
+    "Amapá": "AP",
+    "Amazonas": "AM",
+    "Bahia": "BA",
+    "Ceará": "CE",
+    "Distrito Federal": "DF",
+    "Espírito Santo": "ES",
+    "Goiás": "GO",
+    "Maranhão": "MA",
+    "Mato Grosso": "MT",
+    "Mato Grosso do Sul": "MS",
+    "Minas Gerais": "MG",
+    "Pará": "PA",
+    "Paraíba": "PB",
+    "Paraná": "PR",
+    "Pernambuco": "PE",
+    "Piauí": "PI",
+    "Rio de Janeiro": "RJ",
+    "Rio Grande do Norte": "RN",
+    "Rio Grande do Sul": "RS",
+    "Rondônia": "RO",
+    "Roraima": "RR",
+    "Santa Catarina": "SC",
+    "São Paulo": "SP",
+    "Sergipe": "SE",
+    "Tocantins": "TO"
+}
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+WATERMARK_PATH = './clima/cache/metar_watermarks.json'
+
+LIMITS = httpx.Limits(max_connections = 20, max_keepalive_connections = 10, keepalive_expiry = 60)
+TIMEOUT = httpx.Timeout(10.0, connect = 5.0)
+
+_client = None
+_client_loop = None
+
+class TokenBucket:
+    def __init__(self, rate: float = 5.0, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+def get_async_client() -> httpx.AsyncClient:
+    global _client, _client_loop
+    loop = asyncio.get_running_loop()
+    if _client is None or _client.is_closed or _client_loop is not loop:
+        _client = httpx.AsyncClient(base_url = URL, http2 = True, limits = LIMITS, timeout = TIMEOUT)
+        _client_loop = loop
+    return _client
+
+async def close_async_client():
+    global _client, _client_loop
+    if _client is not None and not _client.is_closed:
+        await _client.aclose()
+    _client = None
+    _client_loop = None
 
 class CPTECApiCaller:
     def __init__(self, previsao:bool = False, cidade:str = None):
-        self.url = 'https://brasilapi.com.br/api/cptec/v1/'
-        self.capitais = {
-            "Acre": "Rio Branco",
-            "Alagoas": "Maceió",
-            "Amapá": "Macapá",
-            "Amazonas": "Manaus",
-            "Bahia": "Salvador",
-            "Ceará": "Fortaleza",
-            "Distrito Federal": "Brasília",
-            "Espírito Santo": "Vitória",
-            "Goiás": "Goiânia",
-            "Maranhão": "São Luís",
-            "Mato Grosso": "Cuiabá",
-            "Mato Grosso do Sul": "Campo Grande",
-            "Minas Gerais": "Belo Horizonte",
-            "Pará": "Belém",
-            "Paraíba": "João Pessoa",
-            "Paraná": "Curitiba",
-            "Pernambuco": "Recife",
-            "Piauí": "Teresina",
-            "Rio de Janeiro": "Rio de Janeiro",
-            "Rio Grande do Norte": "Natal",
-            "Rio Grande do Sul": "Porto Alegre",
-            "Rondônia": "Porto Velho",
-            "Roraima": "Boa Vista",
-            "Santa Catarina": "Florianópolis",
-            "São Paulo": "São Paulo",
-            "Sergipe": "Aracaju",
-            "Tocantins": "Palmas"
-        }
+        self.url = URL
+        self.capitais = CAPITAIS
+        self.catalog = CidadeCatalog()
         self.metars_raw = self.get_metar()
         self.raw = self.get_raw_data()
-        self.cidade_codes = {data.get('cidade'):data.get('id') for data in self.raw}
-        self.codes = self.get_estacoes()
-        self.cidade_estado = {data.get('cidade'):data.get('estado') for data in self.raw}
-        self.estados_codes = get_estados_codes()
+        self.cidade_codes = self.catalog.cidade_codes
+        self.codes = self.get_estacoes_capitais()
+        self.cidade_estado = self.catalog.cidade_estado
+        self.estado_cidades = self.catalog.estado_cidades
         if previsao:
             self.previsao = self.get_previsao(cidade)
         else:
@@ -50,8 +134,8 @@ class CPTECApiCaller:
 
     def get_metar(self):
         try:
-            with httpx.Client() as client:
-                response = client.get(self.url + '/clima/capital')
+            with httpx.Client(base_url = self.url) as client:
+                response = client.get('clima/capital')
                 response.raise_for_status()
             metars = response.json()
             return metars
@@ -62,7 +146,7 @@ class CPTECApiCaller:
         try:
             estacoes_code = []
 
-            for metar in self.metars:
+            for metar in self.metars_raw:
                 estacoes_code.append(metar.get('codigo_icao'))
             
             return estacoes_code
@@ -70,14 +154,8 @@ class CPTECApiCaller:
             return []
             
     def get_raw_data(self):
-        try:
-            with httpx.Client() as client:
-                response = client.get(self.url + '/cidade')
-                response.raise_for_status()
-            raw = response.json()
-            return raw
-        except:
-            return []
+        with httpx.Client(base_url = self.url) as client:
+            return self.catalog.refresh(client)
 
     def get_clima_capitais(self) -> List[Dict[str, Any]]:
         try:
@@ -98,9 +176,12 @@ class CPTECApiCaller:
             tempo = []
         return tempo
 
-    def get_previsao(self, cidade: str = 'Recife') -> Dict[str, Any]:
-        with httpx.Client() as client:
-            response = client.get(self.url + f"/clima/previsao/{self.cidade_codes[cidade]}")
+    def get_previsao(self, cidade: str = 'Recife', estado: Optional[str] = None) -> Dict[str, Any]:
+        code = self.catalog.get_id(cidade, estado)
+        if code is None:
+            raise KeyError(cidade)
+        with httpx.Client(base_url = self.url) as client:
+            response = client.get(f'clima/previsao/{code}')
             response.raise_for_status()
         
         data = response.json()
@@ -122,4 +203,195 @@ class CPTECApiCaller:
             }
         )
 
-        return retorno
\ No newline at end of file
+        return retorno
+
+def parse_timestamp(value: Optional[str]) -> Optional[datetime]:
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+
+class AsyncCPTECApiCaller:
+    def __init__(self, client: Optional[httpx.AsyncClient] = None, catalog: Optional[CidadeCatalog] = None,
+                 watermark_path: str = WATERMARK_PATH):
+        self.url = URL
+        self.capitais = CAPITAIS
+        self.client = client
+        self.catalog = catalog if catalog is not None else CidadeCatalog()
+        self.logger = logging.getLogger(__name__)
+        self._raw_lock = asyncio.Lock()
+        self.watermark_path = watermark_path
+        self.watermarks = self.load_watermarks()
+        self.metar_etag = None
+        self.pending_metar_etag = None
+
+    def get_client(self) -> httpx.AsyncClient:
+        return self.client if self.client is not None else get_async_client()
+
+    def load_watermarks(self) -> Dict[str, str]:
+        try:
+            with open(self.watermark_path, 'r', encoding = 'utf-8') as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            self.logger.error(f'Error reading the watermarks @ {self.watermark_path}: {e}')
+            return {}
+
+    def adopt_metar_etag(self):
+        if self.pending_metar_etag is not None:
+            self.metar_etag = self.pending_metar_etag
+            self.pending_metar_etag = None
+
+    def commit_watermarks(self, tempo: List[List[Any]]) -> bool:
+        self.adopt_metar_etag()
+        for metar in tempo:
+            estacao, atualizado_em = metar[0], metar[1]
+            atual = parse_timestamp(self.watermarks.get(estacao))
+            novo = parse_timestamp(atualizado_em)
+            if novo is not None and (atual is None or novo > atual):
+                self.watermarks[estacao] = atualizado_em
+        try:
+            save_json(self.watermark_path, self.watermarks)
+            return True
+        except Exception as e:
+            self.logger.error(f'Error writing the watermarks @ {self.watermark_path}: {e}')
+            return False
+
+    def is_new(self, estacao: str, atualizado_em: Optional[str]) -> bool:
+        novo = parse_timestamp(atualizado_em)
+        atual = parse_timestamp(self.watermarks.get(estacao))
+        return novo is not None and (atual is None or novo > atual)
+
+    async def get_metar(self, conditional: bool = False) -> List[Dict[str, Any]]:
+        headers = {'If-None-Match': self.metar_etag} if conditional and self.metar_etag else {}
+        self.pending_metar_etag = None
+        try:
+            response = await self.get_client().get('clima/capital', headers = headers)
+            if response.status_code == 304:
+                self.logger.info('Capitals metar not modified')
+                return []
+            response.raise_for_status()
+            self.pending_metar_etag = response.headers.get('etag')
+            return response.json()
+        except Exception as e:
+            self.logger.error(f'Error getting the capitals metar: {e}')
+            return []
+
+    async def get_raw_data(self) -> List[Dict[str, Any]]:
+        if self.catalog.is_fresh():
+            return self.catalog.raw
+        async with self._raw_lock:
+            return await self.catalog.arefresh(self.get_client())
+
+    async def get_cidade_code(self, cidade: str, estado: Optional[str] = None) -> int:
+        await self.get_raw_data()
+        code = self.catalog.get_id(cidade, estado)
+        if code is None:
+            raise KeyError(cidade)
+        return code
+
+    async def get_estacoes_capitais(self) -> List[str]:
+        metars = await self.get_metar()
+        return [metar.get('codigo_icao') for metar in metars]
+
+    async def get_clima_capitais(self, only_new: bool = False) -> List[List[Any]]:
+        metars = await self.get_metar(conditional = only_new)
+        tempo = []
+        for metar in metars:
+            if only_new and not self.is_new(metar.get('codigo_icao'), metar.get('atualizado_em')):
+                continue
+            tempo.append([
+                    metar.get('codigo_icao'),
+                    metar.get('atualizado_em'),
+                    metar.get('pressao_atmosferica'),
+                    metar.get('temp'),
+                    metar.get('condicao'),
+                    metar.get('umidade'),
+                    metar.get('direcao_vento'),
+                    metar.get('vento'),
+                    metar.get('visibilidade')
+            ])
+        if not tempo:
+            self.adopt_metar_etag()
+        return tempo
+
+    async def get_with_retry(self, path: str, retries: int = 4, backoff: float = 0.5,
+                             max_backoff: float = 30.0, bucket: Optional[TokenBucket] = None) -> httpx.Response:
+        for attempt in range(retries + 1):
+            if bucket is not None:
+                await bucket.acquire()
+            try:
+                response = await self.get_client().get(path)
+                if response.status_code not in RETRY_STATUS or attempt == retries:
+                    response.raise_for_status()
+                    return response
+                retry_after = response.headers.get('retry-after')
+            except httpx.TransportError as e:
+                if attempt == retries:
+                    raise
+                self.logger.warning(f'Transport error on {path}: {e}')
+                retry_after = None
+
+            delay = random.uniform(0, min(max_backoff, backoff * 2 ** attempt))
+            if retry_after is not None and retry_after.isdigit():
+                delay = max(delay, float(retry_after))
+            self.logger.info(f'Retrying {path} in {delay:.2f}s (attempt {attempt + 1}/{retries})')
+            await asyncio.sleep(delay)
+
+    async def get_previsao(self, cidade: str = 'Recife', estado: Optional[str] = None,
+                           bucket: Optional[TokenBucket] = None, retries: int = 4) -> List[Dict[str, Any]]:
+        code = await self.get_cidade_code(cidade, estado)
+        response = await self.get_with_retry(f'clima/previsao/{code}', retries = retries, bucket = bucket)
+
+        data = response.json()
+        estado = data.get('estado')
+        atualizacao = data.get('atualizado_em')
+
+        retorno = []
+        for previsao in data.get('clima', []):
+            retorno.append({
+                'cidade':cidade,
+                'estado':estado,
+                'atualizacao':atualizacao,
+                'data':previsao.get('data'),
+                'temp_min':previsao.get('min'),
+                'temp_max':previsao.get('max'),
+                'indice_uv':previsao.get('indice_uv'),
+            })
+        return retorno
+
+    async def iter_previsoes(self, cidades: Iterable[Union[str, Tuple[str, str]]], max_concurrency: int = 8,
+                             rate: float = 5.0, retries: int = 4) -> AsyncIterator[Dict[str, Any]]:
+        await self.get_raw_data()
+        semaphore = asyncio.Semaphore(max_concurrency)
+        bucket = TokenBucket(rate)
+
+        async def fetch(cidade, estado):
+            async with semaphore:
+                return await self.get_previsao(cidade, estado, bucket = bucket, retries = retries)
+
+        tasks = []
+        for item in cidades:
+            cidade, estado = item if isinstance(item, tuple) else (item, None)
+            tasks.append(asyncio.create_task(fetch(cidade, estado)))
+
+        try:
+            for future in asyncio.as_completed(tasks):
+                try:
+                    rows = await future
+                except Exception as e:
+                    self.logger.error(f'Error getting a forecast: {e}')
+                    continue
+                for row in rows:
+                    yield row
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def get_previsoes(self, cidades: Iterable[Union[str, Tuple[str, str]]], **kwargs) -> List[Dict[str, Any]]:
+        return [row async for row in self.iter_previsoes(cidades, **kwargs)]
+
+    async def get_previsoes_capitais(self, **kwargs) -> List[Dict[str, Any]]:
+        cidades = [(capital, UFS[estado]) for estado, capital in self.capitais.items()]
+        return await self.get_previsoes(cidades, **kwargs)
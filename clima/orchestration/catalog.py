@@ -0,0 +1,160 @@
+import httpx
+import json
+import logging
+import time
+import unicodedata
+from typing import List, Dict, Any, Optional
+from serialization import save_json
+
+CACHE_PATH = './clima/cache/cidades.json'
+TTL = 7 * 24 * 60 * 60
+
+def normalize(nome: str) -> str:
+    nome = unicodedata.normalize('NFKD', nome or '')
+    nome = ''.join(char for char in nome if not unicodedata.combining(char))
+    return ' '.join(nome.casefold().split())
+
+class CidadeCatalog:
+    def __init__(self, path: str = CACHE_PATH, ttl: float = TTL):
+        self.path = path
+        self.ttl = ttl
+        self.logger = logging.getLogger(__name__)
+        self.raw = []
+        self.etag = None
+        self.last_modified = None
+        self.fetched_at = 0.0
+
+        self.cidade_codes = {}
+        self.cidade_estado = {}
+        self.id_estado = {}
+        self.estado_cidades = {}
+        self.normalized_codes = {}
+        self.normalized_estado_codes = {}
+
+        self.load_cache()
+
+    def is_fresh(self) -> bool:
+        return bool(self.raw) and time.time() - self.fetched_at < self.ttl
+
+    def load_cache(self) -> bool:
+        try:
+            with open(self.path, 'r', encoding = 'utf-8') as file:
+                cache = json.load(file)
+        except FileNotFoundError:
+            return False
+        except Exception as e:
+            self.logger.error(f'Error reading the catalogue cache @ {self.path}: {e}')
+            return False
+
+        self.raw = cache.get('data', [])
+        self.etag = cache.get('etag')
+        self.last_modified = cache.get('last_modified')
+        self.fetched_at = cache.get('fetched_at', 0.0)
+        self.build_indexes()
+        self.logger.info(f'Loaded {len(self.raw)} cities from {self.path}')
+        return True
+
+    def save_cache(self) -> bool:
+        try:
+            save_json(self.path, {
+                'fetched_at': self.fetched_at,
+                'etag': self.etag,
+                'last_modified': self.last_modified,
+                'data': self.raw
+            }, ensure_ascii = False)
+            return True
+        except Exception as e:
+            self.logger.error(f'Error writing the catalogue cache @ {self.path}: {e}')
+            return False
+
+    def conditional_headers(self) -> Dict[str, str]:
+        headers = {}
+        if not self.raw:
+            return headers
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+    def handle_response(self, response: httpx.Response) -> List[Dict[str, Any]]:
+        self.fetched_at = time.time()
+        if response.status_code == 304:
+            self.logger.info('Catalogue not modified, extending the cache ttl')
+            self.save_cache()
+            return self.raw
+
+        response.raise_for_status()
+        self.raw = response.json()
+        self.etag = response.headers.get('etag')
+        self.last_modified = response.headers.get('last-modified')
+        self.build_indexes()
+        self.save_cache()
+        self.logger.info(f'Catalogue refreshed with {len(self.raw)} cities')
+        return self.raw
+
+    def refresh(self, client: httpx.Client, force: bool = False) -> List[Dict[str, Any]]:
+        if self.is_fresh() and not force:
+            return self.raw
+        try:
+            response = client.get('cidade', headers = self.conditional_headers())
+            return self.handle_response(response)
+        except Exception as e:
+            self.logger.error(f'Error refreshing the catalogue: {e}')
+            return self.raw
+
+    async def arefresh(self, client: httpx.AsyncClient, force: bool = False) -> List[Dict[str, Any]]:
+        if self.is_fresh() and not force:
+            return self.raw
+        try:
+            response = await client.get('cidade', headers = self.conditional_headers())
+            return self.handle_response(response)
+        except Exception as e:
+            self.logger.error(f'Error refreshing the catalogue: {e}')
+            return self.raw
+
+    def build_indexes(self):
+        cidade_codes = {}
+        cidade_estado = {}
+        id_estado = {}
+        estado_cidades = {}
+        normalized_codes = {}
+        normalized_estado_codes = {}
+
+        for data in self.raw:
+            cidade = data.get('nome', data.get('cidade'))
+            estado = data.get('estado')
+            code = data.get('id')
+
+            cidade_codes.setdefault(cidade, code)
+            cidade_estado.setdefault(cidade, estado)
+            id_estado[code] = estado
+            estado_cidades.setdefault(estado, []).append(cidade)
+
+            chave = normalize(cidade)
+            normalized_codes.setdefault(chave, []).append(code)
+            normalized_estado_codes.setdefault((chave, normalize(estado)), code)
+
+        self.cidade_codes = cidade_codes
+        self.cidade_estado = cidade_estado
+        self.id_estado = id_estado
+        self.estado_cidades = estado_cidades
+        self.normalized_codes = normalized_codes
+        self.normalized_estado_codes = normalized_estado_codes
+
+    def get_id(self, cidade: str, estado: Optional[str] = None) -> Optional[int]:
+        chave = normalize(cidade)
+        if estado is not None:
+            return self.normalized_estado_codes.get((chave, normalize(estado)))
+        codes = self.normalized_codes.get(chave)
+        if not codes:
+            return None
+        if len(codes) > 1:
+            self.logger.warning(f'{cidade} is ambiguous ({len(codes)} matches), pass the estado to disambiguate')
+        return self.cidade_codes.get(cidade, codes[0])
+
+    def get_estado(self, code: int) -> Optional[str]:
+        return self.id_estado.get(code)
+
+    def get_cidades(self, estado: str) -> List[str]:
+        return self.estado_cidades.get(estado.upper(), [])
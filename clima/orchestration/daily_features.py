@@ -0,0 +1,206 @@
+import json
+import logging
+import math
+import numpy as np
+import pandas as pd
+from collections import deque
+from typing import List, Dict, Any, Optional
+from serialization import save_json
+
+COLUNAS = ['temperatura', 'umidade', 'vento_int', 'visibilidade', 'vento_dir_seno', 'vento_dir_cosseno', 'pressao']
+WINDOW = 24
+STATE_PATH = './clima/cache/daily_state.json'
+
+def feature_names(colunas: List[str] = COLUNAS) -> List[str]:
+    nomes = []
+    for coluna in colunas:
+        nomes.extend([f'{coluna}_media_dia', f'{coluna}_std_dia', f'{coluna}_min_dia', f'{coluna}_max_dia', f'{coluna}_lag_dia'])
+    return nomes
+
+def compute_daily_features(df: pd.DataFrame, colunas: List[str] = COLUNAS, window: int = WINDOW) -> pd.DataFrame:
+    data = df.sort_index(kind = 'stable')
+    grupos = data.groupby('estacao', sort = False)
+    for coluna in colunas:
+        grupo = grupos[coluna]
+        data[f'{coluna}_media_dia'] = grupo.transform(lambda x: x.rolling(window = window).mean())
+        data[f'{coluna}_std_dia'] = grupo.transform(lambda x: x.rolling(window = window).std())
+        data[f'{coluna}_min_dia'] = grupo.transform(lambda x: x.rolling(window = window).min())
+        data[f'{coluna}_max_dia'] = grupo.transform(lambda x: x.rolling(window = window).max())
+        data[f'{coluna}_lag_dia'] = grupo.shift(window)
+    return data
+
+def add_targets(data: pd.DataFrame) -> pd.DataFrame:
+    dias = data.index.normalize()
+    agg_diario = data.groupby(['estacao', dias])['temperatura'].agg(['max', 'min'])
+    proximo_dia = agg_diario.groupby(level = 0).shift(-1)
+    chaves = pd.MultiIndex.from_arrays([data['estacao'], dias])
+    data['target_max'] = proximo_dia['max'].reindex(chaves).to_numpy()
+    data['target_min'] = proximo_dia['min'].reindex(chaves).to_numpy()
+    return data
+
+class RollingWindow:
+    def __init__(self, size: int = WINDOW):
+        self.size = size
+        self.buffer = [math.nan] * size
+        self.position = 0
+        self.seen = 0
+        self.nobs = 0
+        self.shift = 0.0
+        self.sum = 0.0
+        self.sumsq = 0.0
+        self.mins = deque()
+        self.maxs = deque()
+
+    def resync(self):
+        values = [value for value in self.buffer if not math.isnan(value)]
+        self.nobs = len(values)
+        self.shift = values[0] if values else 0.0
+        self.sum = math.fsum(value - self.shift for value in values)
+        self.sumsq = math.fsum((value - self.shift) ** 2 for value in values)
+
+    def rebuild_extremes(self):
+        self.mins.clear()
+        self.maxs.clear()
+        start = self.seen - min(self.seen, self.size)
+        for index in range(start, self.seen):
+            self.push_extremes(index, self.buffer[index % self.size])
+
+    def push_extremes(self, index: int, value: float):
+        if math.isnan(value):
+            return
+        while self.mins and self.mins[-1][1] >= value:
+            self.mins.pop()
+        self.mins.append((index, value))
+        while self.maxs and self.maxs[-1][1] <= value:
+            self.maxs.pop()
+        self.maxs.append((index, value))
+
+    def update(self, value: Optional[float]) -> List[float]:
+        value = math.nan if value is None else float(value)
+        lag = self.buffer[self.position] if self.seen >= self.size else math.nan
+
+        if not math.isnan(lag):
+            self.nobs -= 1
+            self.sum -= lag - self.shift
+            self.sumsq -= (lag - self.shift) ** 2
+        if not math.isnan(value):
+            self.nobs += 1
+            self.sum += value - self.shift
+            self.sumsq += (value - self.shift) ** 2
+
+        self.buffer[self.position] = value
+        self.position = (self.position + 1) % self.size
+        self.seen += 1
+
+        oldest = self.seen - self.size
+        while self.mins and self.mins[0][0] < oldest:
+            self.mins.popleft()
+        while self.maxs and self.maxs[0][0] < oldest:
+            self.maxs.popleft()
+        self.push_extremes(self.seen - 1, value)
+
+        if self.seen % self.size == 0:
+            self.resync()
+
+        if self.nobs < self.size:
+            return [math.nan, math.nan, math.nan, math.nan, lag]
+
+        media = self.shift + self.sum / self.nobs
+        variancia = max((self.sumsq - self.sum * self.sum / self.nobs) / (self.nobs - 1), 0.0)
+        return [media, math.sqrt(variancia), self.mins[0][1], self.maxs[0][1], lag]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'size': self.size,
+            'buffer': [None if math.isnan(value) else value for value in self.buffer],
+            'position': self.position,
+            'seen': self.seen,
+        }
+
+    @classmethod
+    def from_dict(cls, state: Dict[str, Any]) -> 'RollingWindow':
+        window = cls(state['size'])
+        window.buffer = [math.nan if value is None else value for value in state['buffer']]
+        window.position = state['position']
+        window.seen = state['seen']
+        window.resync()
+        window.rebuild_extremes()
+        return window
+
+class DailyFeatureEngine:
+    def __init__(self, colunas: List[str] = COLUNAS, window: int = WINDOW, state_path: str = STATE_PATH):
+        self.colunas = colunas
+        self.window = window
+        self.state_path = state_path
+        self.logger = logging.getLogger(__name__)
+        self.nomes = feature_names(colunas)
+        self.estacoes = {}
+        self.ultima = {}
+
+    def get_windows(self, estacao: str) -> List[RollingWindow]:
+        windows = self.estacoes.get(estacao)
+        if windows is None:
+            windows = [RollingWindow(self.window) for _ in self.colunas]
+            self.estacoes[estacao] = windows
+        return windows
+
+    def update(self, estacao: str, observacao: Dict[str, Any], timestamp: Optional[pd.Timestamp] = None) -> Optional[Dict[str, float]]:
+        if timestamp is not None:
+            ultima = self.ultima.get(estacao)
+            if ultima is not None and pd.Timestamp(timestamp) <= pd.Timestamp(ultima):
+                return None
+            self.ultima[estacao] = pd.Timestamp(timestamp).isoformat()
+
+        valores = []
+        for coluna, window in zip(self.colunas, self.get_windows(estacao)):
+            valores.extend(window.update(observacao.get(coluna)))
+        return dict(zip(self.nomes, valores))
+
+    def update_frame(self, df: pd.DataFrame) -> pd.DataFrame:
+        data = df.sort_index(kind = 'stable')
+        timestamps = data.index if isinstance(data.index, pd.DatetimeIndex) else [None] * len(data)
+        linhas = []
+        manter = []
+        for timestamp, estacao, valores in zip(timestamps, data['estacao'], data[self.colunas].to_numpy(dtype = np.float64)):
+            features = self.update(estacao, dict(zip(self.colunas, valores)), timestamp)
+            manter.append(features is not None)
+            if features is not None:
+                linhas.append([features[nome] for nome in self.nomes])
+
+        data = data[np.asarray(manter, dtype = bool)].copy()
+        features = pd.DataFrame(linhas, columns = self.nomes, index = data.index)
+        return pd.concat([data, features], axis = 1)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'colunas': self.colunas,
+            'window': self.window,
+            'ultima': self.ultima,
+            'estacoes': {estacao: [window.to_dict() for window in windows] for estacao, windows in self.estacoes.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, state: Dict[str, Any], state_path: str = STATE_PATH) -> 'DailyFeatureEngine':
+        engine = cls(state['colunas'], state['window'], state_path)
+        engine.ultima = state.get('ultima', {})
+        engine.estacoes = {
+            estacao: [RollingWindow.from_dict(window) for window in windows]
+            for estacao, windows in state.get('estacoes', {}).items()
+        }
+        return engine
+
+    @classmethod
+    def load(cls, state_path: str = STATE_PATH) -> 'DailyFeatureEngine':
+        try:
+            with open(state_path, 'r', encoding = 'utf-8') as file:
+                return cls.from_dict(json.load(file), state_path)
+        except FileNotFoundError:
+            return cls(state_path = state_path)
+
+    def save(self) -> bool:
+        try:
+            save_json(self.state_path, self.to_dict())
+            return True
+        except Exception as e:
+            self.logger.error(f'Error writing the daily state @ {self.state_path}: {e}')
+            return False
@@ -1,15 +1,175 @@
-from frouros.detectors.data_drift import KSTest
-from frouros.metrics import PrequentialError
-
-def drift_detector(new_data, old_data):
-    detectors = []
-    for column in old_data.columns:
-        detector = KSTest()
-        _ = detector.fit(X = data[column].values)
-        detectors.append(detector)
-    
-    for column, detector in zip(column, detectors):
-        p_value = detector.compare(X = old_data[column].values)[0].p_value
-        if p_value <= 0.05:
-            return True
-    return False
\ No newline at end of file
+import numpy as np
+import pandas as pd
+from scipy.special import kolmogorov
+from scipy.stats import chi2
+from typing import List, Dict, Any, Optional
+from sketches import FeatureSketch, CATEGORICAS
+
+EPS = 1e-4
+
+def benjamini_hochberg(p_values: np.ndarray) -> np.ndarray:
+    p_values = np.asarray(p_values, dtype = np.float64)
+    ajustados = np.full(p_values.shape, np.nan)
+    validos = ~np.isnan(p_values)
+    p = p_values[validos]
+    if not len(p):
+        return ajustados
+    ordem = np.argsort(p)
+    ranks = np.arange(1, len(p) + 1)
+    escalonados = p[ordem] * len(p) / ranks
+    escalonados = np.minimum.accumulate(escalonados[::-1])[::-1]
+    resultado = np.empty(len(p))
+    resultado[ordem] = np.minimum(escalonados, 1.0)
+    ajustados[validos] = resultado
+    return ajustados
+
+def bonferroni(p_values: np.ndarray) -> np.ndarray:
+    p_values = np.asarray(p_values, dtype = np.float64)
+    return np.minimum(p_values * np.count_nonzero(~np.isnan(p_values)), 1.0)
+
+CORRECOES = {'bh': benjamini_hochberg, 'bonferroni': bonferroni}
+
+def ks_test(janela: np.ndarray, referencia: np.ndarray):
+    n_janela = janela.sum(axis = 1)
+    n_referencia = referencia.sum(axis = 1)
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        cdf_janela = np.cumsum(janela, axis = 1) / n_janela[:, None]
+        cdf_referencia = np.cumsum(referencia, axis = 1) / n_referencia[:, None]
+        estatistica = np.abs(cdf_janela - cdf_referencia).max(axis = 1)
+        efetivo = np.round(n_janela * n_referencia / (n_janela + n_referencia))
+    validos = (n_janela > 0) & (n_referencia > 0)
+    raiz = np.sqrt(np.maximum(np.nan_to_num(efetivo), 1))
+    p = np.where(validos, kolmogorov((raiz + 0.12 + 0.11 / raiz) * np.nan_to_num(estatistica)), np.nan)
+    return np.where(validos, estatistica, np.nan), p
+
+def chisquare_test(janela: np.ndarray, referencia: np.ndarray):
+    usados = (janela > 0) | (referencia > 0)
+    suavizada = np.where(usados, referencia + 0.5, 0.0)
+    n_janela = janela.sum(axis = 1)
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        esperado = n_janela[:, None] * suavizada / suavizada.sum(axis = 1)[:, None]
+        termos = np.where(usados, (janela - esperado) ** 2 / esperado, 0.0)
+    estatistica = termos.sum(axis = 1)
+    graus = usados.sum(axis = 1) - 1
+    validos = (n_janela > 0) & (referencia.sum(axis = 1) > 0) & (graus > 0)
+    p = np.full(len(estatistica), np.nan)
+    p[validos] = chi2.sf(estatistica[validos], graus[validos])
+    return np.where(validos, estatistica, np.nan), p
+
+def psi(janela: np.ndarray, referencia: np.ndarray, grupos: int = 10) -> np.ndarray:
+    n_janela = janela.sum(axis = 1)
+    n_referencia = referencia.sum(axis = 1)
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        inicio = (np.cumsum(referencia, axis = 1) - referencia) / n_referencia[:, None]
+    grupo = np.clip(np.floor(np.nan_to_num(inicio) * grupos), 0, grupos - 1).astype(np.int64)
+    indices = (np.arange(len(janela))[:, None] * grupos + grupo).ravel()
+    agrupada_janela = np.bincount(indices, weights = janela.ravel(), minlength = len(janela) * grupos).reshape(-1, grupos)
+    agrupada_referencia = np.bincount(indices, weights = referencia.ravel(), minlength = len(janela) * grupos).reshape(-1, grupos)
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        proporcao_janela = np.maximum(agrupada_janela / n_janela[:, None], EPS)
+        proporcao_referencia = np.maximum(agrupada_referencia / n_referencia[:, None], EPS)
+        termos = (proporcao_janela - proporcao_referencia) * np.log(proporcao_janela / proporcao_referencia)
+    usados = (agrupada_janela > 0) | (agrupada_referencia > 0)
+    valores = np.where(usados, termos, 0.0).sum(axis = 1)
+    return np.where((n_janela > 0) & (n_referencia > 0), valores, np.nan)
+
+class DriftReport:
+    def __init__(self, frame: pd.DataFrame, alpha: float, psi_limite: Optional[float]):
+        self.frame = frame
+        self.alpha = alpha
+        self.psi_limite = psi_limite
+
+    @property
+    def drift(self) -> bool:
+        return bool(self.frame['drift'].any())
+
+    def drifted(self) -> pd.DataFrame:
+        return self.frame[self.frame['drift']]
+
+    def stations(self) -> List[str]:
+        return sorted(self.drifted()['estacao'].astype(str).unique().tolist())
+
+    def to_dict(self) -> Dict[str, Any]:
+        estacoes = {}
+        for linha in self.frame.replace({np.nan: None}).to_dict(orient = 'records'):
+            estacoes.setdefault(str(linha.pop('estacao')), {})[linha.pop('variavel')] = linha
+        return {'drift': self.drift, 'alpha': self.alpha, 'psi_limite': self.psi_limite, 'estacoes': estacoes}
+
+class DriftEngine:
+    def __init__(self, alpha: float = 0.05, psi_limite: Optional[float] = None, correcao: str = 'bh'):
+        self.alpha = alpha
+        self.psi_limite = psi_limite
+        self.correcao = CORRECOES[correcao]
+
+    def histograms(self, new_data: pd.DataFrame, reference: pd.DataFrame, excluir_janela: bool):
+        estacoes, variaveis, janelas, referencias = [], [], [], []
+        codigos = new_data['estacao'].astype(str).to_numpy()
+        referencia_estacoes = reference['estacao'].astype(str).to_numpy()
+        referencia_variaveis = reference['variavel'].astype(str).to_numpy()
+        manter_referencia = np.isin(referencia_estacoes, np.unique(codigos))
+        tamanhos = np.fromiter((len(bins) for bins in reference['bins']), dtype = np.int64, count = len(reference))
+        largura = int(tamanhos[manter_referencia].max()) if manter_referencia.any() else 0
+        inicios = reference['inicio'].to_numpy(dtype = np.float64)
+        fins = reference['fim'].to_numpy(dtype = np.float64)
+        todos_bins = reference['bins'].to_numpy()
+
+        for variavel in pd.unique(referencia_variaveis[manter_referencia]):
+            if variavel not in new_data.columns:
+                continue
+            linhas = np.flatnonzero(manter_referencia & (referencia_variaveis == variavel))
+            primeira = linhas[0]
+            sketch = FeatureSketch(inicios[primeira], fins[primeira], tamanhos[primeira] - 2)
+            linhas = linhas[(tamanhos[linhas] == sketch.n + 2) & (inicios[linhas] == sketch.inicio) & (fins[linhas] == sketch.fim)]
+            nomes = pd.Index(referencia_estacoes[linhas])
+
+            posicoes = nomes.get_indexer(codigos)
+            valores = new_data[variavel].to_numpy(dtype = np.float64, na_value = np.nan)
+            manter = (posicoes >= 0) & ~np.isnan(valores)
+            indices = posicoes[manter] * (sketch.n + 2) + sketch.bin_index(valores[manter])
+            janela = np.bincount(indices, minlength = len(nomes) * (sketch.n + 2)).reshape(len(nomes), sketch.n + 2)
+            referencia = np.asarray(np.stack(todos_bins[linhas]), dtype = np.int64)
+            if excluir_janela:
+                referencia = np.maximum(referencia - janela, 0)
+
+            preenchimento = ((0, 0), (0, largura - sketch.n - 2))
+            janelas.append(np.pad(janela, preenchimento))
+            referencias.append(np.pad(referencia, preenchimento))
+            estacoes.extend(nomes)
+            variaveis.extend([variavel] * len(nomes))
+
+        if not janelas:
+            vazio = np.zeros((0, largura), dtype = np.float64)
+            return estacoes, variaveis, vazio, vazio
+        return estacoes, variaveis, np.concatenate(janelas).astype(np.float64), np.concatenate(referencias).astype(np.float64)
+
+    def run(self, new_data: pd.DataFrame, reference: pd.DataFrame, excluir_janela: bool = True) -> DriftReport:
+        estacoes, variaveis, janela, referencia = self.histograms(new_data, reference, excluir_janela)
+        ks_estatistica, ks_p = ks_test(janela, referencia)
+        chi2_estatistica, chi2_p = chisquare_test(janela, referencia)
+        valores_psi = psi(janela, referencia)
+
+        categorica = np.isin(np.asarray(variaveis, dtype = object), CATEGORICAS)
+        p_principal = np.where(categorica, chi2_p, ks_p)
+        p_ajustado = self.correcao(p_principal)
+
+        frame = pd.DataFrame({
+            'estacao': estacoes,
+            'variavel': variaveis,
+            'n_janela': janela.sum(axis = 1).astype(np.int64),
+            'n_referencia': referencia.sum(axis = 1).astype(np.int64),
+            'ks_estatistica': ks_estatistica,
+            'ks_p': ks_p,
+            'chi2_estatistica': chi2_estatistica,
+            'chi2_p': chi2_p,
+            'psi': valores_psi,
+            'teste': np.where(categorica, 'chi2', 'ks'),
+            'p_ajustado': p_ajustado,
+        })
+        frame['drift'] = frame['p_ajustado'] <= self.alpha
+        if self.psi_limite is not None:
+            frame['drift'] |= frame['psi'] >= self.psi_limite
+        return DriftReport(frame, self.alpha, self.psi_limite)
+
+def drift_detector(new_data: pd.DataFrame, reference: pd.DataFrame, alpha: float = 0.05,
+                   excluir_janela: bool = True) -> bool:
+    return DriftEngine(alpha = alpha).run(new_data, reference, excluir_janela).drift
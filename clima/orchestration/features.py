@@ -0,0 +1,99 @@
+import fcntl
+import json
+import logging
+import os
+import numpy as np
+import pandas as pd
+from contextlib import contextmanager
+from typing import List, Dict, Any, Union
+from serialization import save_json
+
+VOCAB_PATH = './clima/cache/tempo_vocab.json'
+UNKNOWN = -1
+
+class MetarFeatures:
+    def __init__(self, vocab_path: str = VOCAB_PATH):
+        self.vocab_path = vocab_path
+        self.logger = logging.getLogger(__name__)
+        self.vocab = self.load_vocab()
+        self.index = pd.Index(self.vocab)
+
+    def load_vocab(self) -> List[str]:
+        try:
+            with open(self.vocab_path, 'r', encoding = 'utf-8') as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return []
+        except Exception as e:
+            self.logger.error(f'Error reading the tempo vocabulary @ {self.vocab_path}: {e}')
+            raise
+
+    @contextmanager
+    def vocab_lock(self):
+        os.makedirs(os.path.dirname(self.vocab_path) or '.', exist_ok = True)
+        with open(f'{self.vocab_path}.lock', 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def extend_vocab(self, novos: List[str]) -> List[str]:
+        with self.vocab_lock():
+            vocab = self.load_vocab()
+            conhecidos = set(vocab)
+            adicionados = [valor for valor in novos if valor not in conhecidos]
+            self.vocab = vocab + adicionados
+            self.index = pd.Index(self.vocab)
+            if adicionados:
+                self.save_vocab()
+        return adicionados
+
+    def save_vocab(self) -> bool:
+        try:
+            save_json(self.vocab_path, self.vocab, ensure_ascii = False)
+            return True
+        except Exception as e:
+            self.logger.error(f'Error writing the tempo vocabulary @ {self.vocab_path}: {e}')
+            return False
+
+    def encode(self, values: Union[pd.Series, np.ndarray], update: bool = True) -> np.ndarray:
+        values = pd.Series(values, dtype = object)
+        codes = self.index.get_indexer(values)
+
+        unseen = (codes == UNKNOWN) & values.notna().to_numpy()
+        if update and unseen.any():
+            novos = self.extend_vocab(pd.unique(values[unseen]).tolist())
+            if novos:
+                self.logger.info(f'Added {len(novos)} new tempo categories: {novos}')
+            codes = self.index.get_indexer(values)
+
+        return codes.astype(np.int64)
+
+    def decode(self, codes: Union[pd.Series, np.ndarray]) -> np.ndarray:
+        codes = np.asarray(codes, dtype = np.int64)
+        vocab = np.asarray(self.vocab + [None], dtype = object)
+        return vocab[np.where(codes >= 0, codes, len(self.vocab))]
+
+    def transform(self, data: Union[pd.DataFrame, Dict[str, Any]], update: bool = True) -> pd.DataFrame:
+        if isinstance(data, dict):
+            data = pd.DataFrame([data])
+
+        temp = data.drop(columns = ['atualizado_em', 'vento_dir'])
+
+        atualizado_em = pd.to_datetime(data['atualizado_em'], utc = True)
+        temp['observed_at'] = atualizado_em
+        temp['dia'] = atualizado_em.dt.day.to_numpy(dtype = np.int64)
+        temp['mes'] = atualizado_em.dt.month.to_numpy(dtype = np.int64)
+        temp['ano'] = atualizado_em.dt.year.to_numpy(dtype = np.int64)
+
+        temp['tempo'] = self.encode(data['tempo'], update = update)
+
+        vento_dir = np.deg2rad(data['vento_dir'].to_numpy(dtype = np.float64))
+        temp['vento_dir_seno'] = np.sin(vento_dir)
+        temp['vento_dir_cosseno'] = np.cos(vento_dir)
+
+        temp['umidade'] = data['umidade'].to_numpy(dtype = np.float64) / 100
+        temp['visibilidade'] = data['visibilidade'].to_numpy(dtype = np.float64) / 1000
+
+        return temp
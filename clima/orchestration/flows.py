@@ -1,53 +1,60 @@
 from prefect import flow, task, State
 from prefect.states import Failed, Completed
+from prefect.events import emit_event
 from datetime import datetime
-from api_clima import CPTECApiCaller
-from math import radians, sin, cos
+from api_clima import AsyncCPTECApiCaller, UFS
 from scipy.stats import kstest, chisquare
 import httpx
-from typing import Dict, List, Any
+import json
+from typing import Dict, List, Any, Optional
+import numpy as np
 import pandas as pd
-from sklearn.preprocessing import LabelEncoder
-from drift_tool import drift_detector
+from features import MetarFeatures
+from daily_features import DailyFeatureEngine, compute_daily_features, add_targets
+from drift_tool import DriftEngine
+from sketches import build_sketches
+from streaming import StreamingDriftMonitor
+from serialization import read_arrow, write_arrow
 from model.train_class import MyModel
 
 URL = 'http://localhost:8000'
+COLUMNAR_THRESHOLD = 500
+ARROW = 'application/vnd.apache.arrow.stream'
 
-@task
-async def get_caller(previsao:bool = False, cidade:str = None) -> Dict[str, Any]:
-    caller = CPTECApiCaller(previsao, cidade)
-    return caller
-
-@task
-async def metar_etl(data: pd.DataFrame) -> pd.DataFrame:
-    if data is None:
-        return data
-
-    temp = data.copy()
-
-    temp['atualizado_em'] = pd.to_datetime(temp['atualizado_em'])
-    temp['dia'] = temp['atualizado_em'].dt.day.astype(int)
-    temp['mes'] = temp['atualizado_em'].dt.month.astype(int)
-    temp['ano'] = temp['atualizado_em'].dt.year.astype(int)
-
-    temp.drop(columns = 'atualizado_em', inplace = True)
+_caller = None
+_features = None
+_daily_engine = None
+_drift_monitor = None
 
-    le = LabelEncoder()
-    temp['tempo'] = le.fit_transform(temp['tempo'])
-    temp['tempo'] = temp['tempo'].astype(int)
+def get_caller() -> AsyncCPTECApiCaller:
+    global _caller
+    if _caller is None:
+        _caller = AsyncCPTECApiCaller()
+    return _caller
 
-    seno = lambda x: sin(radians(x))
-    cosseno = lambda x: cos(radians(x))
-    temp['vento_dir_seno'] = temp['vento_dir'].apply(seno).astype(float)
-    temp['vento_dir_cosseno'] = temp['vento_dir'].apply(cosseno).astype(float)
-    temp.drop(columns = 'vento_dir', inplace = True)
+def get_daily_engine() -> DailyFeatureEngine:
+    global _daily_engine
+    if _daily_engine is None:
+        _daily_engine = DailyFeatureEngine.load()
+    return _daily_engine
 
-    temp['umidade'] /= 100
-    temp['umidade'] = temp['umidade'].astype(float)
+def get_drift_monitor() -> StreamingDriftMonitor:
+    global _drift_monitor
+    if _drift_monitor is None:
+        _drift_monitor = StreamingDriftMonitor.load()
+    return _drift_monitor
 
-    temp['visibilidade'] = temp['visibilidade'].astype(float) / 1000
+def get_features() -> MetarFeatures:
+    global _features
+    if _features is None:
+        _features = MetarFeatures()
+    return _features
 
-    return temp
+@task
+async def metar_etl(data: pd.DataFrame) -> pd.DataFrame:
+    if data is None:
+        return data
+    return get_features().transform(data)
 
 @task
 async def post_metar_etl(data) -> State:
@@ -55,113 +62,262 @@ async def post_metar_etl(data) -> State:
         return Failed(message = 'No data to post')
 
     try:
-        temp = data.to_dict(orient = 'records')
         async with httpx.AsyncClient() as client:
-            response = await client.post(URL + '/post/metar', json = temp)
+            if len(data) >= COLUMNAR_THRESHOLD:
+                response = await client.post(
+                    URL + '/post/metar/columns', content = write_arrow(data), headers = {'Content-Type': ARROW}
+                )
+            else:
+                temp = json.loads(data.to_json(orient = 'records', date_format = 'iso'))
+                response = await client.post(URL + '/post/metar', json = {'items': temp})
             response.raise_for_status()
-        return True
+        return response.json().get('status', False)
+    except Exception as e:
+        return False
+
+@task
+async def post_distribuicao(data: pd.DataFrame) -> bool:
+    try:
+        async with httpx.AsyncClient() as client:
+            response = await client.post(URL + '/post/distribuicao', json = {'items': build_sketches(data)})
+            response.raise_for_status()
+        ans = response.json()
+        if not ans.get('status', False):
+            print(f"Distributions not merged: {ans.get('error')}")
+        return ans.get('status', False)
     except Exception as e:
         return False
 
+@task
+async def update_drift_monitor(data: pd.DataFrame) -> List[Dict[str, Any]]:
+    monitor = get_drift_monitor()
+    events = monitor.update_frame(data)
+    for event in events:
+        emit_event(
+            event = 'clima.drift.detected',
+            resource = {'prefect.resource.id': f"clima.estacao.{event['estacao']}"},
+            payload = event
+        )
+    monitor.save()
+    if events:
+        print(f"Streaming drift on {sorted({event['estacao'] for event in events})}")
+    return events
+
 # first flow to happen -> happens every 2 hours
 @flow(log_prints  = True)
-async def metar_flow():
-    caller = await get_caller()
-    data = pd.DataFrame(caller.metar, columns = [
+async def metar_flow(local_daily: bool = False):
+    caller = get_caller()
+    tempo = await caller.get_clima_capitais(only_new = True)
+    if not tempo:
+        print('No new observations since the last run')
+        return None
+
+    data = pd.DataFrame(tempo, columns = [
         'estacao', 'atualizado_em', 'pressao', 'temperatura', 
         'tempo', 'umidade', 'vento_dir', 'vento_int', 'visibilidade'
         ])
-    if not data.empty:
-        data = await metar_etl(data)
-        state = await post_metar_etl(data)
-        return data
-    else:
-        return None
+    data.index = pd.DatetimeIndex(pd.to_datetime(data['atualizado_em']))
+    data = await metar_etl(data)
+    state = await post_metar_etl(data)
+    if state is True:
+        caller.commit_watermarks(tempo)
+        await post_distribuicao(data)
+        await update_drift_monitor(data)
+        if local_daily:
+            await process_metar_daily(data)
+    print(f'Posted {len(data)} new observations')
+    return data
 
 
 @task
-async def get_metar(estacao: str = 'SBRF') -> pd.DataFrame:
+async def post_previsoes(rows: List[Dict[str, Any]]) -> bool:
     try:
         async with httpx.AsyncClient() as client:
-            response = client.get(URL + '/get/metar', params = {'estacao':estacao})
+            response = await client.post(URL + '/post/previsao', json = {'preds': rows})
             response.raise_for_status()
-        return response.df
-    except:
-        return pd.DataFrame()
+        return True
+    except Exception as e:
+        return False
+
+@flow(log_prints = True)
+async def previsao_flow(max_concurrency: int = 8, rate: float = 5.0, chunk_size: int = 500):
+    caller = get_caller()
+    cidades = [(capital, UFS[estado]) for estado, capital in caller.capitais.items()]
+    rows = []
+    chunk = []
+    async for row in caller.iter_previsoes(cidades, max_concurrency = max_concurrency, rate = rate):
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            await post_previsoes(chunk)
+            rows.extend(chunk)
+            chunk = []
+    if chunk:
+        await post_previsoes(chunk)
+        rows.extend(chunk)
+    print(f'Got {len(rows)} forecast rows for {len(cidades)} cities')
+    return pd.DataFrame(rows) if rows else None
 
 @task
-async def metar_etl_daily(df, estacao: str = 'SBRF') -> pd.DataFrame:
-    data = df.copy()
-    colunas = ['temperatura', 'umidade', 'vento_int', 'visibilidade', 'vento_dir_seno', 'vento_dir_cosseno', 'pressao']
-    colunas_add = []
-    for coluna in colunas:
-        data[f'{coluna}_media_dia'] = data[coluna].rolling(window = 24).mean()
-        data[f'{coluna}_std_dia'] = data[coluna].rolling(window = 24).std()
-        data[f'{coluna}_min_dia'] = data[coluna].rolling(window = 24).min()
-        data[f'{coluna}_max_dia'] = data[coluna].rolling(window = 24).max()
-        data[f'{coluna}_lag_dia'] = data[coluna].shift(24)
-
-    agg_diario = data['temperatura'].resample('D').agg(['max', 'min'])
-    data['target_max'] = agg_diario.max.shift(-24)
-    data['target_min'] = agg_diario.min.shift(-24)
+async def get_metar(estacao: Optional[str] = 'SBRF', restricao: Optional[Dict[str, Any]] = None, path: str = '/get/metar') -> pd.DataFrame:
+    try:
+        params = {**({'estacao': estacao} if estacao else {}), **(restricao or {})}
+        async with httpx.AsyncClient() as client:
+            response = await client.get(URL + path, params = params, headers = {'Accept': ARROW})
+            response.raise_for_status()
+        return read_arrow(response.content)
+    except Exception as e:
+        print(f'Error getting {path}: {e}')
+        return pd.DataFrame()
 
+@task
+async def metar_etl_daily(df) -> pd.DataFrame:
+    data = compute_daily_features(df)
+    data = add_targets(data)
     final_data = data.at_time('23:00').copy()
-    
     return final_data
 
-@flow
-async def process_metar_daily():
+@task
+async def post_daily(data: pd.DataFrame) -> bool:
+    try:
+        temp = data.reset_index(drop = True).astype(object).where(data.notna().to_numpy(), None)
+        async with httpx.AsyncClient() as client:
+            response = await client.post(URL + '/post/daily', json = {'items': temp.to_dict(orient = 'records')})
+            response.raise_for_status()
+        return True
+    except Exception as e:
+        return False
 
+@flow(log_prints = True)
+async def process_metar_daily(data: pd.DataFrame):
+    engine = get_daily_engine()
+    features = engine.update_frame(data)
+    final_data = features.at_time('23:00').copy()
+    if not final_data.empty:
+        final_data['dia'] = final_data.index.strftime('%Y-%m-%d')
+        await post_daily(final_data[['estacao', 'dia'] + engine.nomes])
+    engine.save()
+    print(f'Updated daily state with {len(features)} observations, {len(final_data)} daily rows')
+    return final_data
 
 @task
-async def check_metrics(new_data, old_data):
-    return drift_detector(new_data, old_data)
+async def check_metrics(new_data, reference):
+    return DriftEngine().run(new_data, reference)
 
 @flow(log_prints = True)
-async def check_drift_flow():
-    data = await get_metar()
-    old_data = data.iloc[:-31]
-    new_data = data.iloc[-31:]
-    drift = await check_metrics(new_data, old_data)
-    return drift, data
+async def check_drift_flow(estacao: Optional[str] = None, janela: int = 31):
+    desde = (pd.Timestamp.now(tz = 'UTC') - pd.Timedelta(hours = janela)).isoformat()
+    data = await get_metar(estacao, {'observed_at__gte': desde})
+    reference = await get_metar(estacao, path = '/get/distribuicao')
+    if data.empty or reference.empty:
+        print(f'Not enough data to check drift for {estacao or "all stations"}')
+        return False, data
+    report = await check_metrics(data, reference)
+    if report.drift:
+        print(f'Drift detected @ {report.stations()}')
+        print(report.drifted()[['estacao', 'variavel', 'teste', 'p_ajustado', 'psi']].to_string(index = False))
+    return report.drift, data
+
+@task
+async def get_training_data(estacao: Optional[str] = None):
+    daily = await get_metar(estacao, path = '/get/daily')
+    diario = await get_metar(estacao, {'granularidade': 'dia'})
+    return daily, diario
 
 @task
-async def train_etl(df):
-   
+async def train_etl(daily: pd.DataFrame, diario: Optional[pd.DataFrame] = None) -> pd.DataFrame:
+    if daily is None or daily.empty:
+        return pd.DataFrame()
+    data = daily.copy()
+    data['dia'] = pd.to_datetime(data['dia'])
+    for target in ['target_max', 'target_min']:
+        if target not in data.columns:
+            data[target] = np.nan
+
+    if diario is not None and not diario.empty:
+        alvos = pd.DataFrame({
+            'estacao': diario['estacao'].astype(str),
+            'dia': pd.to_datetime(diario['periodo']).dt.tz_localize(None).dt.normalize() - pd.Timedelta(days = 1),
+            'proximo_max': diario['temperatura_max'].astype('float64'),
+            'proximo_min': diario['temperatura_min'].astype('float64'),
+        })
+        data['estacao'] = data['estacao'].astype(str)
+        data = data.merge(alvos, on = ['estacao', 'dia'], how = 'left')
+        data['target_max'] = data['target_max'].astype('float64').fillna(data['proximo_max'])
+        data['target_min'] = data['target_min'].astype('float64').fillna(data['proximo_min'])
+        data = data.drop(columns = ['proximo_max', 'proximo_min'])
+
+    data = data.dropna(subset = ['target_max', 'target_min'])
+    data = data.sort_values(['dia', 'estacao'], kind = 'stable').set_index('dia')
+    return data.drop(columns = ['estacao']).astype('float64')
+
+def split_training(data: pd.DataFrame, eval_dias: int = 30, holdout_dias: int = 30, janela: Optional[int] = None):
+    dias = data.index.normalize()
+    fim = dias.max() - pd.Timedelta(days = holdout_dias)
+    inicio = fim - pd.Timedelta(days = eval_dias)
+    treino = data[dias <= inicio]
+    avaliacao = data[(dias > inicio) & (dias <= fim)]
+    novos = treino[treino.index.normalize() > inicio - pd.Timedelta(days = janela)] if janela else treino
+    targets = ['target_max', 'target_min']
+    return {
+        nome: (frame.drop(columns = targets), frame[targets])
+        for nome, frame in [('train', treino), ('eval', avaliacao), ('new', novos)]
+    }
 
 @task
 async def train(data):
+    if data.empty:
+        print('No daily rows with targets to train on')
+        return None
+    partes = split_training(data)
+    (X_train, y_train), (X_eval, y_eval) = partes['train'], partes['eval']
+    if X_train.empty or X_eval.empty:
+        print(f'Not enough daily history to train ({len(X_train)} train rows, {len(X_eval)} eval rows)')
+        return None
+
     model = MyModel()
-    X_train = data.iloc[:-60].drop(columns = ['target_max', 'target_min'])
-    y_train = data.iloc[:-60]
-    y_train_max = y_train['target_max']
-    y_train_min = y_train['target_min']
-    X_eval = data.iloc[-60:-30].drop(columns = ['target_max', 'target_min'])
-    y_eval = data.iloc[-60:-30]
-    y_eval_max = y_eval['target_max']
-    y_eval_min = y_eval['target_min']
-
-    await model.fit(X_train, y_train_max, X_eval, y_eval_max, mode = 'max')
-    await model.optimize(X_train, y_train_max, X_eval, y_eval_max, mode = 'max')
-    await model.fit(X_train, y_train_min, X_eval, y_eval_min, mode = 'min')
-    await model.optimize(X_train, y_eval_min, X_eval, y_eval_min, mode = 'min')
+    await model.fit_targets(X_train, y_train, X_eval, y_eval, tune = True)
     return model 
 
 @flow(log_prints = True)
-def train_flow():
-    data = await get_metar()
-    data = await train_etl(data)
+async def train_flow():
+    daily, diario = await get_training_data()
+    data = await train_etl(daily, diario)
     model = await train(data)
     return model
 
+@task
+async def retrain(data, janela: int = 14):
+    if data.empty:
+        print('No daily rows with targets to retrain on')
+        return None
+    partes = split_training(data, janela = janela)
+    (X_full, y_full), (X_new, y_new), (X_eval, y_eval) = partes['train'], partes['new'], partes['eval']
+    if X_new.empty or X_eval.empty:
+        print(f'Not enough daily history to retrain ({len(X_new)} new rows, {len(X_eval)} eval rows)')
+        return None
+
+    model = MyModel()
+    await model.retrain_targets(X_new, y_new, X_eval, y_eval, X_full = X_full, y_full = y_full, tune = True)
+    return model
+
+@flow(log_prints = True)
+async def retrain_flow(janela: int = 14):
+    daily, diario = await get_training_data()
+    data = await train_etl(daily, diario)
+    model = await retrain(data, janela)
+    return model
+
 @flow(log_prints = True)
-async def decision_flow(data):
-    if metar_flow():
-        drift, data = await check_drift_flow()
+async def decision_flow(janela: int = 14):
+    data = await metar_flow()
+    model = None
+    if data is not None:
+        drift, _ = await check_drift_flow()
         if drift:
-            retrain = await retrain_flow()
-        pred = await pred_flow()
-        
+            model = await retrain_flow(janela)
+    await previsao_flow()
+    return model
+
 @task
 async def get_all_preds():
     async with httpx.AsyncClient() as client:
@@ -3,50 +3,142 @@ import mlflow
 import mlflow.xgboost
 import os
 import glob
+import hashlib
+import numpy as np
+import pandas as pd
 import optuna
+from optuna_integration.xgboost import XGBoostPruningCallback
 from mlflow.models import infer_signature
 from datetime import datetime
-from sklearn.metrics import mean_squared_error
+from typing import Dict, Any, Optional
+
+STUDY_STORAGE = 'sqlite:///./clima/cache/optuna.db'
+SQLITE_MAX_JOBS = 4
+MODOS = ['max', 'min']
+TARGETS = {'max': 'target_max', 'min': 'target_min'}
+DEFAULT_PARAMS = {
+    'objective': 'reg:squarederror',
+    'eval_metric': 'rmse',
+    'tree_method': 'hist',
+    'learning_rate': 0.05,
+    'n_estimators': 1000,
+}
+
+def parse_param(valor):
+    for tipo in (int, float):
+        try:
+            return tipo(valor)
+        except (TypeError, ValueError):
+            pass
+    return valor
+
+def run_params(run) -> Dict[str, Any]:
+    ignorar = {'n_estimators', 'rounds', 'base_rounds', 'nthread'}
+    return {
+        chave[len('params.'):]: parse_param(valor)
+        for chave, valor in run.items()
+        if chave.startswith('params.') and chave[len('params.'):] not in ignorar and valor is not None and valor == valor
+    }
+
+def data_fingerprint(*dados) -> str:
+    digest = hashlib.blake2b(digest_size = 8)
+    for dado in dados:
+        frame = dado if isinstance(dado, (pd.DataFrame, pd.Series)) else pd.DataFrame(np.asarray(dado))
+        digest.update(str(frame.shape).encode())
+        if isinstance(frame, pd.DataFrame):
+            digest.update(','.join(map(str, frame.columns)).encode())
+        digest.update(pd.util.hash_pandas_object(frame, index = True).to_numpy().tobytes())
+    return digest.hexdigest()
+
+def booster_params(params: Dict[str, Any], nthread: Optional[int] = None):
+    params = {**DEFAULT_PARAMS, **(params or {})}
+    rounds = int(params.pop('n_estimators'))
+    if nthread is not None:
+        params['nthread'] = nthread
+    return params, rounds
 
 class MyModel:
-    def __init__(self, experiment_name = 'clima'):
+    def __init__(self, experiment_name = 'clima', mode: str = 'train', storage: Optional[str] = STUDY_STORAGE):
         mlflow.set_experiment(experiment_name)
         self.experiment_name = experiment_name
         self.model_path='./clima/model/model_storage/'
+        self.storage = storage
         self.model_max = None
         self.model_min = None
+        self.params = {modo: None for modo in MODOS}
+        self.run_ids = {modo: None for modo in MODOS}
         self.mode = mode
 
+    def latest_run(self, mode: str = 'max'):
+        runs_df = mlflow.search_runs(
+            experiment_names = [self.experiment_name],
+            filter_string = f'tags.model_type = "{mode}"',
+            order_by = ['start_time DESC'],
+            max_results = 1
+        )
+        return None if runs_df.empty else runs_df.iloc[0]
+
     async def get_latest_model(self, mode:str = 'max'):
         try:
-            runs_df = mlflow.search_runs(
-                experiment_names = [self.experiment_name],
-                filter_string = f'tags.model_type = "{mode}"',
-                order_by = ['start_time DESC'],
-                max_results = 1
-            )
-            if not runs_df.empty:
-                run_id = runs_df.iloc[0].run_id
-                model_uri = f'runs:/{run_id}/mdel_{mode}'
-                loaded_model = mlflow.xgboost.load_model(model_uri)
-            if mode == 'max':
-                self.model_max = loaded_model
-            else:
-                self.model_min = loaded_model
+            run = self.latest_run(mode)
+            if run is None:
+                return None
+            atual = self.model_max if mode == 'max' else self.model_min
+            if atual is not None and self.run_ids[mode] == run.run_id:
+                return atual
+            model_uri = f'runs:/{run.run_id}/model_{mode}'
+            loaded_model = mlflow.xgboost.load_model(model_uri)
+            self.set_model(mode, loaded_model)
+            self.run_ids[mode] = run.run_id
             return loaded_model
         except Exception as e:
             return None
-        return None
 
-    async def create_default_model(self, params):
-        return xgb.XGBRegressor(objective = 'reg:squarederror', 
-                                n_estimators = 1000, 
-                                learning_rate = 0.05, 
-                                early_stopping_rounds = 50
-                                )
+    def dataset(self, X_train, X_eval, max_bin: int = 256):
+        dtrain = xgb.QuantileDMatrix(X_train, max_bin = max_bin)
+        deval = xgb.QuantileDMatrix(X_eval, ref = dtrain)
+        return dtrain, deval
+
+    def set_model(self, mode: str, model):
+        if mode == 'max':
+            self.model_max = model
+        else:
+            self.model_min = model
+
+    def sqlite_storage(self) -> bool:
+        return bool(self.storage) and self.storage.startswith('sqlite:///')
+
+    def study_storage(self):
+        if not self.sqlite_storage():
+            return self.storage
+        os.makedirs(os.path.dirname(self.storage[len('sqlite:///'):]) or '.', exist_ok = True)
+        return optuna.storages.RDBStorage(self.storage, engine_kwargs = {'connect_args': {'timeout': 60}})
 
-    async def optimize(self, X_train, y_train, X_eval, y_eval, mode:str = 'max', n_trials = 50):
-        target_model = self.model_max if mode == 'max' else self.model_min
+    def load_study(self, mode: str = 'max', study_name: Optional[str] = None, fingerprint: Optional[str] = None) -> optuna.Study:
+        if study_name is None:
+            study_name = f'{self.experiment_name}_{mode}' + (f'_{fingerprint}' if fingerprint else '')
+        return optuna.create_study(
+            study_name = study_name,
+            storage = self.study_storage(),
+            direction = 'minimize',
+            pruner = optuna.pruners.MedianPruner(n_startup_trials = 5, n_warmup_steps = 50),
+            load_if_exists = True
+        )
+
+    async def optimize(self, X_train, y_train, X_eval, y_eval, mode:str = 'max', n_trials: Optional[int] = None,
+                       timeout: Optional[float] = 600, n_jobs: int = -1, study_name: Optional[str] = None,
+                       data = None) -> Dict[str, Any]:
+        dtrain, deval = data or self.dataset(X_train, X_eval)
+        dtrain.set_label(y_train)
+        deval.set_label(y_eval)
+        study = self.load_study(mode, study_name, data_fingerprint(X_train, y_train, X_eval, y_eval))
+        if n_trials is not None:
+            feitos = [trial for trial in study.trials if trial.state in (optuna.trial.TrialState.COMPLETE, optuna.trial.TrialState.PRUNED)]
+            n_trials = max(n_trials - len(feitos), 0)
+        workers = (os.cpu_count() or 1) if n_jobs == -1 else max(n_jobs, 1)
+        if self.sqlite_storage():
+            workers = min(workers, SQLITE_MAX_JOBS)
+        threads = max((os.cpu_count() or 1) // workers, 1)
 
         def objective(trial):
             params = {
@@ -57,46 +149,135 @@ class MyModel:
                 'colsample_bytree': trial.suggest_float('colsample_bytree', 0.6, 1.0),
             }
 
-            model = xgb.XGBRegressor(objective = 'reg:squarederror', **params)
-            model.fit(X_train, y_train, eval_set = [(X_eval, y_train)], verbose = False, early_stopping_rounds = 50)
-            preds = model.predict(X_eval)
-            rmse = mean_squared_error(y_train, preds, squared = False)
-            return rmse
-
-        study = optuna.create_study(direction = 'minimize')
-        study.optimize(objective, n_trials = n_trials)
-        target_model.set_params(**study.best_params)
+            params, rounds = booster_params(params, threads)
+            booster = xgb.train(
+                params, dtrain, num_boost_round = rounds,
+                evals = [(deval, 'eval')],
+                early_stopping_rounds = 50,
+                callbacks = [XGBoostPruningCallback(trial, 'eval-rmse')],
+                verbose_eval = False
+            )
+            trial.set_user_attr('best_iteration', int(booster.best_iteration))
+            return float(booster.best_score)
 
+        if n_trials != 0:
+            study.optimize(objective, n_trials = n_trials, timeout = timeout, n_jobs = workers, gc_after_trial = True)
+        if not study.get_trials(deepcopy = False, states = (optuna.trial.TrialState.COMPLETE,)):
+            print(f"No completed trials in study '{study.study_name}', keeping the current '{mode}' params")
+            return self.params[mode]
+        best_params = dict(study.best_params)
+        best_params['n_estimators'] = study.best_trial.user_attrs.get('best_iteration', best_params['n_estimators'] - 1) + 1
+        self.params[mode] = best_params
+        return best_params
 
-    async def fit(self, X, y, X_eval, y_eval, mode:str = 'max', params = None):
-        target_model = self.model_max if mode == 'max' else self.model_min
-        
-        if target_model is None:
-            target_model = self.create_default_model()
-            if params:
-                target_model.set_params(**params)
-        
+    async def fit(self, X, y, X_eval, y_eval, mode:str = 'max', params = None, data = None):
+        dtrain, deval = data or self.dataset(X, X_eval)
+        dtrain.set_label(y)
+        deval.set_label(y_eval)
+        params, rounds = booster_params(params or self.params[mode])
 
         with mlflow.start_run() as run:
             mlflow.set_tag('model_type', mode)
-            mlflow.log_params(target_model.get_params())
-            
-            target_model.fit(
-                X_train, y_train, 
-                eval_set=[(X_eval, y_train)], 
-                verbose=False
+            mlflow.log_params({**params, 'n_estimators': rounds})
+
+            booster = xgb.train(
+                params, dtrain, num_boost_round = rounds,
+                evals = [(deval, 'eval')],
+                early_stopping_rounds = 50,
+                verbose_eval = False
             )
-            
+            booster = booster[:booster.best_iteration + 1]
+            mlflow.log_metric('eval_rmse', float(booster.eval(deval).split(':')[-1]))
+
             mlflow.xgboost.log_model(
-                xgb_model=target_model,
+                xgb_model=booster,
                 artifact_path=f'model_{mode}'
             )
             print(f"Successfully trained and logged '{mode}' model to run_id: {run.info.run_id}")
+        self.set_model(mode, booster)
+        self.run_ids[mode] = run.info.run_id
+        return booster
+
+    async def fit_targets(self, X_train, y_train, X_eval, y_eval, tune: bool = False, max_bin: int = 256, **tuning):
+        data = self.dataset(X_train, X_eval, max_bin)
+        for mode in MODOS:
+            target = TARGETS[mode]
+            if tune:
+                await self.optimize(X_train, y_train[target], X_eval, y_eval[target], mode = mode, data = data, **tuning)
+            await self.fit(X_train, y_train[target], X_eval, y_eval[target], mode = mode, data = data)
+        return self.model_max, self.model_min
+
+    async def retrain(self, X_new, y_new, X_eval, y_eval, mode: str = 'max', rounds: int = 200, tolerance: float = 0.1,
+                      X_full = None, y_full = None, data = None, **tuning):
+        run = self.latest_run(mode)
+        base = await self.get_latest_model(mode)
+        if base is None:
+            print(f"No '{mode}' model logged yet, running a full retrain")
+            return await self.full_retrain(X_full, y_full, X_eval, y_eval, mode, X_new, y_new, **tuning)
+        if not isinstance(base, xgb.Booster):
+            base = base.get_booster()
+
+        dtrain, deval = data or self.dataset(X_new, X_eval)
+        dtrain.set_label(y_new)
+        deval.set_label(y_eval)
+        params, _ = booster_params(self.params[mode] or run_params(run))
+        anterior = float(base.eval(deval).split(':')[-1])
+        referencia = run.get('metrics.eval_rmse')
+        referencia = anterior if referencia is None or referencia != referencia else float(referencia)
+
+        booster = xgb.train(
+            params, dtrain, num_boost_round = rounds,
+            evals = [(deval, 'eval')],
+            early_stopping_rounds = 20,
+            xgb_model = base,
+            verbose_eval = False
+        )
+        booster = booster[:booster.best_iteration + 1]
+        rmse = float(booster.eval(deval).split(':')[-1])
+        if rmse > referencia * (1 + tolerance):
+            print(f"Incremental '{mode}' model regressed ({rmse:.4f} > {referencia:.4f}), running a full retrain")
+            return await self.full_retrain(X_full, y_full, X_eval, y_eval, mode, X_new, y_new, **tuning)
+
+        with mlflow.start_run() as novo:
+            mlflow.set_tag('model_type', mode)
+            mlflow.set_tag('incremental', 'true')
+            mlflow.set_tag('parent_run_id', run.run_id)
+            mlflow.log_params({**params, 'rounds': rounds, 'base_rounds': base.num_boosted_rounds()})
+            mlflow.log_metric('eval_rmse', rmse)
+            mlflow.log_metric('eval_rmse_base', anterior)
+            mlflow.xgboost.log_model(
+                xgb_model=booster,
+                artifact_path=f'model_{mode}'
+            )
+            print(f"Incrementally retrained '{mode}' model ({anterior:.4f} -> {rmse:.4f}) to run_id: {novo.info.run_id}")
+        self.set_model(mode, booster)
+        self.run_ids[mode] = novo.info.run_id
+        return booster
+
+    async def full_retrain(self, X_full, y_full, X_eval, y_eval, mode: str = 'max', X_new = None, y_new = None, **tuning):
+        X_full = X_new if X_full is None else X_full
+        y_full = y_new if y_full is None else y_full
+        data = self.dataset(X_full, X_eval)
+        if tuning.pop('tune', False):
+            await self.optimize(X_full, y_full, X_eval, y_eval, mode = mode, data = data, **tuning)
+        return await self.fit(X_full, y_full, X_eval, y_eval, mode = mode, data = data)
+
+    async def retrain_targets(self, X_new, y_new, X_eval, y_eval, X_full = None, y_full = None, **kwargs):
+        data = self.dataset(X_new, X_eval)
+        for mode in MODOS:
+            target = TARGETS[mode]
+            await self.retrain(
+                X_new, y_new[target], X_eval, y_eval[target], mode = mode, data = data,
+                X_full = X_full, y_full = None if y_full is None else y_full[target], **kwargs
+            )
+        return self.model_max, self.model_min
 
     async def predict(self, X_eval, mode:str = 'max'):
         if self.mode != 'pred':
             raise Exception('Mode selected to training')
         model = self.model_max if mode == 'max' else self.model_min
+        if isinstance(model, xgb.Booster):
+            return model.inplace_predict(X_eval)
         return model.predict(X_eval)
 
     async def save_model(self, mode = 'max'):
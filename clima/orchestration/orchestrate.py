@@ -1,33 +1,49 @@
-from flows import metar_flow, drifting_flow
+from flows import metar_flow, check_drift_flow, retrain_flow
+from prefect.events import DeploymentEventTrigger
+from prefect.schedules import Cron
 from api_clima import CPTECApiCaller
 import asyncio
 
 async def create_deployments():
     work_pool_name = 'clima-ops'
 
-    metar_result = await metar_flow.afrom_source(
+    metar_source = await metar_flow.afrom_source(
         source = '.',
         entrypoint = 'clima/orchestration/flows.py:metar_flow'
-    ).deploy(
+    )
+    metar_result = await metar_source.adeploy(
         name = 'metar-flow',
         work_pool_name = work_pool_name,
-        schedule = {
-            'cron':'0 * * * *',
-            'timezone':'UTC'
-        }
+        schedule = Cron('0 * * * *', timezone = 'UTC')
     )
 
-    drifting_flow = await  drifting_flow.afrom_source(
-        source = './',
-        entrypoint = 'clima/orchestration/flows.py:drifting_flow'
-    ).to_deployment(
+    drift_source = await check_drift_flow.afrom_source(
+        source = '.',
+        entrypoint = 'clima/orchestration/flows.py:check_drift_flow'
+    )
+    drift_result = await drift_source.adeploy(
         name = 'drifting-flow',
         work_pool_name = work_pool_name,
-        schedule = {
-            'cron':'10 * * * *',
-            'timezone':'UTC'
-        }
+        schedule = Cron('10 * * * *', timezone = 'UTC')
+    )
+
+    retrain_source = await retrain_flow.afrom_source(
+        source = '.',
+        entrypoint = 'clima/orchestration/flows.py:retrain_flow'
+    )
+    retrain_result = await retrain_source.adeploy(
+        name = 'retrain-flow',
+        work_pool_name = work_pool_name,
+        triggers = [
+            DeploymentEventTrigger(
+                expect = {'clima.drift.detected'},
+                match = {'prefect.resource.id': 'clima.estacao.*'},
+                threshold = 1,
+                within = 3600
+            )
+        ]
     )
+    return metar_result, drift_result, retrain_result
 
 if __name__ == '__main__':
-    asyncio.run(create_deployments())
\ No newline at end of file
+    asyncio.run(create_deployments())
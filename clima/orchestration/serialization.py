@@ -0,0 +1,23 @@
+import json
+import os
+import pandas as pd
+import pyarrow as pa
+from typing import Any
+
+def save_json(path: str, data: Any, **kwargs):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok = True)
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    with open(temp_path, 'w', encoding = 'utf-8') as file:
+        json.dump(data, file, **kwargs)
+    os.replace(temp_path, path)
+
+def write_arrow(data: pd.DataFrame) -> bytes:
+    table = pa.Table.from_pandas(data, preserve_index = False)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+def read_arrow(content: bytes) -> pd.DataFrame:
+    table = pa.ipc.open_stream(pa.py_buffer(content)).read_all()
+    return table.to_pandas(split_blocks = True, self_destruct = True)
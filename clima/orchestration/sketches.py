@@ -0,0 +1,155 @@
+import math
+import numpy as np
+import pandas as pd
+from typing import List, Dict, Any, Optional
+
+BINS = {
+    'pressao': (950.0, 1050.0, 100),
+    'temperatura': (-10.0, 50.0, 120),
+    'tempo': (-1.5, 63.5, 65),
+    'umidade': (0.0, 1.0, 50),
+    'vento_dir_seno': (-1.0, 1.0, 40),
+    'vento_dir_cosseno': (-1.0, 1.0, 40),
+    'vento_int': (0.0, 60.0, 60),
+    'visibilidade': (0.0, 10.0, 50),
+}
+CATEGORICAS = ['tempo']
+
+class FeatureSketch:
+    def __init__(self, inicio: float, fim: float, n: int):
+        self.inicio = float(inicio)
+        self.fim = float(fim)
+        self.n = int(n)
+        self.bins = np.zeros(self.n + 2, dtype = np.int64)
+        self.contagem = 0
+        self.nulos = 0
+        self.soma = 0.0
+        self.somasq = 0.0
+        self.minimo = math.inf
+        self.maximo = -math.inf
+
+    @classmethod
+    def for_feature(cls, variavel: str) -> 'FeatureSketch':
+        return cls(*BINS[variavel])
+
+    def edges(self) -> np.ndarray:
+        return np.linspace(self.inicio, self.fim, self.n + 1)
+
+    def bin_index(self, valores: np.ndarray) -> np.ndarray:
+        largura = (self.fim - self.inicio) / self.n
+        indices = np.floor((valores - self.inicio) / largura).astype(np.int64) + 1
+        return np.clip(indices, 0, self.n + 1)
+
+    def histogram(self, valores: Any) -> np.ndarray:
+        valores = np.asarray(valores, dtype = np.float64)
+        valores = valores[~np.isnan(valores)]
+        return np.bincount(self.bin_index(valores), minlength = self.n + 2)
+
+    def update(self, valores: Any) -> 'FeatureSketch':
+        valores = np.asarray(valores, dtype = np.float64)
+        validos = valores[~np.isnan(valores)]
+        self.nulos += len(valores) - len(validos)
+        if len(validos) == 0:
+            return self
+        self.bins += np.bincount(self.bin_index(validos), minlength = self.n + 2)
+        self.contagem += len(validos)
+        self.soma += float(validos.sum())
+        self.somasq += float(np.square(validos).sum())
+        self.minimo = min(self.minimo, float(validos.min()))
+        self.maximo = max(self.maximo, float(validos.max()))
+        return self
+
+    def compatible(self, other: 'FeatureSketch') -> bool:
+        return (self.inicio, self.fim, self.n) == (other.inicio, other.fim, other.n)
+
+    def merge(self, other: 'FeatureSketch') -> 'FeatureSketch':
+        if not self.compatible(other):
+            raise ValueError('Sketches with different bins cannot be merged')
+        self.bins += other.bins
+        self.contagem += other.contagem
+        self.nulos += other.nulos
+        self.soma += other.soma
+        self.somasq += other.somasq
+        self.minimo = min(self.minimo, other.minimo)
+        self.maximo = max(self.maximo, other.maximo)
+        return self
+
+    def subtract(self, valores: Any) -> 'FeatureSketch':
+        valores = np.asarray(valores, dtype = np.float64)
+        validos = valores[~np.isnan(valores)]
+        sketch = FeatureSketch(self.inicio, self.fim, self.n)
+        sketch.bins = np.maximum(self.bins - np.bincount(self.bin_index(validos), minlength = self.n + 2), 0)
+        sketch.contagem = max(self.contagem - len(validos), 0)
+        sketch.nulos = max(self.nulos - (len(valores) - len(validos)), 0)
+        sketch.soma = self.soma - float(validos.sum())
+        sketch.somasq = self.somasq - float(np.square(validos).sum())
+        sketch.minimo, sketch.maximo = self.minimo, self.maximo
+        return sketch
+
+    def media(self) -> float:
+        return self.soma / self.contagem if self.contagem else math.nan
+
+    def std(self) -> float:
+        if self.contagem < 2:
+            return math.nan
+        return math.sqrt(max((self.somasq - self.soma * self.soma / self.contagem) / (self.contagem - 1), 0.0))
+
+    def knots(self):
+        edges = np.concatenate([[min(self.minimo, self.inicio)], self.edges(), [max(self.maximo, self.fim)]])
+        acumulado = np.concatenate([[0], np.cumsum(self.bins)]) / self.contagem
+        return edges, acumulado
+
+    def cdf(self, valores: Any) -> np.ndarray:
+        valores = np.asarray(valores, dtype = np.float64)
+        if not self.contagem:
+            return np.full(valores.shape, np.nan)
+        edges, acumulado = self.knots()
+        return np.interp(valores, edges, acumulado, left = 0.0, right = 1.0)
+
+    def quantile(self, q: Any) -> np.ndarray:
+        q = np.asarray(q, dtype = np.float64)
+        if not self.contagem:
+            return np.full(q.shape, np.nan)
+        edges, acumulado = self.knots()
+        return np.interp(q, acumulado, edges)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'inicio': self.inicio,
+            'fim': self.fim,
+            'contagem': int(self.contagem),
+            'nulos': int(self.nulos),
+            'soma': self.soma,
+            'somasq': self.somasq,
+            'minimo': None if math.isinf(self.minimo) else self.minimo,
+            'maximo': None if math.isinf(self.maximo) else self.maximo,
+            'bins': self.bins.tolist(),
+        }
+
+    @classmethod
+    def from_dict(cls, state: Dict[str, Any]) -> 'FeatureSketch':
+        bins = np.asarray(state['bins'], dtype = np.int64)
+        sketch = cls(state['inicio'], state['fim'], len(bins) - 2)
+        sketch.bins = bins
+        sketch.contagem = int(state['contagem'])
+        sketch.nulos = int(state.get('nulos') or 0)
+        sketch.soma = float(state.get('soma') or 0.0)
+        sketch.somasq = float(state.get('somasq') or 0.0)
+        sketch.minimo = math.inf if state.get('minimo') is None or pd.isna(state.get('minimo')) else float(state['minimo'])
+        sketch.maximo = -math.inf if state.get('maximo') is None or pd.isna(state.get('maximo')) else float(state['maximo'])
+        return sketch
+
+def build_sketches(data: pd.DataFrame, variaveis: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    variaveis = [variavel for variavel in (variaveis or list(BINS)) if variavel in data.columns]
+    linhas = []
+    for estacao, grupo in data.groupby('estacao', sort = False, observed = True):
+        for variavel in variaveis:
+            sketch = FeatureSketch.for_feature(variavel).update(grupo[variavel].to_numpy(dtype = np.float64, na_value = np.nan))
+            linhas.append({'estacao': estacao, 'variavel': variavel, **sketch.to_dict()})
+    return linhas
+
+def load_sketches(reference: pd.DataFrame) -> Dict[str, Dict[str, FeatureSketch]]:
+    sketches = {}
+    for linha in reference.to_dict(orient = 'records'):
+        sketches.setdefault(str(linha['estacao']), {})[linha['variavel']] = FeatureSketch.from_dict(linha)
+    return sketches
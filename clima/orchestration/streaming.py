@@ -0,0 +1,227 @@
+import json
+import logging
+import math
+import numpy as np
+import pandas as pd
+from typing import List, Dict, Any, Optional
+from sketches import BINS, CATEGORICAS
+from serialization import save_json
+
+VARIAVEIS = [variavel for variavel in BINS if variavel not in CATEGORICAS]
+STATE_PATH = './clima/cache/drift_state.json'
+
+class Welford:
+    def __init__(self):
+        self.n = 0
+        self.media = 0.0
+        self.m2 = 0.0
+
+    def update(self, valor: float):
+        self.n += 1
+        delta = valor - self.media
+        self.media += delta / self.n
+        self.m2 += delta * (valor - self.media)
+
+    def var(self) -> float:
+        return self.m2 / (self.n - 1) if self.n > 1 else 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'n': self.n, 'media': self.media, 'm2': self.m2}
+
+    @classmethod
+    def from_dict(cls, state: Dict[str, Any]) -> 'Welford':
+        welford = cls()
+        welford.n, welford.media, welford.m2 = state['n'], state['media'], state['m2']
+        return welford
+
+class PageHinkley:
+    nome = 'page_hinkley'
+
+    def __init__(self, delta: float = 0.5, threshold: float = 25.0, min_instances: int = 48):
+        self.delta = delta
+        self.threshold = threshold
+        self.min_instances = min_instances
+        self.reset()
+
+    def reset(self):
+        self.escala = Welford()
+        self.n = 0
+        self.media = 0.0
+        self.soma_alta = 0.0
+        self.soma_baixa = 0.0
+
+    def update(self, valor: float) -> bool:
+        if self.escala.n < self.min_instances:
+            self.escala.update(valor)
+            return False
+        desvio = math.sqrt(self.escala.var()) or 1.0
+        z = (valor - self.escala.media) / desvio
+
+        self.n += 1
+        self.media += (z - self.media) / self.n
+        self.soma_alta = max(0.0, self.soma_alta + z - self.media - self.delta)
+        self.soma_baixa = max(0.0, self.soma_baixa - z + self.media - self.delta)
+        if self.n >= self.min_instances and max(self.soma_alta, self.soma_baixa) > self.threshold:
+            self.reset()
+            return True
+        return False
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'delta': self.delta, 'threshold': self.threshold, 'min_instances': self.min_instances,
+            'escala': self.escala.to_dict(), 'n': self.n, 'media': self.media,
+            'soma_alta': self.soma_alta, 'soma_baixa': self.soma_baixa,
+        }
+
+    @classmethod
+    def from_dict(cls, state: Dict[str, Any]) -> 'PageHinkley':
+        detector = cls(state['delta'], state['threshold'], state['min_instances'])
+        detector.escala = Welford.from_dict(state['escala'])
+        detector.n, detector.media = state['n'], state['media']
+        detector.soma_alta, detector.soma_baixa = state['soma_alta'], state['soma_baixa']
+        return detector
+
+class WindowDrift:
+    nome = 'janela'
+
+    def __init__(self, size: int = 24, confidence: float = 0.002, min_instances: int = 48):
+        self.size = size
+        self.confidence = confidence
+        self.min_instances = min_instances
+        self.reset()
+
+    def reset(self, buffer: Optional[List[float]] = None):
+        self.referencia = Welford()
+        self.buffer = [math.nan] * self.size
+        self.position = 0
+        self.seen = 0
+        self.soma = 0.0
+        for valor in buffer or []:
+            self.referencia.update(valor)
+
+    def bound(self) -> float:
+        n_referencia, n_recente = self.referencia.n, self.size
+        m = 1.0 / (1.0 / n_referencia + 1.0 / n_recente)
+        log = math.log(2.0 * math.log(n_referencia + n_recente) / self.confidence)
+        return math.sqrt(2.0 / m * self.referencia.var() * log) + 2.0 / (3.0 * m) * log
+
+    def update(self, valor: float) -> bool:
+        antigo = self.buffer[self.position]
+        if self.seen >= self.size:
+            self.soma -= antigo
+            self.referencia.update(antigo)
+        self.buffer[self.position] = valor
+        self.position = (self.position + 1) % self.size
+        self.seen += 1
+        self.soma += valor
+
+        if self.seen < self.size or self.referencia.n < self.min_instances:
+            return False
+        if abs(self.soma / self.size - self.referencia.media) > self.bound():
+            recentes = self.buffer[self.position:] + self.buffer[:self.position]
+            self.reset(recentes)
+            return True
+        return False
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'size': self.size, 'confidence': self.confidence, 'min_instances': self.min_instances,
+            'referencia': self.referencia.to_dict(), 'position': self.position, 'seen': self.seen,
+            'buffer': [None if math.isnan(valor) else valor for valor in self.buffer],
+        }
+
+    @classmethod
+    def from_dict(cls, state: Dict[str, Any]) -> 'WindowDrift':
+        detector = cls(state['size'], state['confidence'], state['min_instances'])
+        detector.referencia = Welford.from_dict(state['referencia'])
+        detector.buffer = [math.nan if valor is None else valor for valor in state['buffer']]
+        detector.position, detector.seen = state['position'], state['seen']
+        detector.soma = math.fsum(valor for valor in detector.buffer if not math.isnan(valor))
+        return detector
+
+DETECTORES = {PageHinkley.nome: PageHinkley, WindowDrift.nome: WindowDrift}
+
+class StreamingDriftMonitor:
+    def __init__(self, variaveis: List[str] = VARIAVEIS, state_path: str = STATE_PATH):
+        self.variaveis = variaveis
+        self.state_path = state_path
+        self.logger = logging.getLogger(__name__)
+        self.estacoes = {}
+        self.ultima = {}
+
+    def get_detectors(self, estacao: str) -> Dict[str, List[Any]]:
+        detectores = self.estacoes.get(estacao)
+        if detectores is None:
+            detectores = {variavel: [PageHinkley(), WindowDrift()] for variavel in self.variaveis}
+            self.estacoes[estacao] = detectores
+        return detectores
+
+    def update(self, estacao: str, observacao: Dict[str, Any], timestamp: Optional[pd.Timestamp] = None) -> List[Dict[str, Any]]:
+        if timestamp is not None:
+            ultima = self.ultima.get(estacao)
+            if ultima is not None and pd.Timestamp(timestamp) <= pd.Timestamp(ultima):
+                return []
+            self.ultima[estacao] = pd.Timestamp(timestamp).isoformat()
+
+        eventos = []
+        for variavel, detectores in self.get_detectors(estacao).items():
+            valor = observacao.get(variavel)
+            if valor is None or math.isnan(valor):
+                continue
+            for detector in detectores:
+                if detector.update(float(valor)):
+                    eventos.append({
+                        'estacao': estacao,
+                        'variavel': variavel,
+                        'detector': detector.nome,
+                        'observed_at': None if timestamp is None else pd.Timestamp(timestamp).isoformat(),
+                        'valor': float(valor),
+                    })
+        return eventos
+
+    def update_frame(self, df: pd.DataFrame) -> List[Dict[str, Any]]:
+        data = df.sort_index(kind = 'stable')
+        timestamps = data.index if isinstance(data.index, pd.DatetimeIndex) else [None] * len(data)
+        colunas = [variavel for variavel in self.variaveis if variavel in data.columns]
+        eventos = []
+        for timestamp, estacao, valores in zip(timestamps, data['estacao'], data[colunas].to_numpy(dtype = np.float64)):
+            eventos.extend(self.update(estacao, dict(zip(colunas, valores)), timestamp))
+        return eventos
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'variaveis': self.variaveis,
+            'ultima': self.ultima,
+            'estacoes': {
+                estacao: {variavel: [{'tipo': detector.nome, **detector.to_dict()} for detector in detectores]
+                          for variavel, detectores in variaveis.items()}
+                for estacao, variaveis in self.estacoes.items()
+            },
+        }
+
+    @classmethod
+    def from_dict(cls, state: Dict[str, Any], state_path: str = STATE_PATH) -> 'StreamingDriftMonitor':
+        monitor = cls(state['variaveis'], state_path)
+        monitor.ultima = state.get('ultima', {})
+        monitor.estacoes = {
+            estacao: {variavel: [DETECTORES[detector.pop('tipo')].from_dict(detector) for detector in detectores]
+                      for variavel, detectores in variaveis.items()}
+            for estacao, variaveis in state.get('estacoes', {}).items()
+        }
+        return monitor
+
+    @classmethod
+    def load(cls, state_path: str = STATE_PATH) -> 'StreamingDriftMonitor':
+        try:
+            with open(state_path, 'r', encoding = 'utf-8') as file:
+                return cls.from_dict(json.load(file), state_path)
+        except FileNotFoundError:
+            return cls(state_path = state_path)
+
+    def save(self) -> bool:
+        try:
+            save_json(self.state_path, self.to_dict())
+            return True
+        except Exception as e:
+            self.logger.error(f'Error writing the drift state @ {self.state_path}: {e}')
+            return False
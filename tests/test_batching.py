@@ -0,0 +1,81 @@
+import asyncio
+import numpy as np
+import pytest
+from clima.backend.batching import PredictBatcher, ModelsNotReady
+from clima.backend.models import ModelCache, Modelos
+
+class Booster:
+    feature_names = ['f0', 'f1']
+
+    def __init__(self, peso: float):
+        self.peso = peso
+        self.chamadas = []
+
+    def inplace_predict(self, X):
+        self.chamadas.append(len(X))
+        return (X['f0'].to_numpy() * self.peso + X['f1'].fillna(0).to_numpy()).astype(np.float32)
+
+@pytest.fixture
+def models() -> ModelCache:
+    models = ModelCache()
+    models.modelos = Modelos({'max': Booster(10), 'min': Booster(-1)}, {'max': 'run-max', 'min': 'run-min'})
+    return models
+
+def pedidos(tamanhos):
+    inicio = 0
+    for tamanho in tamanhos:
+        yield [{'f1': 0.5, 'f0': float(valor)} for valor in range(inicio, inicio + tamanho)]
+        inicio += tamanho
+
+def test_batch_results_go_back_to_each_request(models):
+    async def run():
+        batcher = await PredictBatcher(models, max_batch_size = 256, max_wait = 0.05).start()
+        try:
+            items = list(pedidos([1, 3, 2, 5]))
+            return items, await asyncio.gather(*[batcher.predict(pedido) for pedido in items]), batcher.stats()
+        finally:
+            await batcher.stop()
+    items, respostas, stats = asyncio.run(run())
+
+    for pedido, resposta in zip(items, respostas):
+        f0 = np.array([linha['f0'] for linha in pedido])
+        assert np.allclose(resposta['max'], f0 * 10 + 0.5)
+        assert np.allclose(resposta['min'], -f0 + 0.5)
+        assert resposta['run_ids'] == {'max': 'run-max', 'min': 'run-min'}
+    assert (stats['batches'], stats['requests'], stats['rows']) == (1, 4, 11)
+    assert models.modelos.boosters['max'].chamadas == [11]
+
+def test_max_batch_size_splits_batches(models):
+    async def run():
+        batcher = await PredictBatcher(models, max_batch_size = 4, max_wait = 0.05).start()
+        try:
+            items = list(pedidos([2] * 6))
+            respostas = await asyncio.gather(*[batcher.predict(pedido) for pedido in items])
+            return items, respostas
+        finally:
+            await batcher.stop()
+    items, respostas = asyncio.run(run())
+
+    assert [len(resposta['max']) for resposta in respostas] == [2] * 6
+    assert models.modelos.boosters['max'].chamadas == [4, 4, 4]
+    assert np.allclose(np.concatenate([resposta['max'] for resposta in respostas]), np.arange(12) * 10 + 0.5)
+
+def test_missing_features_are_nan_in_model_order(models):
+    async def run():
+        batcher = await PredictBatcher(models, max_wait = 0.01).start()
+        try:
+            return await batcher.predict([{'f0': 1.0, 'extra': 7.0}, {'f1': 2.0, 'f0': 3.0}])
+        finally:
+            await batcher.stop()
+    resposta = asyncio.run(run())
+    assert np.allclose(resposta['max'], [10.0, 32.0])
+
+def test_models_not_ready_fails_every_request():
+    async def run():
+        batcher = await PredictBatcher(ModelCache(), max_wait = 0.05).start()
+        try:
+            return await asyncio.gather(*[batcher.predict(pedido) for pedido in pedidos([1, 2])], return_exceptions = True)
+        finally:
+            await batcher.stop()
+    respostas = asyncio.run(run())
+    assert all(isinstance(resposta, ModelsNotReady) for resposta in respostas)
@@ -0,0 +1,92 @@
+import asyncio
+import pytest
+from clima.backend import cache as cache_module
+from clima.backend.cache import MemoryBackend, ResponseCache, etag_matches
+
+QUERY = {'restriction': {'estacao': 'SBRF'}, 'order_by': None, 'limit': 10}
+
+class Relogio:
+    def __init__(self):
+        self.agora = 1000.0
+
+    def __call__(self) -> float:
+        return self.agora
+
+@pytest.fixture
+def relogio(monkeypatch):
+    relogio = Relogio()
+    monkeypatch.setattr(cache_module.time, 'monotonic', relogio)
+    return relogio
+
+def test_invalidate_bumps_version_and_drops_entries():
+    async def run():
+        cache = ResponseCache(MemoryBackend(), ttl = 60)
+        chave = await cache.key('metar', QUERY, 'application/json')
+        _, etag, _ = await cache.set(chave, 'application/json', b'[]')
+        assert await cache.get(chave) == ('application/json', etag, b'[]')
+        outra = await cache.key('pred_cidade', QUERY, 'application/json')
+        await cache.set(outra, 'application/json', b'{}')
+
+        await cache.invalidate('metar')
+        nova = await cache.key('metar', QUERY, 'application/json')
+        assert nova != chave
+        assert await cache.get(chave) is None
+        assert await cache.get(nova) is None
+        assert await cache.key('pred_cidade', QUERY, 'application/json') == outra
+        assert await cache.get(outra) is not None
+    asyncio.run(run())
+
+def test_key_depends_on_media_and_normalized_query():
+    async def run():
+        cache = ResponseCache(MemoryBackend())
+        chave = await cache.key('metar', {'limit': 10, 'restriction': {'estacao': 'SBRF'}, 'order_by': None}, 'application/json')
+        assert chave == await cache.key('metar', QUERY, 'application/json')
+        assert chave != await cache.key('metar', QUERY, 'application/vnd.apache.arrow.stream')
+    asyncio.run(run())
+
+def test_memory_backend_evicts_least_recently_used():
+    async def run():
+        backend = MemoryBackend(maxsize = 2)
+        await backend.set('a', b'1', 60)
+        await backend.set('b', b'2', 60)
+        assert await backend.get('a') == b'1'
+        await backend.set('c', b'3', 60)
+        assert await backend.get('b') is None
+        assert await backend.get('a') == b'1'
+        assert await backend.get('c') == b'3'
+    asyncio.run(run())
+
+def test_memory_backend_expires_after_ttl(relogio):
+    async def run():
+        backend = MemoryBackend()
+        await backend.set('a', b'1', 30)
+        relogio.agora += 29
+        assert await backend.get('a') == b'1'
+        relogio.agora += 2
+        assert await backend.get('a') is None
+        assert 'a' not in backend.entries
+    asyncio.run(run())
+
+def test_stats_count_hits_and_misses():
+    async def run():
+        cache = ResponseCache(MemoryBackend())
+        chave = await cache.key('metar', QUERY, 'application/json')
+        assert await cache.get(chave) is None
+        await cache.set(chave, 'application/json', b'[]')
+        await cache.get(chave)
+        return cache.stats()
+    stats = asyncio.run(run())
+    assert (stats['hits'], stats['misses'], stats['errors']) == (1, 1, 0)
+
+@pytest.mark.parametrize('if_none_match, esperado', [
+    (None, False),
+    ('', False),
+    ('"abc"', True),
+    ('W/"abc"', True),
+    ('"xyz", "abc"', True),
+    ('*', True),
+    ('"xyz"', False),
+    ('abc', False),
+])
+def test_etag_matches(if_none_match, esperado):
+    assert etag_matches(if_none_match, '"abc"') is esperado
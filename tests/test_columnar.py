@@ -0,0 +1,71 @@
+import pandas as pd
+import pytest
+from clima.backend.columnar import validate, ColumnarError, METAR, PREVISAO
+
+@pytest.fixture
+def payload():
+    return {
+        'estacao': ['SBRF', 'SBGR', 'SBBR'],
+        'observed_at': ['2025-01-01T00:00:00Z', '2025-01-01T01:00:00Z', '2025-01-01T02:00:00Z'],
+        'mes': [1, 1, None],
+        'temperatura': [25.5, 18.0, None],
+        'umidade': [0.8, 0.5, 0.6],
+    }
+
+def test_validate_builds_typed_frame(payload):
+    df = validate(payload, METAR)
+    assert list(df.columns) == ['estacao', 'observed_at', 'mes', 'temperatura', 'umidade']
+    assert str(df['observed_at'].dt.tz) == 'UTC'
+    assert str(df['mes'].dtype) == 'Int64'
+    assert df['mes'].isna().tolist() == [False, False, True]
+    assert df['temperatura'].dtype == 'float64'
+
+def test_validate_rejects_scalar_columns(payload):
+    payload['temperatura'] = 25.5
+    with pytest.raises(ColumnarError, match = 'not lists'):
+        validate(payload, METAR)
+    payload['temperatura'] = {'a': 1}
+    with pytest.raises(ColumnarError, match = 'not lists'):
+        validate(payload, METAR)
+
+def test_validate_rejects_string_as_column(payload):
+    payload['estacao'] = 'SBRF'
+    with pytest.raises(ColumnarError, match = 'not lists'):
+        validate(payload, METAR)
+
+@pytest.mark.parametrize('coluna, valores, mensagem', [
+    ('umidade', [0.8, 1.5, 0.6], r'umidade=1.5 out of \[0, 1\] at row 1'),
+    ('temperatura', [-100.0, 18.0, None], r'temperatura=-100.0 out of \[-90, 60\] at row 0'),
+    ('mes', [1, 13, None], r'mes=13.0 out of \[1, 12\] at row 1'),
+])
+def test_validate_rejects_out_of_range(payload, coluna, valores, mensagem):
+    payload[coluna] = valores
+    with pytest.raises(ColumnarError, match = mensagem):
+        validate(payload, METAR)
+
+def test_validate_rejects_bad_values(payload):
+    with pytest.raises(ColumnarError, match = 'non integer'):
+        validate(dict(payload, mes = [1, 1.5, None]), METAR)
+    with pytest.raises(ColumnarError, match = 'temperatura'):
+        validate(dict(payload, temperatura = [25.5, 'quente', None]), METAR)
+    with pytest.raises(ColumnarError, match = 'non string value at row 2'):
+        validate(dict(payload, estacao = ['SBRF', 'SBGR', 7]), METAR)
+    with pytest.raises(ColumnarError, match = 'longer than 4 at row 0'):
+        validate(dict(payload, estacao = ['SBRFX', 'SBGR', 'SBBR']), METAR)
+
+def test_validate_rejects_nulls_and_missing_required(payload):
+    with pytest.raises(ColumnarError, match = 'estacao has a null at row 1'):
+        validate(dict(payload, estacao = ['SBRF', None, 'SBBR']), METAR)
+    del payload['observed_at']
+    with pytest.raises(ColumnarError, match = 'Missing required columns'):
+        validate(payload, METAR)
+
+def test_validate_rejects_ragged_and_unknown(payload):
+    with pytest.raises(ColumnarError, match = 'different lengths'):
+        validate(dict(payload, umidade = [0.8]), METAR)
+    with pytest.raises(ColumnarError, match = 'No known columns'):
+        validate({'x': [1]}, {'umidade': METAR['umidade']})
+
+def test_validate_previsao_dates():
+    df = validate({'cidade': ['Recife'], 'data': ['2025-01-02'], 'indice_uv': [11]}, PREVISAO)
+    assert df['data'].tolist() == [pd.Timestamp('2025-01-02').date()]
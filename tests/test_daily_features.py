@@ -0,0 +1,49 @@
+import numpy as np
+import pandas as pd
+import pytest
+from daily_features import COLUNAS, DailyFeatureEngine, compute_daily_features, feature_names
+
+ESTACOES = ['SBRF', 'SBGR', 'SBBR']
+
+@pytest.fixture
+def metar() -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    frames = []
+    for estacao in ESTACOES:
+        index = pd.date_range('2025-01-01', periods = 24 * 6, freq = 'h', tz = 'UTC')
+        index = index[rng.random(len(index)) > 0.05]
+        df = pd.DataFrame({'estacao': estacao}, index = index)
+        for coluna in COLUNAS:
+            valores = rng.normal(20, 5, len(index))
+            valores[rng.random(len(index)) < 0.05] = np.nan
+            df[coluna] = valores
+        frames.append(df)
+    return pd.concat(frames).sort_index(kind = 'stable')
+
+def assert_matches(got: pd.DataFrame, expected: pd.DataFrame):
+    assert len(got) == len(expected)
+    assert (got['estacao'].to_numpy() == expected['estacao'].to_numpy()).all()
+    assert (got.index == expected.index).all()
+    nomes = feature_names()
+    assert np.allclose(got[nomes].to_numpy(dtype = np.float64), expected[nomes].to_numpy(dtype = np.float64), equal_nan = True)
+
+def test_update_frame_matches_batch(metar, tmp_path):
+    engine = DailyFeatureEngine(state_path = str(tmp_path / 'daily_state.json'))
+    assert_matches(engine.update_frame(metar), compute_daily_features(metar.copy()))
+
+def test_update_frame_resumes_after_save(metar, tmp_path):
+    state_path = str(tmp_path / 'daily_state.json')
+    corte = metar.index[len(metar) // 2]
+    primeira, segunda = metar[metar.index < corte], metar[metar.index >= corte]
+
+    engine = DailyFeatureEngine(state_path = state_path)
+    inicio = engine.update_frame(primeira)
+    assert engine.save()
+    fim = DailyFeatureEngine.load(state_path).update_frame(segunda)
+
+    assert_matches(pd.concat([inicio, fim]), compute_daily_features(metar.copy()))
+
+def test_update_frame_skips_replayed_rows(metar, tmp_path):
+    engine = DailyFeatureEngine(state_path = str(tmp_path / 'daily_state.json'))
+    engine.update_frame(metar)
+    assert engine.update_frame(metar.tail(10)).empty
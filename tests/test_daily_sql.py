@@ -0,0 +1,78 @@
+import os
+import uuid
+import numpy as np
+import pandas as pd
+import pytest
+from psycopg2.extensions import parse_dsn
+from daily_features import compute_daily_features, add_targets
+
+COLUNAS = ['pressao', 'temperatura', 'umidade', 'vento_dir_seno', 'vento_dir_cosseno', 'vento_int', 'visibilidade']
+
+@pytest.fixture
+def postgres(tmp_path_factory):
+    dsn = os.environ.get('CLIMA_TEST_DSN')
+    if dsn:
+        yield parse_dsn(dsn)
+        return
+    pgserver = pytest.importorskip('pgserver', reason = 'set CLIMA_TEST_DSN or install pgserver to run the SQL tests')
+    try:
+        server = pgserver.get_server(tmp_path_factory.mktemp('pgdata'), cleanup_mode = 'delete')
+    except Exception as e:
+        pytest.skip(f'Postgres not available: {e}')
+    yield parse_dsn(server.get_uri())
+
+@pytest.fixture
+def handler(postgres, tmp_path, monkeypatch):
+    from clima.backend.client.db_handler import DBHandler
+    monkeypatch.chdir(tmp_path)
+    schema = f'clima_test_{uuid.uuid4().hex[:8]}'
+    handler = DBHandler(postgres, dbname = postgres.get('dbname', 'postgres'), schema = schema, pool_config = {'minconn': 1, 'maxconn': 2})
+    yield handler
+    with handler.get_cursor() as cursor:
+        cursor.execute(f'DROP SCHEMA {schema} CASCADE')
+    handler.pool.close()
+
+@pytest.fixture
+def metar() -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    frames = []
+    for estacao in ['SBRF', 'SBGR', 'SBBR']:
+        observed_at = pd.date_range('2025-01-28', periods = 24 * 12, freq = 'h', tz = 'UTC')
+        observed_at = observed_at[rng.random(len(observed_at)) > 0.05]
+        df = pd.DataFrame({'estacao': estacao, 'observed_at': observed_at})
+        for coluna in COLUNAS:
+            valores = rng.normal(20, 5, len(observed_at))
+            valores[rng.random(len(observed_at)) < 0.03] = np.nan
+            df[coluna] = valores
+        frames.append(df)
+    df = pd.concat(frames, ignore_index = True).sort_values('observed_at', kind = 'stable')
+    df['dia'] = df['observed_at'].dt.day
+    df['mes'] = df['observed_at'].dt.month
+    df['ano'] = df['observed_at'].dt.year
+    df['tempo'] = 1
+    return df
+
+def expected_daily(metar: pd.DataFrame) -> pd.DataFrame:
+    data = metar.set_index(pd.DatetimeIndex(metar['observed_at']))
+    daily = add_targets(compute_daily_features(data)).at_time('23:00').copy()
+    daily['dia'] = daily.index.date
+    return daily.sort_values(['estacao', 'dia']).reset_index(drop = True)
+
+def assert_matches(got: pd.DataFrame, expected: pd.DataFrame, colunas):
+    got = got.reset_index(drop = True)
+    assert len(got) == len(expected)
+    assert (got['estacao'].astype(str).to_numpy() == expected['estacao'].to_numpy()).all()
+    assert (pd.to_datetime(got['dia']).dt.date.to_numpy() == expected['dia'].to_numpy()).all()
+    assert np.allclose(got[colunas].to_numpy(dtype = np.float64), expected[colunas].to_numpy(dtype = np.float64), equal_nan = True)
+
+def test_daily_etl_matches_pandas(handler, metar):
+    tamanho = len(metar)
+    for parte in range(4):
+        assert handler.upsert_dataframe('metar', metar.iloc[parte * tamanho // 4:(parte + 1) * tamanho // 4], mode = 'values')
+
+    colunas = handler.daily.output_columns()[2:]
+    expected = expected_daily(metar)
+    assert_matches(handler.get_data('daily_etl', order_by = ['estacao', 'dia']), expected, colunas)
+
+    assert handler.rebuild_daily_etl()
+    assert_matches(handler.get_data('daily_etl', order_by = ['estacao', 'dia']), expected, colunas)
@@ -0,0 +1,96 @@
+import numpy as np
+import pandas as pd
+import pytest
+from drift_tool import DriftEngine, benjamini_hochberg, bonferroni
+from sketches import build_sketches
+from streaming import PageHinkley, WindowDrift, StreamingDriftMonitor
+
+ESTACOES = [f'SB{indice:02d}' for indice in range(20)]
+
+def observacoes(rng: np.random.Generator, n: int) -> pd.DataFrame:
+    return pd.DataFrame({
+        'estacao': rng.choice(ESTACOES, n),
+        'temperatura': rng.normal(25, 4, n),
+        'pressao': rng.normal(1010, 5, n),
+        'umidade': rng.uniform(0.2, 1.0, n),
+        'tempo': rng.integers(0, 5, n).astype(np.float64),
+    })
+
+@pytest.fixture
+def reference() -> pd.DataFrame:
+    return pd.DataFrame(build_sketches(observacoes(np.random.default_rng(0), 40000)))
+
+def test_benjamini_hochberg_known_values():
+    ajustados = benjamini_hochberg(np.array([0.01, 0.04, np.nan, 0.03, 0.2]))
+    assert np.allclose(ajustados, [0.04, 0.16 / 3, np.nan, 0.16 / 3, 0.2], equal_nan = True)
+    assert np.isnan(benjamini_hochberg(np.array([np.nan]))).all()
+
+def test_corrections_control_errors_on_uniform_p_values():
+    rng = np.random.default_rng(1)
+    p_values = rng.uniform(size = (2000, 50))
+    familias_bh = np.mean([(benjamini_hochberg(linha) <= 0.05).any() for linha in p_values])
+    familias_bonferroni = np.mean([(bonferroni(linha) <= 0.05).any() for linha in p_values])
+    assert familias_bh < 0.07
+    assert familias_bonferroni < 0.07
+    assert (p_values <= 0.05).any(axis = 1).mean() > 0.9
+
+def test_engine_null_data_rarely_flags_drift(reference):
+    rng = np.random.default_rng(2)
+    engine = DriftEngine(alpha = 0.05)
+    alarmes = 0
+    for _ in range(40):
+        report = engine.run(observacoes(rng, 600), reference, excluir_janela = False)
+        assert len(report.frame) == len(ESTACOES) * 4
+        principal = report.frame['ks_p'].where(report.frame['teste'] == 'ks', report.frame['chi2_p'])
+        assert (report.frame['p_ajustado'] >= principal - 1e-12).all()
+        alarmes += report.drift
+    assert alarmes <= 6
+
+def test_engine_flags_shifted_station(reference):
+    rng = np.random.default_rng(3)
+    janela = observacoes(rng, 600)
+    janela.loc[janela['estacao'] == 'SB05', 'temperatura'] += 6
+    janela.loc[janela['estacao'] == 'SB07', 'tempo'] = 4.0
+    report = DriftEngine(alpha = 0.05).run(janela, reference, excluir_janela = False)
+    drifted = set(zip(report.drifted()['estacao'], report.drifted()['variavel'], report.drifted()['teste']))
+    assert {('SB05', 'temperatura', 'ks'), ('SB07', 'tempo', 'chi2')} <= drifted
+    assert len(drifted) <= 3
+
+def test_engine_skips_mismatched_sketches(reference):
+    reference = reference.copy()
+    linha = reference.index[(reference['estacao'] == 'SB01') & (reference['variavel'] == 'temperatura')][0]
+    reference.at[linha, 'fim'] = reference.at[linha, 'fim'] + 1
+    report = DriftEngine().run(observacoes(np.random.default_rng(4), 600), reference, excluir_janela = False)
+    assert not ((report.frame['estacao'] == 'SB01') & (report.frame['variavel'] == 'temperatura')).any()
+
+@pytest.mark.parametrize('detector', [PageHinkley, WindowDrift])
+def test_streaming_detectors(detector):
+    rng = np.random.default_rng(5)
+    estavel = detector()
+    assert not any(estavel.update(valor) for valor in rng.normal(20, 2, 3000))
+
+    mudanca = detector()
+    for valor in rng.normal(20, 2, 500):
+        mudanca.update(valor)
+    alarmes = [indice for indice, valor in enumerate(rng.normal(26, 2, 200)) if mudanca.update(valor)]
+    assert alarmes and alarmes[0] < 100
+
+@pytest.mark.parametrize('detector', [PageHinkley, WindowDrift])
+def test_streaming_detector_state_roundtrip(detector):
+    rng = np.random.default_rng(6)
+    original = detector()
+    for valor in rng.normal(20, 2, 300):
+        original.update(valor)
+    copia = detector.from_dict(original.to_dict())
+    seguintes = np.concatenate([rng.normal(20, 2, 50), rng.normal(27, 2, 150)])
+    assert [original.update(valor) for valor in seguintes] == [copia.update(valor) for valor in seguintes]
+
+def test_monitor_ignores_replayed_observations(tmp_path):
+    monitor = StreamingDriftMonitor(state_path = str(tmp_path / 'drift_state.json'))
+    index = pd.date_range('2025-01-01', periods = 200, freq = 'h', tz = 'UTC')
+    valores = np.r_[np.random.default_rng(7).normal(20, 1, 150), np.full(50, 30.0)]
+    df = pd.DataFrame({'estacao': 'SBRF', 'temperatura': valores}, index = index)
+    eventos = monitor.update_frame(df)
+    assert eventos and {evento['variavel'] for evento in eventos} == {'temperatura'}
+    assert monitor.save()
+    assert StreamingDriftMonitor.load(monitor.state_path).update_frame(df.tail(20)) == []
@@ -0,0 +1,67 @@
+import pytest
+from pydantic import ValidationError
+from clima.backend.client.query import QueryBuilder, parse_filter
+from clima.backend.schemas import RestrictionMetar, RestrictionDistribuicoes
+
+@pytest.mark.parametrize('chave, esperado', [
+    ('estacao', ('estacao', 'eq')),
+    ('observed_at__gte', ('observed_at', 'gte')),
+    ('ano__lt', ('ano', 'lt')),
+    ('estacao__in', ('estacao', 'in')),
+])
+def test_parse_filter_suffixes(chave, esperado):
+    assert parse_filter(chave) == esperado
+
+def test_parse_filter_rejects_unknown_operator():
+    with pytest.raises(ValueError):
+        parse_filter('ano__between')
+
+def test_select_binds_values_as_params():
+    builder = QueryBuilder('clima_schema')
+    query, params = builder.select(
+        'metar',
+        restriction = {'estacao': "SBRF'; DROP TABLE metar; --", 'ano__gte': 2024, 'mes': None},
+        order_by = ['estacao', '-observed_at'],
+        limit = 10
+    )
+    assert query == (
+        'SELECT * FROM "clima_schema"."metar" WHERE "estacao" = %s AND "ano" >= %s '
+        'ORDER BY "estacao" ASC, "observed_at" DESC LIMIT %s'
+    )
+    assert params == ["SBRF'; DROP TABLE metar; --", 2024, 10]
+
+def test_select_numeric_placeholders_follow_param_order():
+    builder = QueryBuilder('clima_schema', paramstyle = 'numeric')
+    query, params = builder.select('metar', columns = ['estacao'], restriction = {'estacao__in': ('SBRF', 'SBGR'), 'ano__lt': 2025}, limit = 5)
+    assert query == 'SELECT "estacao" FROM "clima_schema"."metar" WHERE "estacao" = ANY($1) AND "ano" < $2 LIMIT $3'
+    assert params == [['SBRF', 'SBGR'], 2025, 5]
+
+def test_where_lists_and_empty_in():
+    builder = QueryBuilder('clima_schema')
+    params = []
+    assert builder.where({'estacao': ['SBRF'], 'variavel__in': []}, params) == ' WHERE "estacao" = ANY(%s) AND FALSE'
+    assert params == [['SBRF']]
+
+def test_identifiers_are_quoted():
+    builder = QueryBuilder('clima_schema')
+    query, params = builder.select('metar', columns = ['a"b'], order_by = ['-x"y'])
+    assert query == 'SELECT "a""b" FROM "clima_schema"."metar" ORDER BY "x""y" DESC'
+    assert params == []
+
+def test_metar_dist_merge_keeps_guard():
+    builder = QueryBuilder('clima_schema')
+    clausula = builder.conflict_clause(['estacao', 'variavel', 'contagem'], ['estacao', 'variavel'], 'metar_dist')
+    assert 'metar_dist.contagem + EXCLUDED.contagem' in clausula
+    assert clausula.endswith('AND cardinality(metar_dist.bins) = cardinality(EXCLUDED.bins)')
+
+def test_restriction_rejects_unknown_order_by():
+    assert RestrictionMetar(order_by = ['-observed_at']).to_query()['order_by'] == ['-observed_at']
+    with pytest.raises(ValidationError):
+        RestrictionMetar(order_by = ['observed_at; DROP TABLE metar'])
+    with pytest.raises(ValidationError):
+        RestrictionDistribuicoes(order_by = ['bins'])
+
+def test_rollup_order_by_uses_aggregated_columns():
+    RestrictionMetar(granularidade = 'dia', order_by = ['-temperatura_media'])
+    with pytest.raises(ValidationError):
+        RestrictionMetar(order_by = ['temperatura_media'])